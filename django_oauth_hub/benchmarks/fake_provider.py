@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""
+A local fake OAuth 2.0 provider for load testing.
+
+Implements just enough of a provider for the hub's flow:
+
+    GET  /authorize  redirects straight back to redirect_uri with a code
+    POST /token      authorization_code and refresh_token grants
+    GET  /userinfo   a profile for the bearer token
+
+Every endpoint can be slowed down (latency plus uniform jitter) and made to
+fail: ``error_rate`` answers 503 and ``throttle_rate`` answers 429 with a
+Retry-After header. /authorize never fails, since in a real flow it's the
+user's browser, not the hub, that talks to it.
+
+Run standalone with: python benchmarks/fake_provider.py --port 8765
+or start it in-process with start_server() (see benchmarks/load_test.py).
+"""
+
+import argparse
+import json
+import random
+import secrets
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+
+@dataclass
+class FakeProviderConfig:
+    latency_ms: float = 50.0
+    jitter_ms: float = 10.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: int = 1
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the hub's pooled sessions reuse connections as they would in production
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == '/authorize':
+            self.authorize(params)
+        elif url.path == '/userinfo':
+            self.provider_call('userinfo', self.userinfo)
+        else:
+            self.send_json(404, {'error': 'not_found'})
+    
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode()
+        params = {key: values[0] for key, values in parse_qs(body).items()}
+        if urlsplit(self.path).path == '/token':
+            self.provider_call('token', lambda: self.token(params))
+        else:
+            self.send_json(404, {'error': 'not_found'})
+    
+    def authorize(self, params):
+        self.server.count('authorize')
+        if 'redirect_uri' not in params:
+            self.send_json(400, {'error': 'invalid_request'})
+            return
+        query = urlencode({'code': secrets.token_urlsafe(16), 'state': params.get('state', '')})
+        self.send_response(302)
+        self.send_header('Location', f"{params['redirect_uri']}?{query}")
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def provider_call(self, endpoint, handler):
+        """Apply the configured latency and failure injection, then run ``handler``."""
+        config = self.server.config
+        time.sleep(max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000)
+        
+        roll = random.random()
+        if roll < config.throttle_rate:
+            self.server.count(f'{endpoint}:429')
+            self.send_json(429, {'error': 'rate_limited'}, {'Retry-After': str(config.retry_after)})
+        elif roll < config.throttle_rate + config.error_rate:
+            self.server.count(f'{endpoint}:503')
+            self.send_json(503, {'error': 'temporarily_unavailable'})
+        else:
+            self.server.count(endpoint)
+            handler()
+    
+    def token(self, params):
+        if params.get('grant_type') not in ('authorization_code', 'refresh_token'):
+            self.send_json(400, {'error': 'unsupported_grant_type'})
+            return
+        self.send_json(200, {
+            'access_token': secrets.token_urlsafe(32),
+            'refresh_token': secrets.token_urlsafe(32),
+            'token_type': 'bearer',
+            'expires_in': 3600,
+            'scope': 'profile email',
+        })
+    
+    def userinfo(self):
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            self.send_json(401, {'error': 'invalid_token'})
+            return
+        user_id = secrets.token_hex(8)
+        self.send_json(200, {
+            'id': user_id,
+            'name': f'Load Test {user_id}',
+            'username': f'loadtest_{user_id}',
+            'email': f'{user_id}@example.com',
+        })
+    
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass  # one line per request would drown the load test's own output
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+    
+    def __init__(self, address, config):
+        super().__init__(address, FakeProviderHandler)
+        self.config = config
+        self.counts = Counter()
+        self.counts_lock = threading.Lock()
+    
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+    
+    def count(self, key):
+        with self.counts_lock:
+            self.counts[key] += 1
+    
+    def stats(self):
+        with self.counts_lock:
+            return {'config': asdict(self.config), 'requests': dict(sorted(self.counts.items()))}
+
+
+def start_server(config, host='127.0.0.1', port=0):
+    """Serve the fake provider from a daemon thread; port 0 picks a free port."""
+    server = FakeProviderServer((host, port), config)
+    threading.Thread(target=server.serve_forever, name='fake-oauth-provider', daemon=True).start()
+    return server
+
+
+def add_config_arguments(parser):
+    defaults = FakeProviderConfig()
+    parser.add_argument('--latency-ms', type=float, default=defaults.latency_ms, help='Mean provider response time.')
+    parser.add_argument('--jitter-ms', type=float, default=defaults.jitter_ms, help='Uniform jitter around the latency.')
+    parser.add_argument('--error-rate', type=float, default=defaults.error_rate, help='Fraction of calls answered 503.')
+    parser.add_argument('--throttle-rate', type=float, default=defaults.throttle_rate, help='Fraction of calls answered 429.')
+    parser.add_argument('--retry-after', type=int, default=defaults.retry_after, help='Retry-After seconds sent with 429s.')
+
+
+def config_from_arguments(options):
+    return FakeProviderConfig(
+        latency_ms=options.latency_ms,
+        jitter_ms=options.jitter_ms,
+        error_rate=options.error_rate,
+        throttle_rate=options.throttle_rate,
+        retry_after=options.retry_after,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_config_arguments(parser)
+    options = parser.parse_args()
+    
+    server = FakeProviderServer((options.host, options.port), config_from_arguments(options))
+    print(f'Fake OAuth provider listening on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+"""
+End-to-end load test of the OAuth flow against a local fake provider.
+
+Each simulated user runs the whole flow in a loop:
+
+    initiate_oauth -> provider /authorize -> oauth_callback -> dashboard -> connection_status
+
+through Django's test client, in-process, against a throwaway test database,
+with every configured platform pointed at benchmarks/fake_provider.py. The
+report (throughput, p50/p95/p99 latency per flow and per step, and database
+queries per flow) is written as JSON so runs can be diffed between releases.
+
+Run with: python benchmarks/load_test.py --users 20 --flows 10 --output load.json
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform as python_platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'oauth_hub.settings')
+
+import django
+
+django.setup()
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+from django.urls import reverse
+
+from fake_provider import add_config_arguments, config_from_arguments, start_server
+
+STEPS = ('initiate', 'authorize', 'callback', 'dashboard', 'status')
+
+
+def fake_platforms(provider_url):
+    """OAUTH_PLATFORMS with every platform configured against the fake provider."""
+    return {
+        key: {
+            **config,
+            'client_id': f'load-test-{key}',
+            'client_secret': 'load-test-secret',
+            'auth_url': f'{provider_url}/authorize',
+            'token_url': f'{provider_url}/token',
+            'user_info_url': f'{provider_url}/userinfo',
+        }
+        for key, config in settings.OAUTH_PLATFORMS.items()
+    }
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries run on this thread's connection."""
+    
+    def __init__(self):
+        self.count = 0
+    
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run_flow(client, session, platform):
+    """Run one OAuth flow and return ``(outcome, {step: seconds}, {step: queries})``."""
+    timings = {}
+    queries = {}
+    counter = QueryCounter()
+    
+    with connection.execute_wrapper(counter):
+        def step(name, call):
+            before = counter.count
+            start = time.perf_counter()
+            response = call()
+            timings[name] = time.perf_counter() - start
+            queries[name] = counter.count - before
+            return response
+        
+        response = step('initiate', lambda: client.post(reverse('oauth_initiate', args=[platform])))
+        auth_url = response.get('Location', '') if response.status_code == 302 else ''
+        if not auth_url.startswith('http'):
+            return 'initiate_failed', timings, queries
+        
+        response = step('authorize', lambda: session.get(auth_url, allow_redirects=False, timeout=30))
+        callback = urlsplit(response.headers.get('Location', ''))
+        if response.status_code != 302 or not callback.query:
+            return 'authorize_failed', timings, queries
+        
+        step('callback', lambda: client.get(f'{callback.path}?{callback.query}'))
+        step('dashboard', lambda: client.get(reverse('dashboard')))
+        response = step('status', lambda: client.get(reverse('connection_status', args=[platform])))
+    
+    status = response.json().get('status') if response.status_code == 200 else f'http_{response.status_code}'
+    return 'ok' if status == 'connected' else status, timings, queries
+
+
+def run_user(user, platforms, flows):
+    """Run ``flows`` flows as ``user``, cycling through ``platforms``."""
+    client = Client()
+    client.force_login(user)
+    results = []
+    try:
+        with requests.Session() as session:
+            for i in range(flows):
+                results.append(run_flow(client, session, platforms[i % len(platforms)]))
+    finally:
+        # Each worker thread has its own connection; close it so the test database can be dropped
+        connection.close()
+    return results
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(values, scale=1.0):
+    if not values:
+        return None
+    ordered = sorted(value * scale for value in values)
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered), 2),
+        'p50': round(percentile(ordered, 50), 2),
+        'p95': round(percentile(ordered, 95), 2),
+        'p99': round(percentile(ordered, 99), 2),
+        'max': round(ordered[-1], 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(options, results, duration, provider_stats):
+    outcomes = Counter(outcome for outcome, _, _ in results)
+    completed = [(timings, queries) for outcome, timings, queries in results if outcome == 'ok']
+    
+    return {
+        'meta': {
+            'started_at': options.started_at,
+            'git_commit': git_commit(),
+            'python': python_platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'async_views': settings.OAUTH_ASYNC_VIEWS,
+        },
+        'load': {
+            'users': options.users,
+            'flows_per_user': options.flows,
+            'warmup_flows': options.warmup,
+            'platforms': options.platforms,
+            'stateless_state': options.stateless_state,
+        },
+        'provider': provider_stats,
+        'duration_seconds': round(duration, 3),
+        'flows': len(results),
+        'outcomes': dict(sorted(outcomes.items())),
+        'throughput_flows_per_second': round(len(results) / duration, 2) if duration else None,
+        'completed_flows_per_second': round(outcomes['ok'] / duration, 2) if duration else None,
+        # Latency and query counts cover completed flows only, so failures don't skew them
+        'latency_ms': {
+            'flow': summarize([sum(timings.values()) for timings, _ in completed], scale=1000),
+            'steps': {
+                name: summarize([timings[name] for timings, _ in completed], scale=1000)
+                for name in STEPS
+            },
+        },
+        'queries_per_flow': summarize([sum(queries.values()) for _, queries in completed]),
+        'queries_per_step': {
+            name: summarize([queries[name] for _, queries in completed])
+            for name in STEPS
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=10, help='Concurrent simulated users.')
+    parser.add_argument('--flows', type=int, default=10, help='Flows each user runs.')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed flows run first to warm caches and pools.')
+    parser.add_argument(
+        '--platforms', default='facebook',
+        help='Comma separated platforms the users cycle through.',
+    )
+    parser.add_argument(
+        '--provider-url',
+        help='Use an already running fake provider instead of starting one in-process.',
+    )
+    parser.add_argument(
+        '--stateless-state', action='store_true',
+        help='Carry the flow in a signed state parameter instead of an OAuthSession row.',
+    )
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+    parser.add_argument('--verbose', action='store_true', help="Keep the hub's own logging.")
+    add_config_arguments(parser)
+    options = parser.parse_args()
+    options.platforms = [key.strip() for key in options.platforms.split(',') if key.strip()]
+    options.started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    
+    unknown = set(options.platforms) - set(settings.OAUTH_PLATFORMS)
+    if unknown:
+        parser.error(f"Unknown platforms: {', '.join(sorted(unknown))}")
+    
+    if not options.verbose:
+        logging.disable(logging.ERROR)
+    
+    server = None
+    provider_url = options.provider_url
+    if not provider_url:
+        server = start_server(config_from_arguments(options))
+        provider_url = server.url
+    
+    setup_test_environment()
+    database = connections['default']
+    if database.vendor == 'sqlite':
+        # Worker threads need a file database; the default in-memory one serializes them on table locks
+        database.settings_dict['TEST']['NAME'] = str(Path(tempfile.mkdtemp()) / 'load_test.sqlite3')
+    old_config = setup_databases(verbosity=0, interactive=False)
+    
+    try:
+        with override_settings(
+            OAUTH_PLATFORMS=fake_platforms(provider_url),
+            OAUTH_STATELESS_STATE=options.stateless_state,
+        ):
+            users = [User.objects.create_user(f'loadtest{i}') for i in range(options.users)]
+            
+            if options.warmup:
+                run_user(users[0], options.platforms, options.warmup)
+            
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options.users) as pool:
+                futures = [pool.submit(run_user, user, options.platforms, options.flows) for user in users]
+                results = [result for future in futures for result in future.result()]
+            duration = time.perf_counter() - start
+        
+        provider_stats = server.stats() if server else {'url': provider_url}
+        report = build_report(options, results, duration, provider_stats)
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        if server:
+            server.shutdown()
+    
+    output = json.dumps(report, indent=2)
+    if options.output:
+        Path(options.output).write_text(output + '\n')
+        print(f"Wrote {options.output}: {report['throughput_flows_per_second']} flows/s, "
+              f"outcomes {report['outcomes']}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
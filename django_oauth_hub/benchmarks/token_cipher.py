@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Benchmark token decryption cost for a dashboard-sized render.
+
+Compares the old behaviour (a new Fernet instance and a decrypt on every
+token access) against the shared cipher with per-instance memoization.
+Run with: python benchmarks/token_cipher.py
+"""
+
+import os
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'oauth_hub.settings')
+
+import django
+
+django.setup()
+
+from cryptography.fernet import Fernet
+from django.conf import settings
+from oauth_manager.crypto import encrypt_token
+from oauth_manager.models import PlatformConnection
+
+# Number of times the dashboard template evaluates is_connected per card.
+ACCESSES_PER_CARD = 4
+ROUNDS = 200
+
+# Run both paths on one freshly generated Fernet key, so they decrypt the same data.
+FERNET_KEY = Fernet.generate_key()
+settings.ENCRYPTION_KEY = FERNET_KEY
+
+
+def build_connections():
+    ciphertext = encrypt_token('benchmark-access-token')
+    return [
+        PlatformConnection(platform=key, status='connected', encrypted_access_token=ciphertext)
+        for key, _ in PlatformConnection.PLATFORM_CHOICES
+    ]
+
+
+def legacy_render():
+    for connection in build_connections():
+        for _ in range(ACCESSES_PER_CARD):
+            Fernet(FERNET_KEY).decrypt(connection.encrypted_access_token.encode()).decode()
+
+
+def memoized_render():
+    for connection in build_connections():
+        for _ in range(ACCESSES_PER_CARD):
+            connection.access_token
+
+
+if __name__ == '__main__':
+    legacy = timeit.timeit(legacy_render, number=ROUNDS) / ROUNDS
+    memoized = timeit.timeit(memoized_render, number=ROUNDS) / ROUNDS
+    
+    print(f"Per dashboard render ({len(PlatformConnection.PLATFORM_CHOICES)} cards x {ACCESSES_PER_CARD} accesses)")
+    print(f"  legacy (new Fernet + decrypt per access): {legacy * 1000:.3f} ms")
+    print(f"  shared cipher + memoized decrypt:         {memoized * 1000:.3f} ms")
+    print(f"  speedup: {legacy / memoized:.1f}x")
@@ -0,0 +1,31 @@
+# Gunicorn configuration picked up automatically from the working directory.
+import os
+import shutil
+import tempfile
+
+# Workers write Prometheus samples here so /metrics aggregates across all of
+# them (see oauth_manager/metrics.py). Must be set before the app is imported.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'oauth_hub_prometheus'))
+
+
+def on_starting(server):
+    """Start from an empty metrics directory so old workers' samples don't linger."""
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def post_worker_init(worker):
+    """Pre-warm provider connections in each worker when enabled."""
+    from django.conf import settings
+    
+    if settings.OAUTH_HTTP_PREWARM:
+        from oauth_manager import http_client
+        http_client.prewarm()
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges from the aggregated metrics."""
+    from prometheus_client import multiprocess
+    
+    multiprocess.mark_process_dead(worker.pid)
@@ -30,6 +30,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'oauth_manager.request_metrics.RequestMetricsMiddleware',
+    'oauth_manager.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -61,12 +63,18 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'oauth_hub.wsgi.application'
 
-# Database
+# Database. Under ASGI (OAUTH_ASYNC_VIEWS) the async ORM runs queries in a
+# thread whose persistent connections the request cycle doesn't reliably
+# close, so there connections are closed after every request unless
+# CONN_MAX_AGE says otherwise; put a pooler such as PgBouncer in front to
+# reuse them.
 if os.getenv('DATABASE_URL'):
     DATABASES = {
         'default': dj_database_url.config(
             default=os.getenv('DATABASE_URL'),
-            conn_max_age=600,
+            conn_max_age=int(os.getenv(
+                'CONN_MAX_AGE', '0' if os.getenv('OAUTH_ASYNC_VIEWS', 'False').lower() == 'true' else '600',
+            )),
             conn_health_checks=True,
         )
     }
@@ -78,6 +86,33 @@ else:
         }
     }
 
+# Cache (connection status cache, rate limits, circuit breakers, ...). The
+# local-memory cache is per process. Multi-worker deployments need a shared
+# cache with atomic counters (oauth_manager/atomic_cache.py): REDIS_URL for
+# several hosts (needs the redis package), or CACHE_LOCATION, a directory for
+# a file-based cache shared by the workers of one host.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+elif os.getenv('CACHE_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_LOCATION'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'oauth-hub',
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -170,6 +205,165 @@ OAUTH_PLATFORMS = {
     },
 }
 
+# Serve the OAuth flow views from oauth_manager.views_async. Requires running
+# under ASGI, e.g. gunicorn -k uvicorn.workers.UvicornWorker oauth_hub.asgi
+OAUTH_ASYNC_VIEWS = os.getenv('OAUTH_ASYNC_VIEWS', 'False').lower() == 'true'
+
+# Carry the OAuth flow in an encrypted, signed state parameter instead of an
+# OAuthSession row (oauth_manager/oauth_state.py). Replays are blocked by a
+# used-nonce entry in the cache, so the cache must be shared between workers.
+OAUTH_STATELESS_STATE = os.getenv('OAUTH_STATELESS_STATE', 'False').lower() == 'true'
+
+# Seconds a cached connection status may be served. Saves and deletes
+# invalidate immediately in the writing process; this bounds staleness elsewhere.
+OAUTH_STATUS_CACHE_TTL = int(os.getenv('OAUTH_STATUS_CACHE_TTL', '5'))
+
+# Seconds a rendered dashboard platform card is cached. The fragment key covers
+# the connection's updated_at and status, so changes show up immediately.
+OAUTH_DASHBOARD_CARD_CACHE_TTL = int(os.getenv('OAUTH_DASHBOARD_CARD_CACHE_TTL', '600'))
+
+# Live status stream (/platform/status/stream/). An open stream holds its
+# request for up to OAUTH_STATUS_STREAM_MAX_SECONDS, so only enable it when
+# streams can't starve other requests: with OAUTH_ASYNC_VIEWS under ASGI (the
+# default follows that setting) or with threaded/async workers
+# (gunicorn --threads N, -k gevent). On the Procfile's sync workers each open
+# tab would pin a worker, so the dashboard polls /platform/status/ instead
+# (unchanged polls are 304s) and the stream answers 404.
+OAUTH_STATUS_STREAM_ENABLED = os.getenv('OAUTH_STATUS_STREAM_ENABLED', str(OAUTH_ASYNC_VIEWS)).lower() == 'true'
+# 'poll' has each stream poll the database, so it sees writes from every worker
+# and from refresh_tokens/expire_tokens. 'local' pushes changes through an
+# in-process broker and only reaches streams in the process that made them;
+# use it only with a single server process and no background workers.
+OAUTH_STATUS_STREAM_BACKEND = os.getenv('OAUTH_STATUS_STREAM_BACKEND', 'poll')
+OAUTH_STATUS_STREAM_HEARTBEAT_SECONDS = 15
+OAUTH_STATUS_STREAM_POLL_SECONDS = 5
+# Streams close after this long and the browser reconnects, so a sync worker
+# is never held indefinitely
+OAUTH_STATUS_STREAM_MAX_SECONDS = int(os.getenv('OAUTH_STATUS_STREAM_MAX_SECONDS', '300'))
+
+# Provider HTTP client defaults. Override per platform with an 'http' dict in
+# OAUTH_PLATFORMS, e.g. 'http': {'read_timeout': 20}.
+OAUTH_HTTP_DEFAULTS = {
+    'connect_timeout': float(os.getenv('OAUTH_HTTP_CONNECT_TIMEOUT', '3.05')),
+    'read_timeout': float(os.getenv('OAUTH_HTTP_READ_TIMEOUT', '15')),
+    'pool_size': int(os.getenv('OAUTH_HTTP_POOL_SIZE', '10')),
+    'retries': 2,  # idempotent (GET) calls only
+    'backoff': 0.25,  # seconds, doubled per attempt with full jitter
+    'retry_statuses': (502, 503, 504),
+}
+
+# Outbound rate limits are opt-in per platform and endpoint ('token',
+# 'userinfo', 'refresh') with a 'rate_limits' dict in OAUTH_PLATFORMS, e.g.
+#   'rate_limits': {'token': {'rate': 5, 'burst': 10}, 'refresh': {'rate': 2}}
+# where rate is requests per second. Buckets live in the cache, so use a shared
+# cache backend to limit across worker processes. Calls that would wait longer
+# than this many seconds for a slot fail fast instead.
+OAUTH_RATE_LIMIT_MAX_WAIT = float(os.getenv('OAUTH_RATE_LIMIT_MAX_WAIT', '2'))
+# When a bucket's lock can't be taken within ~0.1s, refuse the call with
+# RateLimited (default) or send it without limiting. Both are counted in
+# oauth_hub_rate_limit_lock_timeouts_total.
+OAUTH_RATE_LIMIT_FAIL_OPEN = os.getenv('OAUTH_RATE_LIMIT_FAIL_OPEN', 'False').lower() == 'true'
+
+# Circuit breaker and bulkhead per provider (oauth_manager/resilience.py).
+# Override per platform with a 'resilience' dict in OAUTH_PLATFORMS.
+OAUTH_PROVIDER_RESILIENCE = {
+    'window_seconds': 60,  # rolling window the rates are measured over
+    'bucket_seconds': 10,
+    'min_calls': 10,  # calls in the window before the breaker can open
+    'failure_rate': 0.5,  # network errors and 5xx
+    'slow_call_seconds': 5.0,
+    'slow_call_rate': 0.8,
+    'open_seconds': 30,  # how long an open circuit fails fast before probing
+    # Concurrent calls to one provider across every worker sharing the cache
+    # (set CACHE_LOCATION; the local-memory cache only counts per process);
+    # more fail immediately
+    'max_concurrency': int(os.getenv('OAUTH_PROVIDER_MAX_CONCURRENCY', '10')),
+}
+
+# Open provider connections when a gunicorn worker boots (see gunicorn.conf.py)
+OAUTH_HTTP_PREWARM = os.getenv('OAUTH_HTTP_PREWARM', 'False').lower() == 'true'
+
+# Per-request metrics (oauth_manager/request_metrics.py): query count, DB time,
+# status cache hits and provider call time, logged for every request and sent
+# as a Server-Timing header. In strict mode a view running more queries than
+# its @query_budget raises instead of logging a warning; use it in development
+# and CI.
+OAUTH_REQUEST_METRICS = os.getenv('OAUTH_REQUEST_METRICS', 'True').lower() == 'true'
+OAUTH_SERVER_TIMING = os.getenv('OAUTH_SERVER_TIMING', 'True').lower() == 'true'
+OAUTH_QUERY_BUDGET_STRICT = os.getenv('OAUTH_QUERY_BUDGET_STRICT', 'False').lower() == 'true'
+
+# Prometheus scrape endpoint (/metrics, oauth_manager/metrics.py). Open to
+# staff and to these addresses/networks; DB-derived gauges are cached for
+# OAUTH_METRICS_DB_TTL seconds. Set PROMETHEUS_MULTIPROC_DIR to aggregate
+# across worker processes (gunicorn.conf.py does this for gunicorn).
+OAUTH_METRICS_ALLOWED_IPS = [
+    network.strip() for network in os.getenv('OAUTH_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if network.strip()
+]
+OAUTH_METRICS_DB_TTL = int(os.getenv('OAUTH_METRICS_DB_TTL', '30'))
+
+# Sampled cProfile profiling (oauth_manager/profiling.py). Off by default, in
+# which case the middleware drops out of the stack. When on, profiles a random
+# sample of requests, every request under OAUTH_PROFILING_PATHS, and requests
+# sending X-Profile-Request: <OAUTH_PROFILING_HEADER_TOKEN>. Profiles go to
+# OAUTH_PROFILING_DIR, keeping the newest OAUTH_PROFILING_MAX_FILES; summarize
+# them with `manage.py profile_report`.
+OAUTH_PROFILING_ENABLED = os.getenv('OAUTH_PROFILING_ENABLED', 'False').lower() == 'true'
+OAUTH_PROFILING_SAMPLE_RATE = float(os.getenv('OAUTH_PROFILING_SAMPLE_RATE', '0.01'))
+OAUTH_PROFILING_PATHS = [
+    path.strip() for path in os.getenv('OAUTH_PROFILING_PATHS', '').split(',') if path.strip()
+]
+OAUTH_PROFILING_HEADER_TOKEN = os.getenv('OAUTH_PROFILING_HEADER_TOKEN')
+OAUTH_PROFILING_DIR = os.getenv('OAUTH_PROFILING_DIR', str(BASE_DIR / 'profiles'))
+OAUTH_PROFILING_MAX_FILES = int(os.getenv('OAUTH_PROFILING_MAX_FILES', '200'))
+
+# Where log_connection_event writes audit events. Events are buffered and
+# bulk-inserted into ConnectionLog, flushed at the end of every request.
+# Use 'oauth_manager.log_sinks.DatabaseSink' for one INSERT per event, or write
+# JSONL files instead:
+#   CONNECTION_LOG_SINK = {
+#       'BACKEND': 'oauth_manager.log_sinks.JSONLFileSink',
+#       'OPTIONS': {'path': BASE_DIR / 'logs' / 'connections.jsonl', 'max_bytes': 50 * 1024 * 1024, 'backup_count': 10},
+#   }
+CONNECTION_LOG_SINK = {
+    'BACKEND': 'oauth_manager.log_sinks.BufferedDatabaseSink',
+    'OPTIONS': {
+        'batch_size': 100,
+        'flush_interval': 2.0,
+    },
+}
+
+# Token refresh worker (python manage.py refresh_tokens). Concurrency is per
+# platform; override it with 'refresh_concurrency' in an OAUTH_PLATFORMS entry.
+OAUTH_TOKEN_REFRESH_HORIZON_MINUTES = int(os.getenv('OAUTH_TOKEN_REFRESH_HORIZON_MINUTES', '30'))
+OAUTH_TOKEN_REFRESH_BATCH_SIZE = int(os.getenv('OAUTH_TOKEN_REFRESH_BATCH_SIZE', '100'))
+OAUTH_TOKEN_REFRESH_CONCURRENCY = int(os.getenv('OAUTH_TOKEN_REFRESH_CONCURRENCY', '4'))
+# A transiently failed refresh (network error, 5xx) keeps the connection's status
+# and is retried after this many seconds, doubling per failure up to the maximum
+OAUTH_TOKEN_REFRESH_BACKOFF_SECONDS = int(os.getenv('OAUTH_TOKEN_REFRESH_BACKOFF_SECONDS', '60'))
+OAUTH_TOKEN_REFRESH_MAX_BACKOFF_SECONDS = int(os.getenv('OAUTH_TOKEN_REFRESH_MAX_BACKOFF_SECONDS', '3600'))
+
+# Connection log archival (python manage.py archive_connection_logs). Rows
+# older than the retention period are moved into compressed JSONL files under
+# CONNECTION_LOG_ARCHIVE_DIR; restore_connection_logs loads them back.
+CONNECTION_LOG_RETENTION_DAYS = int(os.getenv('CONNECTION_LOG_RETENTION_DAYS', '90'))
+CONNECTION_LOG_ARCHIVE_DIR = os.getenv('CONNECTION_LOG_ARCHIVE_DIR', str(BASE_DIR / 'archive' / 'connection_logs'))
+
+# OAuth session sweeper (python manage.py cleanup_oauth_sessions)
+OAUTH_SESSION_CLEANUP_BATCH_SIZE = int(os.getenv('OAUTH_SESSION_CLEANUP_BATCH_SIZE', '1000'))
+OAUTH_SESSION_CLEANUP_SLEEP = float(os.getenv('OAUTH_SESSION_CLEANUP_SLEEP', '0.1'))
+OAUTH_SESSION_RETENTION_HOURS = int(os.getenv('OAUTH_SESSION_RETENTION_HOURS', '24'))
+
+# Token expiry sweeper (python manage.py expire_tokens). Read views only
+# compute expiry; this persists it with batched UPDATEs.
+OAUTH_TOKEN_EXPIRY_BATCH_SIZE = int(os.getenv('OAUTH_TOKEN_EXPIRY_BATCH_SIZE', '1000'))
+OAUTH_TOKEN_EXPIRY_SLEEP = float(os.getenv('OAUTH_TOKEN_EXPIRY_SLEEP', '0.1'))
+
+# Data deletion requests (python manage.py process_data_deletions). Requests
+# wait out the grace period, then are deleted in bounded batches.
+OAUTH_DATA_DELETION_GRACE_DAYS = int(os.getenv('OAUTH_DATA_DELETION_GRACE_DAYS', '7'))
+OAUTH_DATA_DELETION_BATCH_SIZE = int(os.getenv('OAUTH_DATA_DELETION_BATCH_SIZE', '1000'))
+OAUTH_DATA_DELETION_SLEEP = float(os.getenv('OAUTH_DATA_DELETION_SLEEP', '0.1'))
+
 # Security Settings
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
@@ -1,13 +1,121 @@
 from django.contrib import admin
-from .models import PlatformConnection, OAuthSession, ConnectionLog
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .models import PlatformConnection, OAuthSession, ConnectionLog, DataDeletionRequest
+from .views_export import CONNECTION_EXPORT_FIELDS, LOG_EXPORT_FIELDS, stream_export
+
+# Query parameter carrying the keyset cursor on the connection log list
+KEYSET_VAR = 'before'
+
+
+def estimate_row_count(model, using):
+    """Return the planner's row estimate for a model's table, or None if the database has none."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+                [table],
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    # PostgreSQL reports -1 for tables that have never been analyzed
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never runs an unbounded COUNT(*).
+    
+    Unfiltered lists over large tables use the database's table statistics;
+    anything else is counted only up to ``max_count`` rows.
+    """
+    max_count = 10000
+    
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.max_count:
+                return estimate
+        return queryset[:self.max_count].count()
+
+
+class DeferredColumnsChangeList(ChangeList):
+    """Change list that leaves the admin's ``list_defer`` columns unloaded."""
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer(*self.model_admin.list_defer)
+
+
+class KeysetChangeList(DeferredColumnsChangeList):
+    """
+    Change list paged by primary key ("show more") instead of by page number,
+    so deep pages cost the same as the first one.
+    """
+    
+    def __init__(self, request, *args, **kwargs):
+        before = request.GET.get(KEYSET_VAR, '')
+        self.before = int(before) if before.isdigit() else None
+        if KEYSET_VAR in request.GET:
+            # Not a field lookup, so keep it away from the admin's filter handling
+            request.GET = request.GET.copy()
+            del request.GET[KEYSET_VAR]
+        super().__init__(request, *args, **kwargs)
+    
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.before:
+            queryset = queryset.filter(pk__lt=self.before)
+        return queryset
+    
+    def get_results(self, request):
+        super().get_results(request)
+        results = list(self.result_list)
+        self.show_more_url = None
+        if len(results) >= self.list_per_page:
+            self.show_more_url = self.get_query_string({KEYSET_VAR: results[-1].pk}, [PAGE_VAR])
+
+
+@admin.action(description='Export selected as CSV')
+def export_csv(modeladmin, request, queryset):
+    return stream_export(queryset, modeladmin.export_fields, 'csv', modeladmin.export_name)
+
+
+@admin.action(description='Export selected as JSONL')
+def export_jsonl(modeladmin, request, queryset):
+    return stream_export(queryset, modeladmin.export_fields, 'jsonl', modeladmin.export_name)
+
+
+class ScalableAdminMixin:
+    """List view settings that hold up on tables with millions of rows."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_defer = ()
+    
+    def get_changelist(self, request, **kwargs):
+        return DeferredColumnsChangeList
 
 
 @admin.register(PlatformConnection)
-class PlatformConnectionAdmin(admin.ModelAdmin):
+class PlatformConnectionAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ['user', 'platform', 'status', 'platform_username', 'created_at', 'last_used_at']
     list_filter = ['platform', 'status', 'created_at']
-    search_fields = ['user__username', 'platform_username', 'platform_email']
+    list_select_related = ['user']
+    list_defer = ['encrypted_access_token', 'encrypted_refresh_token', 'scope_granted', 'last_error_message']
+    search_fields = ['user__username__startswith', 'platform_username__startswith', 'platform_email__startswith']
+    search_help_text = 'Matches the start of the username, platform username or platform email.'
     readonly_fields = ['encrypted_access_token', 'encrypted_refresh_token', 'created_at', 'updated_at']
+    actions = [export_csv, export_jsonl]
+    export_fields = CONNECTION_EXPORT_FIELDS
+    export_name = 'connections'
     
     fieldsets = [
         ('Basic Information', {
@@ -32,22 +140,65 @@ class PlatformConnectionAdmin(admin.ModelAdmin):
 
 
 @admin.register(OAuthSession)
-class OAuthSessionAdmin(admin.ModelAdmin):
+class OAuthSessionAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ['user', 'platform', 'state', 'is_active', 'created_at', 'completed_at']
     list_filter = ['platform', 'is_active', 'created_at']
-    search_fields = ['user__username', 'state']
+    list_select_related = ['user']
+    search_fields = ['user__username__startswith', 'state__exact']
+    search_help_text = 'Matches the start of the username, or an exact state value.'
     readonly_fields = ['created_at', 'completed_at']
 
 
 @admin.register(ConnectionLog)
-class ConnectionLogAdmin(admin.ModelAdmin):
+class ConnectionLogAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ['connection', 'action', 'ip_address', 'created_at']
-    list_filter = ['action', 'created_at']
-    search_fields = ['connection__user__username', 'connection__platform', 'details']
+    list_filter = ['action', 'connection__platform', 'created_at']
+    list_select_related = ['connection__user']
+    list_defer = [
+        'details',
+        'user_agent',
+        'connection__encrypted_access_token',
+        'connection__encrypted_refresh_token',
+        'connection__scope_granted',
+        'connection__last_error_message',
+    ]
+    search_fields = ['connection__user__username__startswith']
+    search_help_text = 'Matches the start of the username.'
     readonly_fields = ['created_at']
+    actions = [export_csv, export_jsonl]
+    export_fields = LOG_EXPORT_FIELDS
+    export_name = 'connection-logs'
+    # Newest first by primary key, which the keyset pagination relies on
+    ordering = ['-pk']
+    sortable_by = []
+    
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
     
     def has_add_permission(self, request):
         return False  # Logs should only be created programmatically
     
     def has_change_permission(self, request, obj=None):
         return False  # Logs should be immutable
+
+
+@admin.register(DataDeletionRequest)
+class DataDeletionRequestAdmin(admin.ModelAdmin):
+    list_display = ['user', 'status', 'stage', 'requested_at', 'process_after', 'completed_at']
+    list_filter = ['status', 'requested_at']
+    list_select_related = ['user']
+    search_fields = ['user__username__startswith']
+    search_help_text = 'Matches the start of the username.'
+    readonly_fields = [
+        'user', 'stage', 'reason', 'details', 'ip_address', 'user_agent', 'requested_at',
+        'started_at', 'completed_at', 'logs_deleted', 'sessions_deleted', 'connections_deleted',
+    ]
+    actions = ['cancel_requests']
+    
+    def has_add_permission(self, request):
+        return False  # Requests come from the data deletion page
+    
+    @admin.action(description='Cancel selected pending requests', permissions=['change'])
+    def cancel_requests(self, request, queryset):
+        cancelled = queryset.filter(status='pending').update(status='cancelled')
+        self.message_user(request, f'Cancelled {cancelled} requests.')
@@ -5,3 +5,7 @@ class OauthManagerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'oauth_manager'
     verbose_name = 'OAuth Manager'
+    
+    def ready(self):
+        # Connect signal receivers
+        from . import atomic_cache, events, log_sinks, providers, request_metrics  # noqa: F401
@@ -0,0 +1,76 @@
+"""
+Compressed JSONL archives of ConnectionLog rows.
+
+Archives are partitioned by the UTC date of ``created_at``:
+
+    <archive dir>/2024/05/connection_logs-2024-05-17-<run>.jsonl.gz
+
+where ``<run>`` identifies the archiving run, so later runs never overwrite
+earlier files. Files are gzip, or zstd when the optional ``zstandard``
+package is installed.
+"""
+
+import gzip
+import json
+import re
+from datetime import date, datetime, timezone as dt_timezone
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+FIELDS = ('id', 'connection_id', 'action', 'details', 'ip_address', 'user_agent', 'created_at')
+
+EXTENSIONS = {'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+
+FILENAME_RE = re.compile(r'^connection_logs-(\d{4}-\d{2}-\d{2})-[\w.]+\.jsonl\.(gz|zst)$')
+
+
+def default_compression():
+    return 'zstd' if zstandard else 'gzip'
+
+
+def open_archive(path, mode):
+    """Open an archive file for text reading ('rt') or writing ('wt')."""
+    path = str(path)
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd compressed but the zstandard package is not installed")
+        return zstandard.open(path, mode, encoding='utf-8')
+    return gzip.open(path, mode, encoding='utf-8')
+
+
+def archive_path(directory, day, run, compression):
+    return directory / f'{day:%Y}' / f'{day:%m}' / f'connection_logs-{day.isoformat()}-{run}{EXTENSIONS[compression]}'
+
+
+def archive_date(created_at):
+    """The UTC date a row is partitioned under."""
+    return created_at.astimezone(dt_timezone.utc).date()
+
+
+def serialize(row):
+    """Encode a ``values()`` row as one JSON line."""
+    return json.dumps({**row, 'created_at': row['created_at'].isoformat()}) + '\n'
+
+
+def deserialize(line):
+    record = json.loads(line)
+    record['created_at'] = datetime.fromisoformat(record['created_at'])
+    return record
+
+
+def count_lines(path):
+    with open_archive(path, 'rt') as f:
+        return sum(1 for _ in f)
+
+
+def find_archives(directory, start, end):
+    """Yield archive files whose partition date falls within ``[start, end]``, oldest first."""
+    found = []
+    for path in directory.glob('*/*/connection_logs-*'):
+        match = FILENAME_RE.match(path.name)
+        if match and start <= date.fromisoformat(match.group(1)) <= end:
+            found.append(path)
+    return sorted(found)
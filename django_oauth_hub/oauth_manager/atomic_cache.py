@@ -0,0 +1,163 @@
+"""
+Atomic counters and locks on the default cache, shared between workers.
+
+The breaker and bulkhead counters (resilience.py) and the rate limiter's lock
+(rate_limit.py) need read-modify-write operations that stay exact when several
+workers hit the same key. Redis and Memcached provide them natively (INCR,
+SET NX), and the local-memory cache does within its single process. The
+file-based cache implements ``add`` and ``incr`` as a read followed by a
+write, so for it every operation here runs under an exclusive ``fcntl`` lock
+on a file in the cache directory, which makes it exact between the workers
+of one host. Any other backend (database cache, ...) is not atomic; a system
+check reports it, and operations fall back to a per-process lock.
+
+Counter updates never extend a key's expiry on the native backends. Under the
+file lock, each update re-applies the timeout the caller passes.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.checks import Warning, register
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Backends whose add/incr/decr are atomic for everything sharing them
+NATIVE_BACKENDS = {
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+}
+FILE_BACKEND = 'django.core.cache.backends.filebased.FileBasedCache'
+LOCK_FILENAME = '.oauth_hub_atomic.lock'
+
+_process_lock = threading.Lock()
+
+
+def backend():
+    return settings.CACHES['default']['BACKEND']
+
+
+def is_native():
+    return backend() in NATIVE_BACKENDS
+
+
+def is_atomic():
+    """Whether these operations are exact across every process sharing the cache."""
+    return is_native() or (backend() == FILE_BACKEND and fcntl is not None)
+
+
+@contextmanager
+def exclusive():
+    """Hold the cross-process lock guarding read-modify-write on a non-native cache."""
+    if backend() != FILE_BACKEND or fcntl is None:
+        with _process_lock:
+            yield
+        return
+    directory = settings.CACHES['default']['LOCATION']
+    os.makedirs(directory, exist_ok=True)
+    # A separate open file per call, so threads of one process exclude each other too
+    with open(os.path.join(directory, LOCK_FILENAME), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def add(key, value, timeout):
+    """Set ``key`` only if it is absent; returns True if this call set it."""
+    if is_native():
+        return cache.add(key, value, timeout)
+    with exclusive():
+        return cache.add(key, value, timeout)
+
+
+def incr(key, delta=1, timeout=None):
+    """Add ``delta`` to a counter, creating it with ``timeout``; returns the new value."""
+    if is_native():
+        cache.add(key, 0, timeout)
+        try:
+            return cache.incr(key, delta)
+        except ValueError:
+            # Expired between add() and incr()
+            cache.add(key, delta, timeout)
+            return delta
+    with exclusive():
+        value = (cache.get(key) or 0) + delta
+        cache.set(key, value, timeout)
+        return value
+
+
+def decr(key, delta=1, timeout=None):
+    """Subtract ``delta`` from an existing counter; returns None if it has expired."""
+    if is_native():
+        try:
+            return cache.decr(key, delta)
+        except ValueError:
+            return None
+    with exclusive():
+        value = cache.get(key)
+        if value is None:
+            return None
+        cache.set(key, value - delta, timeout)
+        return value - delta
+
+
+class Lock:
+    """
+    A short cache lock owned by a token.
+    
+    Only the holder releases it, and only while it can't have expired, so a
+    holder that overran ``timeout`` never drops a lock another worker has
+    since taken.
+    """
+    
+    def __init__(self, key, timeout):
+        self.key = key
+        self.timeout = timeout
+        self.token = None
+        self.acquired_at = None
+    
+    def acquire(self, attempts, sleep):
+        token = os.urandom(8).hex()
+        for _ in range(attempts):
+            if add(self.key, token, self.timeout):
+                self.token, self.acquired_at = token, time.monotonic()
+                return True
+            time.sleep(sleep)
+        return False
+    
+    def release(self):
+        if self.token is None:
+            return
+        token, self.token = self.token, None
+        if time.monotonic() - self.acquired_at >= self.timeout:
+            return  # May have expired and been taken by someone else
+        if is_native():
+            if cache.get(self.key) == token:
+                cache.delete(self.key)
+            return
+        with exclusive():
+            if cache.get(self.key) == token:
+                cache.delete(self.key)
+
+
+@register()
+def check_atomic_cache(app_configs, **kwargs):
+    if is_atomic():
+        return []
+    return [Warning(
+        f"The default cache ({backend()}) can't update counters atomically between processes.",
+        hint='Rate limits and provider circuit breakers/bulkheads will drift when several workers share it. '
+             'Use Redis (REDIS_URL), Memcached or the file-based cache (CACHE_LOCATION).',
+        id='oauth_manager.W001',
+    )]
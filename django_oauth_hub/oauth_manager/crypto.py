@@ -0,0 +1,54 @@
+import base64
+import hashlib
+import logging
+from functools import lru_cache
+
+from cryptography.fernet import Fernet, MultiFernet
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=4)
+def _build_cipher(key):
+    """Build a Fernet cipher for the given key material (cached per process)."""
+    try:
+        return Fernet(key)
+    except ValueError:
+        # ENCRYPTION_KEY is not a urlsafe-base64 32-byte Fernet key (the settings
+        # module pads/truncates arbitrary strings), so derive a valid one from it.
+        logger.debug("ENCRYPTION_KEY is not a Fernet key, deriving one with SHA-256")
+        return Fernet(base64.urlsafe_b64encode(hashlib.sha256(key).digest()))
+
+
+def get_token_cipher():
+    """Return the process-wide cipher used for token storage."""
+    key = settings.ENCRYPTION_KEY
+    if isinstance(key, str):
+        key = key.encode()
+    return _build_cipher(key)
+
+
+def encrypt_token(value):
+    """Encrypt a plaintext token and return the ciphertext as text."""
+    return get_token_cipher().encrypt(value.encode()).decode()
+
+
+def decrypt_token(ciphertext):
+    """Decrypt a stored token ciphertext and return the plaintext."""
+    return get_token_cipher().decrypt(ciphertext.encode()).decode()
+
+
+@lru_cache(maxsize=4)
+def _build_state_cipher(secrets):
+    """Build the OAuth state cipher from the secret keys, newest first."""
+    return MultiFernet([
+        Fernet(base64.urlsafe_b64encode(hashlib.sha256(b'oauth_manager.oauth_state:' + secret).digest()))
+        for secret in secrets
+    ])
+
+
+def get_state_cipher():
+    """Return the cipher for stateless OAuth state, keyed off SECRET_KEY (and its fallbacks)."""
+    secrets = (settings.SECRET_KEY, *settings.SECRET_KEY_FALLBACKS)
+    return _build_state_cipher(tuple(secret.encode() if isinstance(secret, str) else secret for secret in secrets))
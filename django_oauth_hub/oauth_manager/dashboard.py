@@ -0,0 +1,96 @@
+"""
+View-models for the dashboard platform cards.
+
+What a card shows about its platform (name, icon, whether the platform is
+listed in ``OAUTH_PLATFORMS`` and has a client ID) doesn't change between
+requests, so it is derived from the provider registry once per process and
+rebuilt along with it. The template then only combines that with the user's
+connection, and each card body is cached as a fragment keyed on the user,
+platform, connection ``updated_at`` and status, and the configured flag.
+"""
+
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from .providers import get_registry
+
+PLATFORM_ICONS = {
+    'facebook': 'fab fa-facebook-f',
+    'instagram': 'fab fa-instagram',
+    'twitter': 'fab fa-twitter',
+    'linkedin': 'fab fa-linkedin-in',
+    'youtube': 'fab fa-youtube',
+    'tiktok': 'fab fa-tiktok',
+    'pinterest': 'fab fa-pinterest-p',
+}
+DEFAULT_ICON = 'fas fa-share-alt'
+
+# status -> (icon, label) for the card status badge
+STATUS_BADGES = {
+    'connected': ('fas fa-check-circle', 'Connected'),
+    'connecting': ('fas fa-spinner fa-spin', 'Connecting'),
+    'expired': ('fas fa-exclamation-triangle', 'Expired'),
+    'error': ('fas fa-times-circle', 'Error'),
+}
+DEFAULT_BADGE = ('fas fa-circle', 'Not Connected')
+
+
+@dataclass(frozen=True)
+class DashboardPlatform:
+    """Request-independent card data for one platform."""
+    
+    key: str
+    name: str
+    icon: str
+    is_configured: bool
+
+
+@dataclass(frozen=True)
+class DashboardCard:
+    platform: DashboardPlatform
+    connection: object
+    badge_icon: str
+    badge_label: str
+
+
+def build_platforms(registry):
+    """Build ``{platform: DashboardPlatform}`` for the platforms in ``OAUTH_PLATFORMS``."""
+    return {
+        key: DashboardPlatform(
+            key=key,
+            name=descriptor.name,
+            icon=PLATFORM_ICONS.get(key, DEFAULT_ICON),
+            is_configured=descriptor.is_configured,
+        )
+        for key, descriptor in registry.items()
+        if key in settings.OAUTH_PLATFORMS
+    }
+
+
+# (registry, platforms) - rebuilt whenever the provider registry is
+_platforms = (None, None)
+
+
+def get_platforms():
+    """Return the process-wide ``{platform: DashboardPlatform}`` mapping."""
+    global _platforms
+    registry = get_registry()
+    built_for, platforms = _platforms
+    if built_for is not registry:
+        platforms = build_platforms(registry)
+        _platforms = (registry, platforms)
+    return platforms
+
+
+def build_cards(connections):
+    """Pair each of the user's connections with its platform, in display order."""
+    platforms = get_platforms()
+    cards = []
+    for key, connection in connections.items():
+        platform = platforms.get(key)
+        if platform is None:
+            continue
+        badge_icon, badge_label = STATUS_BADGES.get(connection.status, DEFAULT_BADGE)
+        cards.append(DashboardCard(platform, connection, badge_icon, badge_label))
+    return cards
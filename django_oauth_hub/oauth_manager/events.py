@@ -0,0 +1,194 @@
+"""
+Live connection status events for the Server-Sent Events stream.
+
+With the default ``poll`` backend each stream polls the user's rows for
+``updated_at`` changes, so it sees writes from every worker and from the
+``refresh_tokens``/``expire_tokens`` commands. The ``local`` backend instead
+pushes changes through an in-process broker as soon as
+``set_connected``/``set_error``/``disconnect`` commit, which only reaches
+streams served by the same process.
+
+Streams are off unless ``OAUTH_STATUS_STREAM_ENABLED`` is set (it follows
+``OAUTH_ASYNC_VIEWS``), because each one holds a sync worker for up to
+``OAUTH_STATUS_STREAM_MAX_SECONDS``.
+"""
+
+import asyncio
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+
+from .models import PlatformConnection
+from .signals import connection_status_changed
+
+
+class Subscription:
+    """A stream's mailbox, fed from whichever thread publishes."""
+    
+    def __init__(self):
+        self.queue = queue.Queue()
+    
+    def deliver(self, payload):
+        self.queue.put(payload)
+    
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """A mailbox consumed from an event loop."""
+    
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+    
+    def deliver(self, payload):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, payload)
+    
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class StatusBroker:
+    """In-process fan-out of status payloads to a user's open streams."""
+    
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+    
+    def subscribe(self, user_id, subscription):
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+    
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            self._subscribers[user_id].discard(subscription)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+    
+    def publish(self, user_id, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.deliver(payload)
+
+
+broker = StatusBroker()
+
+
+@receiver(connection_status_changed, dispatch_uid='oauth_manager.publish_status_change')
+def publish_status_change(sender, connection, **kwargs):
+    """Push the new status to the user's streams once the write is committed."""
+    from .views import connection_status_data
+    user_id, payload = connection.user_id, connection_status_data(connection)
+    transaction.on_commit(lambda: broker.publish(user_id, payload))
+
+
+def format_event(payload, event='status'):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def _changed_since(user, since):
+    """Return status payloads for the user's rows updated after ``since``."""
+    from .views import connection_status_data
+    connections = list(PlatformConnection.objects.without_tokens().filter(user=user, updated_at__gt=since).order_by('updated_at'))
+    latest = connections[-1].updated_at if connections else since
+    return [connection_status_data(connection) for connection in connections], latest
+
+
+def _snapshot(user):
+    """Return all the user's status payloads plus the newest updated_at."""
+    from .views import connection_status_data
+    connections = list(PlatformConnection.objects.without_tokens().filter(user=user))
+    latest = max((connection.updated_at for connection in connections), default=None)
+    return [connection_status_data(connection) for connection in connections], latest
+
+
+def stream_settings():
+    return {
+        'backend': settings.OAUTH_STATUS_STREAM_BACKEND,
+        'heartbeat': settings.OAUTH_STATUS_STREAM_HEARTBEAT_SECONDS,
+        'poll_interval': settings.OAUTH_STATUS_STREAM_POLL_SECONDS,
+        'max_duration': settings.OAUTH_STATUS_STREAM_MAX_SECONDS,
+    }
+
+
+def iter_status_events(user):
+    """
+    Yield SSE frames for a user's status changes (sync servers).
+    
+    The stream ends after ``max_duration`` so it can't pin a sync worker
+    forever; EventSource reconnects on its own after ``retry`` milliseconds.
+    """
+    config = stream_settings()
+    deadline = time.monotonic() + config['max_duration']
+    polling = config['backend'] == 'poll'
+    
+    # Subscribe before taking the snapshot so no change can fall in between
+    subscription = None if polling else broker.subscribe(user.pk, Subscription())
+    try:
+        payloads, latest = _snapshot(user)
+        yield f"retry: {config['heartbeat'] * 1000}\n\n"
+        for payload in payloads:
+            yield format_event(payload)
+        
+        while time.monotonic() < deadline:
+            if polling:
+                time.sleep(config['poll_interval'])
+                payloads, latest = _changed_since(user, latest) if latest else _snapshot(user)
+            else:
+                payload = subscription.get(timeout=config['heartbeat'])
+                payloads = [payload] if payload else []
+            for payload in payloads:
+                yield format_event(payload)
+            if not payloads:
+                yield ": keep-alive\n\n"
+    finally:
+        if subscription:
+            broker.unsubscribe(user.pk, subscription)
+
+
+async def aiter_status_events(user):
+    """Async counterpart of iter_status_events() for ASGI servers."""
+    config = stream_settings()
+    deadline = time.monotonic() + config['max_duration']
+    polling = config['backend'] == 'poll'
+    
+    subscription = None if polling else broker.subscribe(user.pk, AsyncSubscription())
+    try:
+        payloads, latest = await sync_to_async(_snapshot)(user)
+        yield f"retry: {config['heartbeat'] * 1000}\n\n"
+        for payload in payloads:
+            yield format_event(payload)
+        
+        while time.monotonic() < deadline:
+            if polling:
+                await asyncio.sleep(config['poll_interval'])
+                if latest:
+                    payloads, latest = await sync_to_async(_changed_since)(user, latest)
+                else:
+                    payloads, latest = await sync_to_async(_snapshot)(user)
+            else:
+                payload = await subscription.get(timeout=config['heartbeat'])
+                payloads = [payload] if payload else []
+            for payload in payloads:
+                yield format_event(payload)
+            if not payloads:
+                yield ": keep-alive\n\n"
+    finally:
+        if subscription:
+            broker.unsubscribe(user.pk, subscription)
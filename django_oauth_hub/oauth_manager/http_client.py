@@ -0,0 +1,239 @@
+"""
+Pooled HTTP client for OAuth provider calls.
+
+Each worker process keeps one keep-alive ``requests.Session`` per platform so
+token exchanges and user-info lookups reuse TCP/TLS connections instead of
+paying a fresh handshake on every callback. The ``a*`` functions are the
+httpx-based equivalents used by the async views. Every request passes through
+the platform's rate limit (``rate_limit``) and its circuit breaker and
+bulkhead (``resilience``).
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+from .providers import get_provider, get_registry
+from .rate_limit import RateLimited, retry_after_seconds
+from .request_metrics import record_provider_call
+from .resilience import get_guard
+
+logger = logging.getLogger(__name__)
+
+_sessions = {}
+_sessions_pid = None
+_lock = threading.Lock()
+
+# Async clients are bound to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_http_config(platform):
+    """Return the HTTP settings for a platform, merged over the defaults."""
+    provider = get_provider(platform)
+    return provider.http if provider else settings.OAUTH_HTTP_DEFAULTS
+
+
+def get_timeout(platform):
+    """Return the ``(connect, read)`` timeout tuple for a platform."""
+    config = get_http_config(platform)
+    return (config['connect_timeout'], config['read_timeout'])
+
+
+def _build_session(platform):
+    config = get_http_config(platform)
+    session = requests.Session()
+    # Retries are handled in get() so they apply only to idempotent calls
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config['pool_size'], max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept': 'application/json'})
+    return session
+
+
+def get_session(platform):
+    """Return this worker's pooled session for a platform."""
+    global _sessions_pid
+    with _lock:
+        # Sessions must not be shared across a fork (e.g. gunicorn --preload)
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        session = _sessions.get(platform)
+        if session is None:
+            session = _sessions[platform] = _build_session(platform)
+        return session
+
+
+def close_sessions():
+    """Close and forget every pooled session in this process."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def get_rate_limit(platform, endpoint):
+    """Return the configured RateLimit for a platform endpoint, if any."""
+    provider = get_provider(platform)
+    return provider.rate_limits.get(endpoint) if provider and endpoint else None
+
+
+def _check_throttled(platform, endpoint, limit, response):
+    """Turn a provider 429 into RateLimited, holding our bucket for Retry-After."""
+    if endpoint and response.status_code == 429:
+        retry_after = retry_after_seconds(response)
+        if limit:
+            limit.penalize(retry_after)
+        logger.warning(f"{platform} throttled {endpoint} requests, retry in {retry_after:.1f}s")
+        metrics.provider_throttled.labels(platform, endpoint).inc()
+        raise RateLimited(platform, endpoint, retry_after)
+    return response
+
+
+def _record(platform, endpoint, start, response):
+    elapsed = time.perf_counter() - start
+    record_provider_call(elapsed)
+    metrics.observe_provider_call(platform, endpoint, elapsed, response.status_code if response is not None else None)
+
+
+def _send(platform, endpoint, request):
+    """Send one request inside the platform's circuit breaker and bulkhead."""
+    with get_guard(platform).call() as call:
+        start = time.perf_counter()
+        response = None
+        try:
+            response = request()
+        finally:
+            _record(platform, endpoint, start, response)
+        call.ok = response.status_code < 500
+    return response
+
+
+async def _asend(platform, endpoint, request):
+    async with get_guard(platform).acall() as call:
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await request()
+        finally:
+            _record(platform, endpoint, start, response)
+        call.ok = response.status_code < 500
+    return response
+
+
+def post(platform, url, endpoint=None, **kwargs):
+    """
+    POST to a provider. Never retried: authorization codes are single use,
+    so a replayed token exchange would fail anyway.
+    
+    With an ``endpoint`` ('token', 'refresh') the call goes through that
+    endpoint's rate limit and a 429 raises RateLimited.
+    """
+    limit = get_rate_limit(platform, endpoint)
+    if limit:
+        limit.acquire()
+    kwargs.setdefault('timeout', get_timeout(platform))
+    response = _send(platform, endpoint, lambda: get_session(platform).post(url, **kwargs))
+    return _check_throttled(platform, endpoint, limit, response)
+
+
+def get(platform, url, endpoint=None, **kwargs):
+    """GET from a provider, retrying connection errors and 5xx with jittered backoff."""
+    config = get_http_config(platform)
+    limit = get_rate_limit(platform, endpoint)
+    kwargs.setdefault('timeout', get_timeout(platform))
+    session = get_session(platform)
+    
+    attempt = 0
+    while True:
+        try:
+            if limit:
+                limit.acquire()
+            response = _send(platform, endpoint, lambda: session.get(url, **kwargs))
+            response = _check_throttled(platform, endpoint, limit, response)
+            if response.status_code not in config['retry_statuses'] or attempt >= config['retries']:
+                return response
+            logger.warning(f"{platform} returned {response.status_code} for GET {url}, retrying")
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt >= config['retries']:
+                raise
+            logger.warning(f"Network error on GET {url} for {platform}: {e}, retrying")
+        
+        # Full jitter keeps retries from many workers from synchronizing
+        time.sleep(random.uniform(0, config['backoff'] * (2 ** attempt)))
+        attempt += 1
+
+
+def prewarm():
+    """Open a keep-alive connection to every configured provider's token host."""
+    for provider in get_registry().values():
+        if not provider.is_configured:
+            continue
+        parsed = urlparse(provider.token_url)
+        try:
+            get_session(provider.key).head(f"{parsed.scheme}://{parsed.netloc}/", timeout=provider.timeout)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Failed to pre-warm connection to {provider.key}: {e}")
+
+
+def get_async_client(platform):
+    """Return the pooled ``httpx.AsyncClient`` for a platform on the running loop."""
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(platform)
+    if client is None or client.is_closed:
+        config = get_http_config(platform)
+        client = clients[platform] = httpx.AsyncClient(
+            timeout=httpx.Timeout(config['read_timeout'], connect=config['connect_timeout']),
+            limits=httpx.Limits(
+                max_connections=config['pool_size'],
+                max_keepalive_connections=config['pool_size'],
+            ),
+            headers={'Accept': 'application/json'},
+        )
+    return client
+
+
+async def apost(platform, url, endpoint=None, **kwargs):
+    """Async counterpart of post(); never retried."""
+    limit = get_rate_limit(platform, endpoint)
+    if limit:
+        await limit.aacquire()
+    response = await _asend(platform, endpoint, lambda: get_async_client(platform).post(url, **kwargs))
+    return _check_throttled(platform, endpoint, limit, response)
+
+
+async def aget(platform, url, endpoint=None, **kwargs):
+    """Async counterpart of get(), with the same jittered retry policy."""
+    config = get_http_config(platform)
+    limit = get_rate_limit(platform, endpoint)
+    client = get_async_client(platform)
+    
+    attempt = 0
+    while True:
+        try:
+            if limit:
+                await limit.aacquire()
+            response = await _asend(platform, endpoint, lambda: client.get(url, **kwargs))
+            response = _check_throttled(platform, endpoint, limit, response)
+            if response.status_code not in config['retry_statuses'] or attempt >= config['retries']:
+                return response
+            logger.warning(f"{platform} returned {response.status_code} for GET {url}, retrying")
+        except (httpx.ConnectError, httpx.TimeoutException) as e:
+            if attempt >= config['retries']:
+                raise
+            logger.warning(f"Network error on GET {url} for {platform}: {e}, retrying")
+        
+        await asyncio.sleep(random.uniform(0, config['backoff'] * (2 ** attempt)))
+        attempt += 1
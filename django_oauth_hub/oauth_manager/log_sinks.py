@@ -0,0 +1,163 @@
+"""
+Pluggable sinks for connection audit events.
+
+``log_connection_event`` hands every event to the sink configured in
+``settings.CONNECTION_LOG_SINK``. The default sink buffers events in memory and
+writes them with a single ``bulk_create``; the buffer is flushed when it fills
+up, when ``flush_interval`` has elapsed, at the end of every request and at
+interpreter shutdown. If the batch fails (e.g. one event's connection has been
+deleted in the meantime), its events are retried one by one so only the bad
+ones are dropped.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.signals import request_finished, setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class BaseLogSink:
+    """Interface for connection event sinks."""
+    
+    def emit(self, event):
+        """Record one event dict (see log_connection_event for its keys)."""
+        raise NotImplementedError
+    
+    def flush(self):
+        """Write out anything buffered."""
+    
+    def close(self):
+        self.flush()
+
+
+class DatabaseSink(BaseLogSink):
+    """Write each event immediately as its own ConnectionLog row."""
+    
+    def emit(self, event):
+        from .models import ConnectionLog
+        ConnectionLog.objects.create(**event)
+
+
+class BufferedDatabaseSink(BaseLogSink):
+    """Buffer events and write them to ConnectionLog with bulk_create."""
+    
+    def __init__(self, batch_size=100, flush_interval=2.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+    
+    def emit(self, event):
+        from .models import ConnectionLog
+        with self._lock:
+            self._buffer.append(ConnectionLog(**event))
+            due = (
+                len(self._buffer) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+    
+    def flush(self):
+        from .models import ConnectionLog
+        with self._lock:
+            pending, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            ConnectionLog.objects.bulk_create(pending, batch_size=self.batch_size)
+        except Exception as e:
+            logger.warning(f"Failed to write {len(pending)} connection log events at once, retrying one by one: {e}")
+            self._write_each(pending)
+    
+    def _write_each(self, pending):
+        dropped = 0
+        for log in pending:
+            log.pk = None  # bulk_create may have assigned ids before rolling back
+            try:
+                with transaction.atomic():
+                    log.save(force_insert=True)
+            except Exception as e:
+                dropped += 1
+                logger.error(f"Dropped {log.action} event for connection {log.connection_id}: {e}")
+        if dropped:
+            logger.error(f"Dropped {dropped} of {len(pending)} connection log events")
+
+
+class JSONLFileSink(BaseLogSink):
+    """Append events as JSON lines to size-rotated local files."""
+    
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, backup_count=10):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True,
+        )
+    
+    def emit(self, event):
+        connection = event['connection']
+        record = {
+            'created_at': event['created_at'].isoformat(),
+            'connection_id': connection.pk,
+            'user_id': connection.user_id,
+            'platform': connection.platform,
+            'action': event['action'],
+            'details': event['details'],
+            'ip_address': event['ip_address'],
+            'user_agent': event['user_agent'],
+        }
+        self._handler.emit(logging.makeLogRecord({'msg': json.dumps(record), 'levelno': logging.INFO}))
+    
+    def flush(self):
+        self._handler.flush()
+    
+    def close(self):
+        self._handler.close()
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_log_sink():
+    """Return the process-wide sink configured by CONNECTION_LOG_SINK."""
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                config = settings.CONNECTION_LOG_SINK
+                _sink = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _sink
+
+
+@receiver(request_finished, dispatch_uid='oauth_manager.flush_log_sink')
+def flush_log_sink(**kwargs):
+    """Flush buffered events once the response has been produced."""
+    if _sink is not None:
+        _sink.flush()
+
+
+@receiver(setting_changed, dispatch_uid='oauth_manager.reset_log_sink')
+def reset_log_sink(setting=None, **kwargs):
+    global _sink
+    if setting == 'CONNECTION_LOG_SINK' and _sink is not None:
+        _sink.close()
+        _sink = None
+
+
+@atexit.register
+def _close_log_sink():
+    if _sink is not None:
+        _sink.close()
@@ -0,0 +1,114 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils import timezone
+
+from oauth_manager import archive
+from oauth_manager.models import ConnectionLog
+from oauth_manager.utils import delete_in_batches
+
+# Partitions kept open at once; rows are read in pk order, which only roughly
+# follows created_at, so a date seen again after being closed gets a new part.
+MAX_OPEN_PARTITIONS = 4
+
+
+class Command(BaseCommand):
+    help = 'Move connection logs older than the retention period into compressed JSONL archives.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int, default=settings.CONNECTION_LOG_RETENTION_DAYS,
+            help='Archive rows created more than this many days ago.',
+        )
+        parser.add_argument(
+            '--output-dir', default=settings.CONNECTION_LOG_ARCHIVE_DIR,
+            help='Directory the date-partitioned archive files are written under.',
+        )
+        parser.add_argument(
+            '--compression', choices=sorted(archive.EXTENSIONS), default=archive.default_compression(),
+            help='Archive compression (zstd needs the zstandard package).',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Rows fetched from the database per round trip while streaming.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Maximum number of rows deleted per statement once archived.',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0.1,
+            help='Seconds to pause between delete batches.',
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Write and verify the archives but leave the rows in place.',
+        )
+    
+    def handle(self, *args, **options):
+        if options['compression'] == 'zstd' and archive.zstandard is None:
+            raise CommandError('zstd compression needs the zstandard package')
+        
+        cutoff = timezone.now() - timezone.timedelta(days=options['older_than_days'])
+        # Pin the upper pk so rows written while we run can't slip into the delete
+        max_pk = ConnectionLog.objects.filter(created_at__lt=cutoff).aggregate(Max('pk'))['pk__max']
+        if max_pk is None:
+            self.stdout.write('No connection logs to archive')
+            return
+        queryset = ConnectionLog.objects.filter(created_at__lt=cutoff, pk__lte=max_pk)
+        
+        written = self.write_archives(
+            queryset,
+            Path(options['output_dir']),
+            options['compression'],
+            options['chunk_size'],
+        )
+        
+        total = sum(written.values())
+        expected = queryset.count()
+        if total != expected:
+            raise CommandError(f'Archived {total} rows but {expected} match; nothing was deleted')
+        for path, count in written.items():
+            if archive.count_lines(path) != count:
+                raise CommandError(f'{path} does not contain the {count} rows written to it; nothing was deleted')
+        
+        self.stdout.write(f"Archived {total} connection logs to {len(written)} files")
+        if options['keep']:
+            return
+        
+        deleted = delete_in_batches(queryset, batch_size=options['batch_size'], sleep=options['sleep'])
+        self.stdout.write(f"Deleted {deleted} archived connection logs")
+    
+    def write_archives(self, queryset, directory, compression, chunk_size):
+        """Stream rows into per-date files and return ``{path: rows written}``."""
+        run = timezone.now().strftime('%Y%m%dT%H%M%S')
+        written = {}
+        parts = {}
+        open_files = {}
+        
+        try:
+            rows = queryset.order_by('pk').values(*archive.FIELDS).iterator(chunk_size=chunk_size)
+            for row in rows:
+                day = archive.archive_date(row['created_at'])
+                partition = open_files.get(day)
+                if partition is None:
+                    if len(open_files) >= MAX_OPEN_PARTITIONS:
+                        oldest = min(open_files)
+                        open_files.pop(oldest)[1].close()
+                    parts[day] = parts.get(day, 0) + 1
+                    suffix = run if parts[day] == 1 else f'{run}_{parts[day]}'
+                    path = archive.archive_path(directory, day, suffix, compression)
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    partition = open_files[day] = (path, archive.open_archive(path, 'wt'))
+                    written[path] = 0
+                
+                path, f = partition
+                f.write(archive.serialize(row))
+                written[path] += 1
+        finally:
+            for _, f in open_files.values():
+                f.close()
+        
+        return written
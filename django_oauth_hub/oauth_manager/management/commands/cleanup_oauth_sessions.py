@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from oauth_manager.models import OAuthSession
+
+
+class Command(BaseCommand):
+    help = 'Delete expired and completed OAuth sessions in bounded batches.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.OAUTH_SESSION_CLEANUP_BATCH_SIZE,
+            help='Maximum number of rows deleted per statement.',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=settings.OAUTH_SESSION_CLEANUP_SLEEP,
+            help='Seconds to pause between batches.',
+        )
+        parser.add_argument(
+            '--retention-hours', type=float, default=settings.OAUTH_SESSION_RETENTION_HOURS,
+            help='Keep completed sessions for this many hours before deleting them.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Run continuously, sweeping every N seconds (0 runs once).',
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            count = OAuthSession.cleanup_expired_sessions(
+                batch_size=options['batch_size'],
+                sleep=options['sleep'],
+                completed_retention=timezone.timedelta(hours=options['retention_hours']),
+            )
+            self.stdout.write(f"Deleted {count} OAuth sessions")
+            
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from oauth_manager.models import PlatformConnection
+
+
+class Command(BaseCommand):
+    help = 'Mark connected platform connections whose access token has expired as expired, in bounded batches.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.OAUTH_TOKEN_EXPIRY_BATCH_SIZE,
+            help='Maximum number of rows updated per statement.',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=settings.OAUTH_TOKEN_EXPIRY_SLEEP,
+            help='Seconds to pause between batches.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Run continuously, sweeping every N seconds (0 runs once).',
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            count = PlatformConnection.objects.expire_lapsed(
+                batch_size=options['batch_size'],
+                sleep=options['sleep'],
+            )
+            self.stdout.write(f"Expired {count} platform connections")
+            
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,72 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.core.management.base import BaseCommand
+
+from oauth_manager.models import DataDeletionRequest
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Process data deletion requests whose grace period has ended, in bounded batches.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=50,
+            help='Maximum number of requests processed per run.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.OAUTH_DATA_DELETION_BATCH_SIZE,
+            help='Maximum number of rows deleted per statement.',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=settings.OAUTH_DATA_DELETION_SLEEP,
+            help='Seconds to pause between batches.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Run continuously, checking for due requests every N seconds (0 runs once).',
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            completed = failed = 0
+            for deletion in DataDeletionRequest.due().select_related('user')[:options['limit']]:
+                try:
+                    deletion.process(batch_size=options['batch_size'], sleep=options['sleep'])
+                except Exception as e:
+                    # Progress is checkpointed, so the next run resumes this request
+                    logger.error(f"Failed to process data deletion request {deletion.pk} at stage '{deletion.stage}': {e}")
+                    failed += 1
+                    continue
+                completed += 1
+                self.notify_admin(deletion)
+            self.stdout.write(f"Completed {completed} data deletion requests, {failed} failed")
+            
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+    
+    def notify_admin(self, deletion):
+        admin_email = getattr(settings, 'ADMIN_EMAIL', None)
+        if not admin_email:
+            return
+        send_mail(
+            subject=f'Data Deletion Completed - {deletion.user.username}',
+            message=f'''Data deletion request completed:
+
+User: {deletion.user.username}
+Email: {deletion.user.email}
+Reason: {deletion.reason}
+Additional Info: {deletion.details}
+Requested: {deletion.requested_at}
+Completed: {deletion.completed_at}
+
+Deleted {deletion.connections_deleted} connections, {deletion.logs_deleted} connection logs and {deletion.sessions_deleted} OAuth sessions.''',
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=[admin_email],
+            fail_silently=True,
+        )
@@ -0,0 +1,64 @@
+import pstats
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from oauth_manager.profiling import PROFILE_SUFFIX
+
+SORT_KEYS = {
+    'cumulative': lambda row: row[3],
+    'tottime': lambda row: row[2],
+    'calls': lambda row: row[1],
+}
+
+
+def function_label(key):
+    filename, line, name = key
+    if filename == '~':
+        return name  # built-ins, e.g. <method 'execute' of 'sqlite3.Cursor' objects>
+    return f"{name} ({Path(filename).name}:{line})"
+
+
+class Command(BaseCommand):
+    help = 'Aggregate request profiles written by ProfilingMiddleware into a top-N hot-function report.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir', default=settings.OAUTH_PROFILING_DIR,
+            help='Directory holding the .prof files.',
+        )
+        parser.add_argument('--top', type=int, default=25, help='Number of functions to list.')
+        parser.add_argument(
+            '--sort', choices=sorted(SORT_KEYS), default='cumulative',
+            help='Rank functions by cumulative time, own time or call count.',
+        )
+        parser.add_argument(
+            '--match', default='',
+            help='Only aggregate profiles whose file name contains this, e.g. a view name.',
+        )
+    
+    def handle(self, *args, **options):
+        directory = Path(options['dir'])
+        files = sorted(
+            path for path in directory.glob(f"*{PROFILE_SUFFIX}") if options['match'] in path.name
+        )
+        if not files:
+            raise CommandError(f"No profiles found in {directory}")
+        
+        stats = pstats.Stats(*map(str, files))
+        rows = [
+            (key, calls, tottime, cumtime)
+            for key, (_, calls, tottime, cumtime, _) in stats.stats.items()
+        ]
+        rows.sort(key=SORT_KEYS[options['sort']], reverse=True)
+        
+        self.stdout.write(
+            f"Aggregated {len(files)} profiles, {stats.total_tt:.3f}s profiled, "
+            f"top {options['top']} by {options['sort']}:"
+        )
+        self.stdout.write(f"{'calls':>10} {'tottime':>10} {'cumtime':>10} {'per req':>10}  function")
+        for key, calls, tottime, cumtime in rows[:options['top']]:
+            self.stdout.write(
+                f"{calls:>10} {tottime:>10.4f} {cumtime:>10.4f} {cumtime / len(files):>10.4f}  {function_label(key)}"
+            )
@@ -0,0 +1,165 @@
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from oauth_manager import metrics
+from oauth_manager.log_sinks import get_log_sink
+from oauth_manager.models import PlatformConnection
+from oauth_manager.providers import get_provider, get_registry
+from oauth_manager.rate_limit import RateLimited
+from oauth_manager.resilience import ProviderUnavailable
+from oauth_manager.views import RefreshRejected, log_connection_event, refresh_access_token
+
+BACKOFF_KEY_PREFIX = 'oauth_hub:refresh_backoff'
+
+
+def backoff_key(connection_id):
+    return f'{BACKOFF_KEY_PREFIX}:{connection_id}'
+
+
+def backoff_seconds(failures):
+    """Exponential delay before retrying a connection after ``failures`` transient failures."""
+    return min(
+        settings.OAUTH_TOKEN_REFRESH_BACKOFF_SECONDS * 2 ** (failures - 1),
+        settings.OAUTH_TOKEN_REFRESH_MAX_BACKOFF_SECONDS,
+    )
+
+
+class Command(BaseCommand):
+    help = 'Refresh access tokens that expire within the horizon, before they lapse.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horizon-minutes', type=int, default=settings.OAUTH_TOKEN_REFRESH_HORIZON_MINUTES,
+            help='Refresh tokens expiring within this many minutes.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.OAUTH_TOKEN_REFRESH_BATCH_SIZE,
+            help='Number of connections loaded and refreshed per batch.',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.OAUTH_TOKEN_REFRESH_CONCURRENCY,
+            help='Default maximum concurrent refresh requests per platform.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Run continuously, scanning every N seconds (0 runs once).',
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            refreshed, failed = self.refresh_due_tokens(
+                horizon=timezone.timedelta(minutes=options['horizon_minutes']),
+                batch_size=options['batch_size'],
+                concurrency=options['concurrency'],
+            )
+            self.stdout.write(f"Refreshed {refreshed} tokens, {failed} failed")
+            
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+    
+    def refresh_due_tokens(self, horizon, batch_size, concurrency):
+        # Snapshot the due ids up front (soonest first) so a sweep works
+        # through a fixed set even as refreshed connections get new expiries.
+        # Providers without refresh support would only ever reject the request.
+        refreshable = [key for key, provider in get_registry().items() if provider.supports_refresh]
+        due_ids = list(
+            PlatformConnection.objects.filter(
+                platform__in=refreshable,
+                status__in=['connected', 'expired'],
+                token_expires_at__lte=timezone.now() + horizon,
+                encrypted_refresh_token__isnull=False,
+            )
+            .order_by('token_expires_at')
+            .values_list('pk', flat=True)
+        )
+        
+        refreshed = failed = 0
+        for start in range(0, len(due_ids), batch_size):
+            batch_ids = due_ids[start:start + batch_size]
+            # Skip connections still backing off after a transient failure
+            backing_off = cache.get_many([backoff_key(pk) for pk in batch_ids])
+            batch_ids = [pk for pk in batch_ids if backoff_key(pk) not in backing_off]
+            if not batch_ids:
+                continue
+            connections = PlatformConnection.objects.filter(pk__in=batch_ids)
+            batch_refreshed, batch_failed = self.refresh_batch(connections, concurrency)
+            refreshed += batch_refreshed
+            failed += batch_failed
+        
+        get_log_sink().flush()
+        return refreshed, failed
+    
+    def refresh_batch(self, connections, concurrency):
+        by_platform = defaultdict(list)
+        for connection in connections:
+            by_platform[connection.platform].append(connection)
+        
+        # Provider calls run in per-platform pools; DB writes stay on this thread
+        executors = []
+        pending = []
+        for platform, platform_connections in by_platform.items():
+            provider = get_provider(platform)
+            executor = ThreadPoolExecutor(
+                max_workers=provider.refresh_concurrency or concurrency,
+                thread_name_prefix=f'refresh-{platform}',
+            )
+            executors.append(executor)
+            for connection in platform_connections:
+                future = executor.submit(refresh_access_token, provider, connection.refresh_token)
+                pending.append((connection, future))
+        
+        refreshed = failed = 0
+        try:
+            for connection, future in pending:
+                try:
+                    token_data = future.result()
+                except (RateLimited, ProviderUnavailable) as e:
+                    # Left untouched so the next sweep picks it up again
+                    self.stderr.write(f"Deferred {connection.platform} connection {connection.pk}: {e}")
+                    metrics.token_refreshes.labels(connection.platform, 'deferred').inc()
+                    continue
+                except RefreshRejected as e:
+                    # The grant is gone; only the user reconnecting can fix this
+                    connection.set_error(f'Refresh token rejected ({e})')
+                    log_connection_event(connection, 'error', f'Token refresh rejected: {e}')
+                    metrics.token_refreshes.labels(connection.platform, 'failed').inc()
+                    failed += 1
+                    continue
+                if token_data and token_data.get('access_token'):
+                    connection.set_connected(
+                        access_token=token_data['access_token'],
+                        refresh_token=token_data.get('refresh_token') or connection.refresh_token,
+                        expires_in=token_data.get('expires_in'),
+                        scope=token_data.get('scope'),
+                    )
+                    log_connection_event(connection, 'token_refreshed', 'Access token refreshed by worker')
+                    metrics.token_refreshes.labels(connection.platform, 'refreshed').inc()
+                    refreshed += 1
+                else:
+                    # Transient (network error, 5xx, ...): the token may still be
+                    # valid, so keep the status and retry after a backoff
+                    delay = self.back_off(connection)
+                    self.stderr.write(f"Refresh of {connection.platform} connection {connection.pk} failed, retrying in {delay}s")
+                    metrics.token_refreshes.labels(connection.platform, 'retrying').inc()
+                    failed += 1
+        finally:
+            for executor in executors:
+                executor.shutdown()
+        
+        return refreshed, failed
+    
+    def back_off(self, connection):
+        failures = connection.error_count + 1
+        # update() leaves status and updated_at alone; set_connected resets the count
+        PlatformConnection.objects.filter(pk=connection.pk).update(error_count=F('error_count') + 1)
+        delay = backoff_seconds(failures)
+        cache.set(backoff_key(connection.pk), failures, delay)
+        return delay
@@ -0,0 +1,66 @@
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from oauth_manager import archive
+from oauth_manager.models import ConnectionLog, PlatformConnection
+
+
+class Command(BaseCommand):
+    help = 'Load archived connection logs for a date range back into the database.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('start', type=date.fromisoformat, help='First partition date (YYYY-MM-DD).')
+        parser.add_argument('end', type=date.fromisoformat, nargs='?', help='Last partition date (defaults to start).')
+        parser.add_argument(
+            '--input-dir', default=settings.CONNECTION_LOG_ARCHIVE_DIR,
+            help='Directory the archive files were written under.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows inserted per statement.',
+        )
+    
+    def handle(self, *args, **options):
+        start = options['start']
+        end = options['end'] or start
+        if end < start:
+            raise CommandError('end must not be before start')
+        
+        paths = archive.find_archives(Path(options['input_dir']), start, end)
+        if not paths:
+            self.stdout.write(f"No archives between {start} and {end}")
+            return
+        
+        restored = skipped = 0
+        for path in paths:
+            with archive.open_archive(path, 'rt') as f:
+                batch = []
+                for line in f:
+                    batch.append(archive.deserialize(line))
+                    if len(batch) >= options['batch_size']:
+                        batch_restored, batch_skipped = self.restore_batch(batch)
+                        restored += batch_restored
+                        skipped += batch_skipped
+                        batch = []
+                if batch:
+                    batch_restored, batch_skipped = self.restore_batch(batch)
+                    restored += batch_restored
+                    skipped += batch_skipped
+        
+        self.stdout.write(
+            f"Restored {restored} connection logs from {len(paths)} files "
+            f"({skipped} skipped because their connection no longer exists)"
+        )
+    
+    def restore_batch(self, records):
+        """Insert a batch keeping original ids, so restoring twice is a no-op."""
+        connection_ids = set(
+            PlatformConnection.objects.filter(pk__in={record['connection_id'] for record in records})
+            .values_list('pk', flat=True)
+        )
+        logs = [ConnectionLog(**record) for record in records if record['connection_id'] in connection_ids]
+        ConnectionLog.objects.bulk_create(logs, ignore_conflicts=True)
+        return len(logs), len(records) - len(logs)
@@ -0,0 +1,163 @@
+"""
+Prometheus metrics for the OAuth hub, served at ``/metrics``.
+
+Counters and histograms are updated in-process as requests are handled.
+When ``PROMETHEUS_MULTIPROC_DIR`` is set (gunicorn.conf.py sets it for
+gunicorn), every worker writes its samples to mmap-backed files in that
+directory and a scrape served by any worker aggregates them all. The
+``refresh_tokens`` worker only shows up if it shares that directory.
+
+State that already lives in the database or the shared cache (active OAuth
+sessions, connections per status, circuit breaker state) is read at scrape
+time instead, with the database counts cached for ``OAUTH_METRICS_DB_TTL``
+seconds so frequent scrapes stay cheap.
+"""
+
+import ipaddress
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+REGISTRY = CollectorRegistry()
+
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROVIDER_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30)
+
+# Keeps a client sending made-up methods from creating new label values
+HTTP_METHODS = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'])
+
+DB_STATE_KEY = 'oauth_hub:metrics:db_state'
+
+flows_started = Counter(
+    'oauth_hub_oauth_flows_started', 'OAuth flows sent to a provider.',
+    ['platform'], registry=REGISTRY,
+)
+flows_completed = Counter(
+    'oauth_hub_oauth_flows_completed', 'OAuth callbacks handled, by outcome.',
+    ['platform', 'outcome'], registry=REGISTRY,
+)
+provider_latency = Histogram(
+    'oauth_hub_provider_request_seconds', 'Provider HTTP call latency.',
+    ['platform', 'endpoint'], buckets=PROVIDER_BUCKETS, registry=REGISTRY,
+)
+provider_responses = Counter(
+    'oauth_hub_provider_responses', "Provider HTTP calls by status class ('error' when no response).",
+    ['platform', 'endpoint', 'status'], registry=REGISTRY,
+)
+provider_throttled = Counter(
+    'oauth_hub_provider_throttled', 'Provider calls answered with 429.',
+    ['platform', 'endpoint'], registry=REGISTRY,
+)
+provider_rejections = Counter(
+    'oauth_hub_provider_rejections', 'Provider calls refused locally by the circuit breaker or bulkhead.',
+    ['platform', 'reason'], registry=REGISTRY,
+)
+provider_in_flight = Gauge(
+    'oauth_hub_provider_in_flight', 'Provider calls in progress.',
+    ['platform'], multiprocess_mode='livesum', registry=REGISTRY,
+)
+connection_errors = Counter(
+    'oauth_hub_connection_errors', 'Connections put into the error state.',
+    ['platform'], registry=REGISTRY,
+)
+rate_limit_lock_timeouts = Counter(
+    'oauth_hub_rate_limit_lock_timeouts', 'Rate limiter calls that could not take the bucket lock, by decision.',
+    ['platform', 'endpoint', 'decision'], registry=REGISTRY,
+)
+token_refreshes = Counter(
+    'oauth_hub_token_refreshes', 'Token refreshes by the refresh worker, by result.',
+    ['platform', 'result'], registry=REGISTRY,
+)
+request_latency = Histogram(
+    'oauth_hub_request_seconds', 'Request latency by view.',
+    ['view', 'method'], buckets=REQUEST_BUCKETS, registry=REGISTRY,
+)
+
+
+def record_flow(platform, outcome):
+    flows_completed.labels(platform, outcome).inc()
+
+
+def observe_provider_call(platform, endpoint, elapsed, status_code=None):
+    endpoint = endpoint or 'other'
+    provider_latency.labels(platform, endpoint).observe(elapsed)
+    status = f'{status_code // 100}xx' if status_code else 'error'
+    provider_responses.labels(platform, endpoint, status).inc()
+
+
+def observe_request(view, method, duration):
+    method = method if method in HTTP_METHODS else 'other'
+    request_latency.labels(view or 'unresolved', method).observe(duration)
+
+
+def load_db_state():
+    """Active OAuth sessions and connections per (platform, status), cached briefly."""
+    state = cache.get(DB_STATE_KEY)
+    if state is None:
+        from .models import OAuthSession, PlatformConnection
+        state = {
+            'sessions': OAuthSession.objects.filter(
+                is_active=True,
+                created_at__gte=timezone.now() - OAuthSession.MAX_AGE,
+            ).count(),
+            'connections': [
+                (row['platform'], row['status'], row['count'])
+                for row in PlatformConnection.objects.values('platform', 'status').annotate(count=Count('pk')).order_by()
+            ],
+        }
+        cache.set(DB_STATE_KEY, state, settings.OAUTH_METRICS_DB_TTL)
+    return state
+
+
+class StateCollector:
+    """Gauges read from the database and the shared cache at scrape time."""
+    
+    def collect(self):
+        from .providers import get_registry
+        from .resilience import get_guard
+        
+        state = load_db_state()
+        
+        sessions = GaugeMetricFamily('oauth_hub_oauth_sessions_active', 'OAuth sessions started and not yet completed or expired.')
+        sessions.add_metric([], state['sessions'])
+        yield sessions
+        
+        connections = GaugeMetricFamily('oauth_hub_connections', 'Platform connections by status.', labels=['platform', 'status'])
+        for platform, status, count in state['connections']:
+            connections.add_metric([platform, status], count)
+        yield connections
+        
+        circuits = GaugeMetricFamily(
+            'oauth_hub_provider_circuit_state', 'Circuit breaker state (1 for the current one).',
+            labels=['platform', 'state'],
+        )
+        for platform in get_registry():
+            current = get_guard(platform).state()
+            for name in ('closed', 'open', 'half-open'):
+                circuits.add_metric([platform, name], 1 if name == current else 0)
+        yield circuits
+
+
+def render():
+    """Return the exposition text for a scrape."""
+    registry = CollectorRegistry()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(REGISTRY)
+    registry.register(StateCollector())
+    return generate_latest(registry)
+
+
+def is_allowed_address(address):
+    """Whether ``address`` is in one of the OAUTH_METRICS_ALLOWED_IPS networks."""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in ipaddress.ip_network(network, strict=False) for network in settings.OAUTH_METRICS_ALLOWED_IPS)
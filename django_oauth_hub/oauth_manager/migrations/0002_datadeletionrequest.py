@@ -0,0 +1,43 @@
+from django.db import migrations, models
+import django.db.models.deletion
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('oauth_manager', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataDeletionRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='pending', max_length=20)),
+                ('stage', models.CharField(blank=True, default='', max_length=20)),
+                ('reason', models.TextField(blank=True, default='')),
+                ('details', models.TextField(blank=True, default='')),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('user_agent', models.TextField(blank=True, null=True)),
+                ('requested_at', models.DateTimeField(auto_now_add=True)),
+                ('process_after', models.DateTimeField()),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('logs_deleted', models.IntegerField(default=0)),
+                ('sessions_deleted', models.IntegerField(default=0)),
+                ('connections_deleted', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='data_deletion_requests', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Data Deletion Request',
+                'verbose_name_plural': 'Data Deletion Requests',
+                'ordering': ['-requested_at'],
+                'indexes': [
+                    models.Index(fields=['status', 'process_after'], name='oauth_manag_deletion_due_idx'),
+                    models.Index(fields=['user', 'status'], name='oauth_manag_deletion_user_idx'),
+                ],
+            },
+        ),
+    ]
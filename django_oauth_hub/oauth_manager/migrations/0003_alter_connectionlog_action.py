@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oauth_manager', '0002_datadeletionrequest'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='connectionlog',
+            name='action',
+            field=models.CharField(choices=[('initiated', 'OAuth Initiated'), ('callback_received', 'Callback Received'), ('token_exchanged', 'Token Exchanged'), ('connected', 'Successfully Connected'), ('disconnected', 'Disconnected'), ('token_refreshed', 'Token Refreshed'), ('token_expired', 'Token Expired'), ('error', 'Error Occurred')], max_length=20),
+        ),
+    ]
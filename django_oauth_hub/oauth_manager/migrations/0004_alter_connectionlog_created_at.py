@@ -0,0 +1,17 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oauth_manager', '0003_alter_connectionlog_action'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='connectionlog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
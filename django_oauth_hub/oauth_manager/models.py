@@ -1,13 +1,123 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
-from cryptography.fernet import Fernet
-from django.conf import settings
 import json
 import logging
+import time
+from .crypto import decrypt_token, encrypt_token
+from . import metrics, status_cache
+from .signals import connection_status_changed
+from .utils import delete_in_batches
 
 logger = logging.getLogger(__name__)
 
+
+# Ciphertext columns, only needed by code that uses the tokens
+TOKEN_FIELDS = ['encrypted_access_token', 'encrypted_refresh_token']
+
+
+class PlatformConnectionQuerySet(models.QuerySet):
+    """Set-based helpers for loading a user's platform connections."""
+    
+    def without_tokens(self):
+        """
+        Defer the ciphertext columns and annotate ``access_token_stored``.
+        
+        Status reads (``is_connected``, ``connection_status_data``, the
+        dashboard) then neither transfer nor decrypt a token.
+        """
+        return self.defer(*TOKEN_FIELDS).annotate(
+            access_token_stored=models.ExpressionWrapper(
+                models.Q(encrypted_access_token__isnull=False) & ~models.Q(encrypted_access_token=''),
+                output_field=models.BooleanField(),
+            ),
+        )
+    
+    def for_dashboard(self, user):
+        """
+        Return ``{platform: connection}`` for every supported platform.
+        
+        Existing rows are fetched in a single SELECT and missing platforms are
+        bulk-created. Connections whose token has expired are shown as
+        ``expired`` without being saved; ``expire_lapsed`` persists that.
+        """
+        platforms = [key for key, _ in self.model.PLATFORM_CHOICES]
+        existing = {connection.platform: connection for connection in self.without_tokens().filter(user=user)}
+        
+        missing = [platform for platform in platforms if platform not in existing]
+        if missing:
+            # ignore_conflicts tolerates a concurrent request creating the same rows,
+            # but doesn't populate primary keys, so re-read what was inserted.
+            self.bulk_create(
+                [self.model(user=user, platform=platform, status='disconnected') for platform in missing],
+                ignore_conflicts=True,
+            )
+            existing.update(
+                (connection.platform, connection)
+                for connection in self.without_tokens().filter(user=user, platform__in=missing)
+            )
+            # Bulk operations don't send post_save
+            status_cache.invalidate(user.pk, missing)
+        
+        for connection in existing.values():
+            if connection.status == 'connected' and connection.is_token_expired:
+                connection.status = 'expired'
+        
+        return {platform: existing[platform] for platform in platforms if platform in existing}
+    
+    def expire_lapsed(self, batch_size=1000, sleep=0):
+        """
+        Mark connected rows whose token has expired as ``expired``.
+        
+        Each batch is one UPDATE over at most ``batch_size`` primary keys,
+        followed by a ``token_expired`` event per connection (written in bulk
+        by the log sink), a status change signal and status cache invalidation.
+        Returns the number of connections expired.
+        """
+        from .log_sinks import get_log_sink
+        from .views import log_connection_event
+        
+        total = 0
+        while True:
+            now = timezone.now()
+            lapsed = self.filter(status='connected', token_expires_at__lt=now)
+            batch = list(
+                lapsed.defer(*TOKEN_FIELDS)
+                .order_by('token_expires_at')[:batch_size]
+            )
+            if not batch:
+                break
+            
+            # Conditions repeated so a token refreshed since the SELECT is left alone
+            lapsed.filter(pk__in=[connection.pk for connection in batch]).update(status='expired', updated_at=now)
+            expired = set(self.filter(
+                pk__in=[connection.pk for connection in batch], status='expired', updated_at=now,
+            ).values_list('pk', flat=True))
+            
+            by_user = {}
+            for connection in batch:
+                if connection.pk not in expired:
+                    continue
+                connection.status = 'expired'
+                connection.updated_at = now
+                by_user.setdefault(connection.user_id, []).append(connection.platform)
+                log_connection_event(connection, 'token_expired', f'Token expired at {connection.token_expires_at.isoformat()}')
+                connection_status_changed.send(sender=self.model, connection=connection)
+            # update() doesn't send post_save
+            for user_id, platforms in by_user.items():
+                status_cache.invalidate(user_id, platforms)
+            get_log_sink().flush()
+            
+            total += len(expired)
+            if len(batch) < batch_size:
+                break
+            if sleep:
+                time.sleep(sleep)
+        
+        logger.info(f"Expired {total} platform connections")
+        return total
+
+
 class PlatformConnection(models.Model):
     """Model to store OAuth connections for different social media platforms."""
     
@@ -55,6 +165,8 @@ class PlatformConnection(models.Model):
     last_error_message = models.TextField(blank=True, null=True)
     error_count = models.IntegerField(default=0)
     
+    objects = PlatformConnectionQuerySet.as_manager()
+    
     class Meta:
         unique_together = ['user', 'platform']
         verbose_name = 'Platform Connection'
@@ -68,10 +180,23 @@ class PlatformConnection(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.get_platform_display()} ({self.status})"
     
+    def __getstate__(self):
+        # Instances get pickled into the cache; never include plaintext tokens
+        state = super().__getstate__()
+        state.pop('_decrypted_tokens', None)
+        return state
+    
+    @property
+    def has_access_token(self):
+        """Whether an access token is stored, answered without decrypting it."""
+        if 'access_token_stored' in self.__dict__:
+            return self.access_token_stored  # annotated by without_tokens()
+        return bool(self.encrypted_access_token)
+    
     @property
     def is_connected(self):
         """Check if the connection is active and valid."""
-        return self.status == 'connected' and self.access_token and not self.is_token_expired
+        return self.status == 'connected' and self.has_access_token and not self.is_token_expired
     
     @property
     def is_token_expired(self):
@@ -80,55 +205,60 @@ class PlatformConnection(models.Model):
             return False
         return timezone.now() > self.token_expires_at
     
-    @property
-    def access_token(self):
-        """Decrypt and return the access token."""
-        if not self.encrypted_access_token:
+    def _get_token(self, field_name, label):
+        """Decrypt a token field, memoizing the plaintext per instance."""
+        ciphertext = getattr(self, field_name)
+        if not ciphertext:
             return None
+        # Keyed on the ciphertext so direct writes to the encrypted field
+        # (or refresh_from_db) can never serve a stale plaintext.
+        cache = self.__dict__.setdefault('_decrypted_tokens', {})
+        cached = cache.get(field_name)
+        if cached and cached[0] == ciphertext:
+            return cached[1]
         try:
-            fernet = Fernet(settings.ENCRYPTION_KEY)
-            return fernet.decrypt(self.encrypted_access_token.encode()).decode()
+            value = decrypt_token(ciphertext)
         except Exception as e:
-            logger.error(f"Failed to decrypt access token for {self}: {e}")
+            logger.error(f"Failed to decrypt {label} for {self}: {e}")
             return None
+        cache[field_name] = (ciphertext, value)
+        return value
     
-    @access_token.setter
-    def access_token(self, value):
-        """Encrypt and store the access token."""
+    def _set_token(self, field_name, label, value):
+        """Encrypt and store a token field, priming the per-instance cache."""
+        cache = self.__dict__.setdefault('_decrypted_tokens', {})
+        cache.pop(field_name, None)
+        self.__dict__.pop('access_token_stored', None)
         if not value:
-            self.encrypted_access_token = None
+            setattr(self, field_name, None)
             return
         try:
-            fernet = Fernet(settings.ENCRYPTION_KEY)
-            self.encrypted_access_token = fernet.encrypt(value.encode()).decode()
+            ciphertext = encrypt_token(value)
         except Exception as e:
-            logger.error(f"Failed to encrypt access token for {self}: {e}")
+            logger.error(f"Failed to encrypt {label} for {self}: {e}")
             raise
+        setattr(self, field_name, ciphertext)
+        cache[field_name] = (ciphertext, value)
+    
+    @property
+    def access_token(self):
+        """Decrypt and return the access token."""
+        return self._get_token('encrypted_access_token', 'access token')
+    
+    @access_token.setter
+    def access_token(self, value):
+        """Encrypt and store the access token."""
+        self._set_token('encrypted_access_token', 'access token', value)
     
     @property
     def refresh_token(self):
         """Decrypt and return the refresh token."""
-        if not self.encrypted_refresh_token:
-            return None
-        try:
-            fernet = Fernet(settings.ENCRYPTION_KEY)
-            return fernet.decrypt(self.encrypted_refresh_token.encode()).decode()
-        except Exception as e:
-            logger.error(f"Failed to decrypt refresh token for {self}: {e}")
-            return None
+        return self._get_token('encrypted_refresh_token', 'refresh token')
     
     @refresh_token.setter
     def refresh_token(self, value):
         """Encrypt and store the refresh token."""
-        if not value:
-            self.encrypted_refresh_token = None
-            return
-        try:
-            fernet = Fernet(settings.ENCRYPTION_KEY)
-            self.encrypted_refresh_token = fernet.encrypt(value.encode()).decode()
-        except Exception as e:
-            logger.error(f"Failed to encrypt refresh token for {self}: {e}")
-            raise
+        self._set_token('encrypted_refresh_token', 'refresh token', value)
     
     def set_connected(self, access_token, refresh_token=None, expires_in=None, user_info=None, scope=None):
         """Set the connection as connected with token data."""
@@ -137,6 +267,9 @@ class PlatformConnection(models.Model):
         
         if expires_in:
             self.token_expires_at = timezone.now() + timezone.timedelta(seconds=expires_in)
+        else:
+            # The new token's lifetime is unknown; don't keep the previous one's expiry
+            self.token_expires_at = None
         
         if user_info:
             self.platform_user_id = user_info.get('id')
@@ -151,6 +284,7 @@ class PlatformConnection(models.Model):
         self.last_error_message = None
         self.error_count = 0
         self.save()
+        connection_status_changed.send(sender=PlatformConnection, connection=self)
     
     def set_error(self, error_message):
         """Set the connection as error state."""
@@ -158,6 +292,8 @@ class PlatformConnection(models.Model):
         self.last_error_message = error_message
         self.error_count += 1
         self.save()
+        metrics.connection_errors.labels(self.platform).inc()
+        connection_status_changed.send(sender=PlatformConnection, connection=self)
     
     def disconnect(self):
         """Disconnect and clear all token data."""
@@ -172,6 +308,7 @@ class PlatformConnection(models.Model):
         self.last_error_message = None
         self.error_count = 0
         self.save()
+        connection_status_changed.send(sender=PlatformConnection, connection=self)
 
 
 class OAuthSession(models.Model):
@@ -187,6 +324,9 @@ class OAuthSession(models.Model):
     completed_at = models.DateTimeField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
     
+    # Sessions not completed within this window are rejected and swept
+    MAX_AGE = timezone.timedelta(hours=1)
+    
     class Meta:
         verbose_name = 'OAuth Session'
         verbose_name_plural = 'OAuth Sessions'
@@ -205,14 +345,33 @@ class OAuthSession(models.Model):
         self.is_active = False
         self.save()
     
+    @property
+    def is_expired(self):
+        """Check if the session is too old to complete."""
+        return timezone.now() - self.created_at > self.MAX_AGE
+    
     @classmethod
-    def cleanup_expired_sessions(cls):
-        """Remove sessions older than 1 hour."""
-        cutoff = timezone.now() - timezone.timedelta(hours=1)
-        expired_sessions = cls.objects.filter(created_at__lt=cutoff, is_active=True)
-        count = expired_sessions.count()
-        expired_sessions.delete()
+    def cleanup_expired_sessions(cls, batch_size=1000, sleep=0, completed_retention=None):
+        """
+        Remove abandoned sessions older than ``MAX_AGE`` and, when
+        ``completed_retention`` is given, inactive sessions older than it.
+        
+        Rows are deleted in primary-key chunks of ``batch_size``.
+        """
+        now = timezone.now()
+        expired_sessions = cls.objects.filter(created_at__lt=now - cls.MAX_AGE, is_active=True)
+        count = delete_in_batches(expired_sessions, batch_size=batch_size, sleep=sleep)
         logger.info(f"Cleaned up {count} expired OAuth sessions")
+        
+        if completed_retention is not None:
+            cutoff = now - completed_retention
+            completed_sessions = cls.objects.filter(is_active=False).filter(
+                models.Q(completed_at__lt=cutoff) | models.Q(completed_at__isnull=True, created_at__lt=cutoff)
+            )
+            completed = delete_in_batches(completed_sessions, batch_size=batch_size, sleep=sleep)
+            logger.info(f"Cleaned up {completed} completed OAuth sessions")
+            count += completed
+        
         return count
 
 
@@ -226,6 +385,7 @@ class ConnectionLog(models.Model):
         ('connected', 'Successfully Connected'),
         ('disconnected', 'Disconnected'),
         ('token_refreshed', 'Token Refreshed'),
+        ('token_expired', 'Token Expired'),
         ('error', 'Error Occurred'),
     ]
     
@@ -234,7 +394,8 @@ class ConnectionLog(models.Model):
     details = models.TextField(blank=True, null=True)  # JSON data or error message
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by the sink from when the event happened, not when a buffered batch is written
+    created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         verbose_name = 'Connection Log'
@@ -246,4 +407,125 @@ class ConnectionLog(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"{self.connection} - {self.get_action_display()} - {self.created_at}"
\ No newline at end of file
+        return f"{self.connection} - {self.get_action_display()} - {self.created_at}"
+
+
+class DataDeletionRequest(models.Model):
+    """A user's request to have their connection data deleted."""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    
+    # Run in order; ``stage`` is the last one finished, so an interrupted
+    # request resumes after it. Tokens are scrubbed first so credentials are
+    # gone even if the deletes take several runs.
+    STAGES = ['tokens', 'logs', 'sessions', 'connections']
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='data_deletion_requests')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    stage = models.CharField(max_length=20, blank=True, default='')
+    reason = models.TextField(blank=True, default='')
+    details = models.TextField(blank=True, default='')
+    ip_address = models.GenericIPAddressField(blank=True, null=True)
+    user_agent = models.TextField(blank=True, null=True)
+    
+    requested_at = models.DateTimeField(auto_now_add=True)
+    process_after = models.DateTimeField()  # end of the grace period
+    started_at = models.DateTimeField(blank=True, null=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    
+    # Progress, saved after every deleted batch
+    logs_deleted = models.IntegerField(default=0)
+    sessions_deleted = models.IntegerField(default=0)
+    connections_deleted = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Data Deletion Request'
+        verbose_name_plural = 'Data Deletion Requests'
+        indexes = [
+            models.Index(fields=['status', 'process_after'], name='oauth_manag_deletion_due_idx'),
+            models.Index(fields=['user', 'status'], name='oauth_manag_deletion_user_idx'),
+        ]
+        ordering = ['-requested_at']
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.get_status_display()} ({self.requested_at:%Y-%m-%d})"
+    
+    @classmethod
+    def due(cls):
+        """Requests past their grace period that haven't finished, oldest first."""
+        return cls.objects.filter(
+            status__in=['pending', 'processing'],
+            process_after__lte=timezone.now(),
+        ).order_by('process_after', 'pk')
+    
+    def process(self, batch_size=1000, sleep=0):
+        """
+        Delete the user's tokens, connection logs, OAuth sessions and
+        connections with set-based statements.
+        
+        Rows are deleted in primary-key chunks of ``batch_size`` and progress
+        is checkpointed after every chunk and stage.
+        """
+        if self.status == 'pending':
+            self.status = 'processing'
+            self.started_at = timezone.now()
+            self.save(update_fields=['status', 'started_at'])
+        
+        done = self.STAGES.index(self.stage) + 1 if self.stage else 0
+        for stage in self.STAGES[done:]:
+            getattr(self, f'_delete_{stage}')(batch_size, sleep)
+            self.stage = stage
+            self.save(update_fields=['stage'])
+        
+        self.status = 'completed'
+        self.completed_at = timezone.now()
+        self.save(update_fields=['status', 'completed_at'])
+        logger.info(
+            f"Deleted data for user {self.user_id}: {self.connections_deleted} connections, "
+            f"{self.logs_deleted} logs, {self.sessions_deleted} OAuth sessions"
+        )
+    
+    def _checkpoint(self, field):
+        def record(deleted):
+            setattr(self, field, getattr(self, field) + deleted)
+            type(self).objects.filter(pk=self.pk).update(**{field: models.F(field) + deleted})
+        return record
+    
+    def _delete_tokens(self, batch_size, sleep):
+        PlatformConnection.objects.filter(user_id=self.user_id).update(
+            status='disconnected',
+            encrypted_access_token=None,
+            encrypted_refresh_token=None,
+            token_expires_at=None,
+            platform_user_id=None,
+            platform_username=None,
+            platform_email=None,
+            scope_granted=None,
+            last_error_message=None,
+            updated_at=timezone.now(),
+        )
+        # update() doesn't send post_save
+        status_cache.invalidate(self.user_id)
+    
+    def _delete_logs(self, batch_size, sleep):
+        delete_in_batches(
+            ConnectionLog.objects.filter(connection__user_id=self.user_id),
+            batch_size=batch_size, sleep=sleep, on_batch=self._checkpoint('logs_deleted'),
+        )
+    
+    def _delete_sessions(self, batch_size, sleep):
+        delete_in_batches(
+            OAuthSession.objects.filter(user_id=self.user_id),
+            batch_size=batch_size, sleep=sleep, on_batch=self._checkpoint('sessions_deleted'),
+        )
+    
+    def _delete_connections(self, batch_size, sleep):
+        delete_in_batches(
+            PlatformConnection.objects.filter(user_id=self.user_id),
+            batch_size=batch_size, sleep=sleep, on_batch=self._checkpoint('connections_deleted'),
+        )
@@ -0,0 +1,122 @@
+"""
+Opt-in cProfile profiling of sampled requests.
+
+With ``OAUTH_PROFILING_ENABLED`` off (the default) the middleware removes
+itself from the stack at startup, so it costs nothing. When on, it profiles:
+
+- a random ``OAUTH_PROFILING_SAMPLE_RATE`` fraction of requests,
+- every request whose path starts with one of ``OAUTH_PROFILING_PATHS``,
+- requests sending ``X-Profile-Request: <OAUTH_PROFILING_HEADER_TOKEN>``.
+
+Each profile is written as a ``.prof`` file (readable by pstats, snakeviz,
+...) to ``OAUTH_PROFILING_DIR``, which is kept to the newest
+``OAUTH_PROFILING_MAX_FILES`` files. ``python manage.py profile_report``
+aggregates them into a hot-function report.
+"""
+
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE_REQUEST'
+PROFILE_SUFFIX = '.prof'
+
+
+def should_profile(request):
+    """Whether this request was picked for profiling."""
+    token = settings.OAUTH_PROFILING_HEADER_TOKEN
+    if token and hmac.compare_digest(request.META.get(PROFILE_HEADER, ''), token):
+        return True
+    if any(request.path.startswith(prefix) for prefix in settings.OAUTH_PROFILING_PATHS):
+        return True
+    return random.random() < settings.OAUTH_PROFILING_SAMPLE_RATE
+
+
+def profile_filename(request, duration):
+    label = request.resolver_match.view_name if request.resolver_match else request.path
+    slug = re.sub(r'[^\w.-]+', '_', label).strip('_')[:60] or 'root'
+    return f"{timezone.now():%Y%m%dT%H%M%S%f}-{os.getpid()}-{slug}-{duration * 1000:.0f}ms{PROFILE_SUFFIX}"
+
+
+def prune(directory, keep):
+    """Delete all but the ``keep`` newest profiles in ``directory``."""
+    profiles = sorted(directory.glob(f'*{PROFILE_SUFFIX}'), key=lambda path: path.stat().st_mtime)
+    for path in profiles[:max(len(profiles) - keep, 0)]:
+        path.unlink(missing_ok=True)
+
+
+def save_profile(profiler, request, duration):
+    directory = Path(settings.OAUTH_PROFILING_DIR)
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / profile_filename(request, duration)
+        profiler.dump_stats(path)
+        prune(directory, settings.OAUTH_PROFILING_MAX_FILES)
+    except OSError as e:
+        logger.error(f"Failed to write request profile to {directory}: {e}")
+        return
+    logger.info(f"Profiled {request.method} {request.path} ({duration * 1000:.0f}ms) to {path.name}")
+
+
+def start_profiler():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active on this thread
+        return None
+    return profiler
+
+
+class ProfilingMiddleware:
+    """Profile sampled requests with cProfile and dump them to disk."""
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        if not settings.OAUTH_PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profiler = start_profiler() if should_profile(request) else None
+        if profiler is None:
+            return self.get_response(request)
+        
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            profiler.disable()
+            save_profile(profiler, request, time.perf_counter() - start)
+    
+    async def __acall__(self, request):
+        # cProfile follows the event loop thread, so other requests running
+        # concurrently on the loop show up in an async profile too
+        profiler = start_profiler() if should_profile(request) else None
+        if profiler is None:
+            return await self.get_response(request)
+        
+        start = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            profiler.disable()
+            save_profile(profiler, request, time.perf_counter() - start)
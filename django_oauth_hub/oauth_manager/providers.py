@@ -0,0 +1,190 @@
+"""
+Registry of OAuth provider descriptors.
+
+Everything about a platform that doesn't change between requests is resolved
+once per process into an immutable ``ProviderDescriptor``: the url-encoded
+static part of the authorization query, the token request templates and
+headers, the HTTP settings and the capability flags. Views look a descriptor
+up by platform key and only add the per-request values (redirect URI, state,
+code), so a new provider is a ``PROVIDER_PROFILES`` entry plus its
+``OAUTH_PLATFORMS`` settings rather than another branch in the views.
+
+The registry is rebuilt when ``OAUTH_PLATFORMS`` or one of the defaults it is
+merged over changes (``override_settings`` in tests).
+"""
+
+import base64
+import hashlib
+import secrets
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .rate_limit import RateLimit, build_rate_limits
+from .resilience import ResiliencePolicy
+
+# Static behavior per platform; any key can be overridden from OAUTH_PLATFORMS
+PROVIDER_PROFILES = {
+    'facebook': {'auth_params': {'display': 'popup'}},
+    'instagram': {},
+    'twitter': {'pkce': True, 'refresh': True},
+    'linkedin': {'oidc': True},
+    'youtube': {'refresh': True, 'oidc': True},
+    'tiktok': {'refresh': True},
+    'pinterest': {'refresh': True},
+}
+
+def generate_code_verifier():
+    """Return a new PKCE code verifier (86 characters; RFC 7636 allows 43-128)."""
+    return secrets.token_urlsafe(64)
+
+
+def code_challenge(code_verifier):
+    """Return the S256 PKCE challenge for a code verifier."""
+    digest = hashlib.sha256(code_verifier.encode('ascii')).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+FORM_HEADERS = MappingProxyType({
+    'Accept': 'application/json',
+    'Content-Type': 'application/x-www-form-urlencoded',
+})
+
+
+@dataclass(frozen=True)
+class ProviderDescriptor:
+    """Precompiled, read-only configuration for one OAuth provider."""
+    
+    key: str
+    name: str
+    is_configured: bool
+    auth_url: str
+    token_url: str
+    user_info_url: str
+    auth_prefix: str
+    token_template: Mapping[str, str]
+    refresh_template: Mapping[str, str]
+    token_headers: Mapping[str, str]
+    http: Mapping[str, object]
+    timeout: Tuple[float, float]
+    pool_size: int
+    refresh_concurrency: Optional[int]
+    rate_limits: Mapping[str, RateLimit]
+    resilience: ResiliencePolicy
+    supports_pkce: bool
+    supports_refresh: bool
+    supports_oidc: bool
+    
+    def new_code_verifier(self):
+        """Return a PKCE code verifier for a new flow, or None if the provider doesn't use PKCE."""
+        return generate_code_verifier() if self.supports_pkce else None
+    
+    def authorization_url(self, redirect_uri, state, code_verifier=None):
+        """Return the provider authorization URL for a new OAuth flow."""
+        params = {'redirect_uri': redirect_uri, 'state': state}
+        if self.supports_pkce and code_verifier:
+            params['code_challenge'] = code_challenge(code_verifier)
+        return f"{self.auth_prefix}&{urlencode(params)}"
+    
+    def token_request(self, code, redirect_uri, code_verifier=None):
+        """Return the ``(data, headers)`` for an authorization code exchange."""
+        data = {**self.token_template, 'code': code, 'redirect_uri': redirect_uri}
+        if self.supports_pkce and code_verifier:
+            data['code_verifier'] = code_verifier
+        return data, self.token_headers
+    
+    def refresh_request(self, refresh_token):
+        """Return the ``(data, headers)`` for a refresh token grant."""
+        return {**self.refresh_template, 'refresh_token': refresh_token}, self.token_headers
+    
+    def user_info_headers(self, access_token):
+        """Return the headers for a user-info request."""
+        return {'Authorization': f'Bearer {access_token}'}
+
+
+def build_descriptor(key, name, config):
+    """Compile one platform's settings and profile into a descriptor."""
+    profile = {**PROVIDER_PROFILES.get(key, {}), **config}
+    http = MappingProxyType({**settings.OAUTH_HTTP_DEFAULTS, **profile.get('http', {})})
+    pkce = profile.get('pkce', False)
+    
+    auth_params = {
+        'client_id': profile.get('client_id') or '',
+        'scope': profile.get('scope') or '',
+        'response_type': 'code',
+        **profile.get('auth_params', {}),
+    }
+    if pkce:
+        auth_params['code_challenge_method'] = 'S256'
+    
+    client = {
+        'client_id': profile.get('client_id') or '',
+        'client_secret': profile.get('client_secret') or '',
+    }
+    
+    return ProviderDescriptor(
+        key=key,
+        name=name,
+        is_configured=bool(profile.get('client_id')),
+        auth_url=profile.get('auth_url', ''),
+        token_url=profile.get('token_url', ''),
+        user_info_url=profile.get('user_info_url', ''),
+        auth_prefix=f"{profile.get('auth_url', '')}?{urlencode(auth_params)}",
+        token_template=MappingProxyType({**client, 'grant_type': 'authorization_code'}),
+        refresh_template=MappingProxyType({**client, 'grant_type': 'refresh_token'}),
+        token_headers=FORM_HEADERS,
+        http=http,
+        timeout=(http['connect_timeout'], http['read_timeout']),
+        pool_size=http['pool_size'],
+        refresh_concurrency=profile.get('refresh_concurrency'),
+        rate_limits=MappingProxyType(
+            build_rate_limits(key, profile.get('rate_limits', {}), settings.OAUTH_RATE_LIMIT_MAX_WAIT)
+        ),
+        resilience=ResiliencePolicy.from_config(
+            {**settings.OAUTH_PROVIDER_RESILIENCE, **profile.get('resilience', {})}
+        ),
+        supports_pkce=pkce,
+        supports_refresh=profile.get('refresh', False),
+        supports_oidc=profile.get('oidc', False),
+    )
+
+
+def build_registry():
+    """Build ``{platform: descriptor}`` for every supported platform, in display order."""
+    from .models import PlatformConnection
+    return MappingProxyType({
+        key: build_descriptor(key, name, settings.OAUTH_PLATFORMS.get(key) or {})
+        for key, name in PlatformConnection.PLATFORM_CHOICES
+    })
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide provider registry."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = build_registry()
+    return _registry
+
+
+def get_provider(platform):
+    """Return the descriptor for a platform, or None if it isn't supported."""
+    return get_registry().get(platform)
+
+
+@receiver(setting_changed, dispatch_uid='oauth_manager.reset_provider_registry')
+def reset_registry(setting=None, **kwargs):
+    global _registry
+    if setting in ('OAUTH_PLATFORMS', 'OAUTH_HTTP_DEFAULTS', 'OAUTH_RATE_LIMIT_MAX_WAIT', 'OAUTH_PROVIDER_RESILIENCE'):
+        _registry = None
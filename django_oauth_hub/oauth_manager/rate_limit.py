@@ -0,0 +1,158 @@
+"""
+Outbound rate limiting for provider calls.
+
+Each ``(platform, endpoint)`` pair with a limit in ``OAUTH_PLATFORMS`` gets a
+token bucket whose state lives in the Django cache, so every worker process
+sharing the cache draws from the same bucket. The bucket is kept as a single
+"theoretical arrival time" (GCRA), which a caller advances under a short
+token-owned lock from ``atomic_cache``. Callers that would have to wait longer
+than ``max_wait`` get ``RateLimited`` straight away rather than queueing.
+Shorter waits reserve their slot before sleeping, so waiting callers are
+served in order and throughput stays just under the configured rate.
+
+If the lock can't be taken in time the call is refused with ``RateLimited``,
+or sent anyway with ``OAUTH_RATE_LIMIT_FAIL_OPEN``; either way it is counted in
+``oauth_hub_rate_limit_lock_timeouts_total``.
+
+Limits are shared between the workers of one host with the file-based cache
+(``CACHE_LOCATION``) and between hosts with Redis (``REDIS_URL``). With the
+default local-memory cache each process has its own bucket.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from . import atomic_cache, metrics
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'oauth_hub:ratelimit'
+
+# Provider calls that can be limited separately
+ENDPOINTS = ('token', 'userinfo', 'refresh')
+
+LOCK_TIMEOUT = 1  # seconds; the critical section is a get and a set
+LOCK_ATTEMPTS = 50
+LOCK_SLEEP = 0.002
+
+
+class RateLimited(Exception):
+    """A provider call was refused by our limiter or throttled by the provider (429)."""
+    
+    def __init__(self, platform, endpoint, retry_after):
+        self.platform = platform
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        super().__init__(f"{platform} {endpoint} rate limit reached, retry in {retry_after:.1f}s")
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """A token bucket of ``rate`` requests per second with room for ``burst``."""
+    
+    platform: str
+    endpoint: str
+    rate: float
+    burst: int
+    max_wait: float
+    
+    @property
+    def key(self):
+        return f'{KEY_PREFIX}:{self.platform}:{self.endpoint}'
+    
+    def _lock(self):
+        """
+        Take the bucket's lock, returning it, or None to go ahead without it.
+        
+        Raises RateLimited if the lock can't be taken in time, unless
+        ``OAUTH_RATE_LIMIT_FAIL_OPEN`` is set.
+        """
+        lock = atomic_cache.Lock(f'{self.key}:lock', LOCK_TIMEOUT)
+        if lock.acquire(LOCK_ATTEMPTS, LOCK_SLEEP):
+            return lock
+        fail_open = settings.OAUTH_RATE_LIMIT_FAIL_OPEN
+        metrics.rate_limit_lock_timeouts.labels(self.platform, self.endpoint, 'open' if fail_open else 'closed').inc()
+        if not fail_open:
+            raise RateLimited(self.platform, self.endpoint, LOCK_TIMEOUT)
+        logger.warning(f"Rate limiter lock for {self.platform} {self.endpoint} is contended, sending unlimited")
+        return None
+    
+    def reserve(self):
+        """
+        Reserve the next request slot and return how long to wait for it.
+        
+        Raises RateLimited without reserving anything if the wait would
+        exceed ``max_wait``.
+        """
+        interval = 1 / self.rate
+        tolerance = interval * self.burst
+        
+        lock = self._lock()
+        try:
+            now = time.time()
+            arrival = max(cache.get(self.key) or now, now) + interval
+            wait = arrival - tolerance - now
+            if wait > self.max_wait:
+                raise RateLimited(self.platform, self.endpoint, wait)
+            cache.set(self.key, arrival, int(tolerance + self.max_wait) + 1)
+            return max(wait, 0)
+        finally:
+            if lock:
+                lock.release()
+    
+    def acquire(self):
+        """Block until a request may be sent (up to ``max_wait``)."""
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+    
+    async def aacquire(self):
+        """Async counterpart of acquire()."""
+        wait = await sync_to_async(self.reserve, thread_sensitive=False)()
+        if wait:
+            await asyncio.sleep(wait)
+    
+    def penalize(self, seconds):
+        """Hold the bucket empty for ``seconds``, e.g. after a provider 429."""
+        interval = 1 / self.rate
+        until = time.time() + seconds + interval * self.burst - interval
+        try:
+            lock = self._lock()
+        except RateLimited:
+            return  # Someone else is updating the bucket; the provider will throttle us again
+        try:
+            if (cache.get(self.key) or 0) < until:
+                cache.set(self.key, until, int(seconds + interval * self.burst) + 1)
+        finally:
+            if lock:
+                lock.release()
+
+
+def build_rate_limits(platform, config, max_wait):
+    """Compile a platform's ``rate_limits`` setting into ``{endpoint: RateLimit}``."""
+    limits = {}
+    for endpoint, limit in config.items():
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"Unknown rate limit endpoint for {platform}: {endpoint}")
+        limits[endpoint] = RateLimit(
+            platform=platform,
+            endpoint=endpoint,
+            rate=float(limit['rate']),
+            burst=int(limit.get('burst', 1)),
+            max_wait=float(limit.get('max_wait', max_wait)),
+        )
+    return limits
+
+
+def retry_after_seconds(response, default=1.0):
+    """Read a provider's Retry-After header (delta-seconds form)."""
+    try:
+        return max(float(response.headers.get('Retry-After', default)), 0)
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,197 @@
+"""
+Per-request instrumentation: database queries and time, status cache hits
+and outbound provider calls.
+
+``RequestMetricsMiddleware`` keeps a ``RequestMetrics`` for each request in a
+context variable, so the threads ``sync_to_async`` runs the async views' ORM
+calls on report into the same one. It adds a ``Server-Timing`` header to the
+response and logs one line per request with the numbers as structured fields.
+
+Views declare how many queries a request may run with ``@query_budget``. Going
+over budget logs a warning, or raises ``QueryBudgetExceeded`` when
+``OAUTH_QUERY_BUDGET_STRICT`` is on.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import metrics as prometheus
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('oauth_hub_request_metrics', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """A view ran more database queries than its declared budget."""
+    
+    def __init__(self, view, queries, budget):
+        self.view = view
+        self.queries = queries
+        self.budget = budget
+        super().__init__(f"{view} ran {queries} queries, over its budget of {budget}")
+
+
+def query_budget(queries):
+    """Declare the most database queries one request to a view may run."""
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+
+class RequestMetrics:
+    """Counters for one request."""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.provider_calls = 0
+        self.provider_time = 0.0
+        self._lock = threading.Lock()
+    
+    def add_query(self, elapsed):
+        with self._lock:
+            self.queries += 1
+            self.db_time += elapsed
+    
+    def add_cache(self, hits, misses):
+        with self._lock:
+            self.cache_hits += hits
+            self.cache_misses += misses
+    
+    def add_provider_call(self, elapsed):
+        with self._lock:
+            self.provider_calls += 1
+            self.provider_time += elapsed
+    
+    def server_timing(self, duration):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'provider;dur={self.provider_time * 1000:.1f};desc="{self.provider_calls} calls"',
+            f'total;dur={duration * 1000:.1f}',
+        ])
+    
+    def log_fields(self, duration):
+        return {
+            'duration_ms': round(duration * 1000, 1),
+            'db_queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 1),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'provider_calls': self.provider_calls,
+            'provider_ms': round(self.provider_time * 1000, 1),
+        }
+
+
+def current():
+    """Return the RequestMetrics of the request being handled, if any."""
+    return _current.get()
+
+
+def record_cache(hits, misses):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_cache(hits, misses)
+
+
+def record_provider_call(elapsed):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_provider_call(elapsed)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing every query run during a request."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(time.perf_counter() - start)
+
+
+@receiver(connection_created, dispatch_uid='oauth_manager.instrument_connection')
+def instrument_connection(sender, connection, **kwargs):
+    # Connections are per thread, so wrap each one as it opens
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class RequestMetricsMiddleware:
+    """Measure each request and report it as Server-Timing and a log line."""
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        if not settings.OAUTH_REQUEST_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+    
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
+    
+    def finish(self, request, response, metrics):
+        duration = time.perf_counter() - metrics.started
+        view = request.resolver_match.view_name if request.resolver_match else None
+        fields = {
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status_code': response.status_code,
+            **metrics.log_fields(duration),
+        }
+        
+        prometheus.observe_request(view, request.method, duration)
+        if settings.OAUTH_SERVER_TIMING:
+            response['Server-Timing'] = metrics.server_timing(duration)
+        logger.info(
+            f"{request.method} {request.path} {response.status_code} {fields['duration_ms']}ms "
+            f"queries={metrics.queries} db={fields['db_ms']}ms cache_hits={metrics.cache_hits} "
+            f"provider={fields['provider_ms']}ms",
+            extra=fields,
+        )
+        
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and metrics.queries > budget:
+            if settings.OAUTH_QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(view, metrics.queries, budget)
+            logger.warning(f"{view} ran {metrics.queries} queries, over its budget of {budget}")
+        return response
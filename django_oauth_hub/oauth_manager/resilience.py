@@ -0,0 +1,267 @@
+"""
+Circuit breakers and bulkheads for provider calls.
+
+Every provider call runs inside its platform's ``ProviderGuard``:
+
+* The circuit breaker counts calls, failures (network errors and 5xx) and slow
+  calls in a rolling window of cache buckets shared by every process using the
+  cache. When the failure or slow-call rate crosses its threshold, the circuit
+  opens and calls fail fast with ``CircuitOpen`` for ``open_seconds``. After
+  that a single probe call is let through. If it succeeds the circuit closes,
+  and if it fails the circuit opens again.
+* The bulkhead caps how many calls to one provider run at once across every
+  process using the cache, so a slow provider can't tie up every worker and
+  starve the other platforms. Calls over the cap fail immediately with
+  ``BulkheadFull``. In-flight calls are counted in cache slots of
+  ``window_seconds``; a call is counted in the slot it started in and the
+  count is the sum of the current and previous slots, so calls leaked by a
+  killed worker stop counting after at most two windows.
+
+All counters are updated through ``atomic_cache``, so they stay exact between
+workers sharing a Redis, Memcached or file-based cache.
+
+Thresholds come from ``OAUTH_PROVIDER_RESILIENCE`` and can be overridden with
+a ``'resilience'`` dict in an ``OAUTH_PLATFORMS`` entry.
+"""
+
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from . import atomic_cache, metrics
+
+KEY_PREFIX = 'oauth_hub:breaker'
+
+
+class ProviderUnavailable(Exception):
+    """A provider call was refused before it was sent."""
+    
+    reason = 'unavailable'
+    
+    def __init__(self, platform, retry_after=0):
+        self.platform = platform
+        self.retry_after = retry_after
+        super().__init__(f"{platform} is {self.reason}")
+
+
+class CircuitOpen(ProviderUnavailable):
+    reason = 'failing, circuit open'
+
+
+class BulkheadFull(ProviderUnavailable):
+    reason = 'at its concurrency limit'
+
+
+@dataclass(frozen=True)
+class ResiliencePolicy:
+    """Breaker thresholds and bulkhead size for one provider."""
+    
+    window_seconds: int
+    bucket_seconds: int
+    min_calls: int
+    failure_rate: float
+    slow_call_seconds: float
+    slow_call_rate: float
+    open_seconds: int
+    max_concurrency: int
+    
+    @classmethod
+    def from_config(cls, config):
+        return cls(**{field: config[field] for field in cls.__dataclass_fields__})
+
+
+class Call:
+    """Outcome of one guarded call; the caller marks successful responses."""
+    
+    def __init__(self):
+        self.ok = False
+
+
+@dataclass(frozen=True)
+class Admission:
+    """An admitted call: whether it is the half-open probe and the bulkhead slot it counts in."""
+    
+    probe: bool
+    slot: str
+
+
+class ProviderGuard:
+    """Circuit breaker and bulkhead client for one platform, with all state in the cache."""
+    
+    def __init__(self, platform, policy):
+        self.platform = platform
+        self.policy = policy
+    
+    def _key(self, *parts):
+        return ':'.join((KEY_PREFIX, self.platform) + tuple(str(part) for part in parts))
+    
+    def _incr(self, key, timeout):
+        return atomic_cache.incr(key, timeout=timeout)
+    
+    def _slot_keys(self, now):
+        """The current and previous in-flight slots."""
+        current = int(now // self.policy.window_seconds)
+        return [self._key('in_flight', current), self._key('in_flight', current - 1)]
+    
+    def in_flight(self):
+        """Calls to this provider in progress across every process."""
+        return sum(cache.get_many(self._slot_keys(time.time())).values())
+    
+    def _release(self, slot):
+        # None when the slot expired, taking its count with it
+        atomic_cache.decr(slot, timeout=self.policy.window_seconds * 2)
+    
+    def _bucket_keys(self, now):
+        size = self.policy.bucket_seconds
+        current = int(now // size)
+        return [current - offset for offset in range(self.policy.window_seconds // size)]
+    
+    def _reject(self, kind):
+        self._incr(self._key('rejected', kind), None)
+        metrics.provider_rejections.labels(self.platform, kind).inc()
+    
+    def enter(self):
+        """Admit a call, returning its ``Admission``."""
+        probe = False
+        open_until = cache.get(self._key('open_until'))
+        if open_until is not None:
+            now = time.time()
+            if now < open_until or not atomic_cache.add(self._key('probe'), 1, self.policy.open_seconds):
+                self._reject('circuit')
+                raise CircuitOpen(self.platform, retry_after=max(open_until - now, 1))
+            probe = True
+        
+        slot = self._slot_keys(time.time())[0]
+        self._incr(slot, self.policy.window_seconds * 2)
+        if self.in_flight() > self.policy.max_concurrency:
+            self._release(slot)
+            if probe:
+                cache.delete(self._key('probe'))
+            self._reject('bulkhead')
+            raise BulkheadFull(self.platform)
+        metrics.provider_in_flight.labels(self.platform).inc()
+        return Admission(probe, slot)
+    
+    def exit(self, admission, ok, elapsed):
+        """Release the call's slot and feed its outcome to the breaker."""
+        self._release(admission.slot)
+        metrics.provider_in_flight.labels(self.platform).dec()
+        
+        slow = elapsed >= self.policy.slow_call_seconds
+        if admission.probe:
+            if ok and not slow:
+                self.close()
+            else:
+                self.trip()
+            return
+        
+        bucket = self._bucket_keys(time.time())[0]
+        timeout = self.policy.window_seconds + self.policy.bucket_seconds
+        self._incr(self._key(bucket, 'calls'), timeout)
+        if not ok:
+            self._incr(self._key(bucket, 'failures'), timeout)
+        if slow:
+            self._incr(self._key(bucket, 'slow'), timeout)
+        
+        # Only a bad call can push the rates over a threshold
+        if not ok or slow:
+            stats = self.window()
+            if stats['calls'] >= self.policy.min_calls and (
+                stats['failures'] / stats['calls'] >= self.policy.failure_rate
+                or stats['slow'] / stats['calls'] >= self.policy.slow_call_rate
+            ):
+                self.trip()
+    
+    def window(self):
+        """Return the call, failure and slow-call counts over the rolling window."""
+        keys = {
+            self._key(bucket, counter): counter
+            for bucket in self._bucket_keys(time.time())
+            for counter in ('calls', 'failures', 'slow')
+        }
+        stats = {'calls': 0, 'failures': 0, 'slow': 0}
+        for key, value in cache.get_many(list(keys)).items():
+            stats[keys[key]] += value
+        return stats
+    
+    def _clear_window(self):
+        cache.delete_many([
+            self._key(bucket, counter)
+            for bucket in self._bucket_keys(time.time())
+            for counter in ('calls', 'failures', 'slow')
+        ])
+    
+    def trip(self):
+        """Open the circuit for ``open_seconds``."""
+        # Kept well past open_seconds so an idle circuit still needs a probe to close
+        cache.set(self._key('open_until'), time.time() + self.policy.open_seconds, self.policy.open_seconds * 10)
+        cache.delete(self._key('probe'))
+        self._clear_window()
+    
+    def close(self):
+        cache.delete_many([self._key('open_until'), self._key('probe')])
+        self._clear_window()
+    
+    def state(self):
+        open_until = cache.get(self._key('open_until'))
+        if open_until is None:
+            return 'closed'
+        return 'open' if time.time() < open_until else 'half-open'
+    
+    def status(self):
+        """Breaker state, window counts, rejections and in-flight calls, all shared between processes."""
+        rejected = cache.get_many([self._key('rejected', 'circuit'), self._key('rejected', 'bulkhead')])
+        return {
+            'platform': self.platform,
+            'state': self.state(),
+            'window': self.window(),
+            'rejected': {
+                'circuit': rejected.get(self._key('rejected', 'circuit'), 0),
+                'bulkhead': rejected.get(self._key('rejected', 'bulkhead'), 0),
+            },
+            'in_flight': self.in_flight(),
+            'max_concurrency': self.policy.max_concurrency,
+        }
+    
+    @contextmanager
+    def call(self):
+        """Guard a provider call; set ``call.ok`` once the response is acceptable."""
+        admission = self.enter()
+        call = Call()
+        started = time.monotonic()
+        try:
+            yield call
+        finally:
+            self.exit(admission, call.ok, time.monotonic() - started)
+    
+    @asynccontextmanager
+    async def acall(self):
+        """Async counterpart of call()."""
+        admission = await sync_to_async(self.enter, thread_sensitive=False)()
+        call = Call()
+        started = time.monotonic()
+        try:
+            yield call
+        finally:
+            await sync_to_async(self.exit, thread_sensitive=False)(admission, call.ok, time.monotonic() - started)
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(platform):
+    """Return this process's guard for a platform (rebuilt if its policy changes)."""
+    from .providers import get_provider
+    policy = get_provider(platform).resilience
+    guard = _guards.get(platform)
+    if guard is None or guard.policy != policy:
+        with _guards_lock:
+            guard = _guards.get(platform)
+            if guard is None or guard.policy != policy:
+                guard = _guards[platform] = ProviderGuard(platform, policy)
+    return guard
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent by PlatformConnection.set_connected/set_error/disconnect after saving.
+# Receivers get ``connection`` (the saved PlatformConnection instance).
+connection_status_changed = Signal()
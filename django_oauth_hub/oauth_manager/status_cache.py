@@ -0,0 +1,107 @@
+"""
+Per-user connection status cache on the Django cache framework.
+
+Status payloads are cached per ``(user, platform)`` and the dashboard's
+connection set per user. Entries are dropped by ``post_save``/``post_delete``
+on PlatformConnection (queryset ``update()``/``bulk_create`` callers must call
+``invalidate`` themselves) and otherwise live for ``OAUTH_STATUS_CACHE_TTL``
+seconds, which coalesces bursts of polling and bounds staleness in other
+worker processes when a process-local cache backend is used.
+"""
+
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .request_metrics import record_cache
+
+KEY_PREFIX = 'oauth_hub:status'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def status_key(user_id, platform):
+    return f'{KEY_PREFIX}:{user_id}:{platform}'
+
+
+def connections_key(user_id):
+    return f'{KEY_PREFIX}:{user_id}:__all__'
+
+
+def _record(hits, misses):
+    with _stats_lock:
+        _stats['hits'] += hits
+        _stats['misses'] += misses
+    record_cache(hits, misses)
+
+
+def stats():
+    """Return this process's hit/miss counters."""
+    with _stats_lock:
+        return {'hits': _stats['hits'], 'misses': _stats['misses']}
+
+
+def _timeout(expires_at):
+    """The micro-TTL, shortened so an entry never outlives the token's expiry."""
+    ttl = settings.OAUTH_STATUS_CACHE_TTL
+    if expires_at:
+        remaining = (expires_at - timezone.now()).total_seconds()
+        if remaining > 0:
+            ttl = min(ttl, remaining)
+    return ttl
+
+
+def get_statuses(user_id, platforms, loader):
+    """
+    Return ``{platform: payload}`` for the requested platforms.
+    
+    ``loader(missing_platforms)`` is called once with the platforms that
+    weren't cached and must return ``{platform: payload}`` for them.
+    """
+    keys = {status_key(user_id, platform): platform for platform in platforms}
+    statuses = {keys[key]: payload for key, payload in cache.get_many(list(keys)).items()}
+    missing = [platform for platform in platforms if platform not in statuses]
+    _record(len(statuses), len(missing))
+    
+    if missing:
+        loaded = loader(missing)
+        for platform, payload in loaded.items():
+            expires_at = parse_datetime(payload['token_expires_at']) if payload.get('token_expires_at') else None
+            cache.set(status_key(user_id, platform), payload, _timeout(expires_at))
+        statuses.update(loaded)
+    return statuses
+
+
+def get_connections(user_id, loader):
+    """Return the user's cached ``{platform: connection}`` dict, loading it on a miss."""
+    connections = cache.get(connections_key(user_id))
+    if connections is not None:
+        _record(1, 0)
+        return connections
+    
+    _record(0, 1)
+    connections = loader()
+    expires = [connection.token_expires_at for connection in connections.values() if connection.token_expires_at]
+    cache.set(connections_key(user_id), connections, _timeout(min(expires, default=None)))
+    return connections
+
+
+def invalidate(user_id, platforms=None):
+    """Drop cached entries for a user (optionally only some platforms)."""
+    if platforms is None:
+        from .models import PlatformConnection
+        platforms = [key for key, _ in PlatformConnection.PLATFORM_CHOICES]
+    cache.delete_many([status_key(user_id, platform) for platform in platforms] + [connections_key(user_id)])
+
+
+@receiver(post_save, sender='oauth_manager.PlatformConnection', dispatch_uid='oauth_manager.invalidate_status_on_save')
+@receiver(post_delete, sender='oauth_manager.PlatformConnection', dispatch_uid='oauth_manager.invalidate_status_on_delete')
+def invalidate_connection(sender, instance, **kwargs):
+    invalidate(instance.user_id, [instance.platform])
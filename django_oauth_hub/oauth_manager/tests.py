@@ -5,20 +5,52 @@ This module contains tests for the OAuth Hub functionality.
 Run with: python manage.py test
 """
 
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, AsyncClient, override_settings
+from django.contrib import admin
+from django.core.management import call_command
 from django.contrib.auth.models import User
-from django.urls import reverse
+from django.urls import reverse, path, include
+from django.http import HttpResponse, StreamingHttpResponse
 from django.conf import settings
-from unittest.mock import patch, Mock
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import connection as db_connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest.mock import patch, Mock, AsyncMock
+import csv
 import json
-from oauth_manager.models import PlatformConnection, OAuthSession, ConnectionLog
-from oauth_manager.views import generate_state, exchange_code_for_token
+import pickle
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+import requests
+from io import StringIO
+from urllib.parse import parse_qs, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from oauth_manager import atomic_cache, http_client, metrics, oauth_state, status_cache, views, views_async
+from oauth_manager.admin import ConnectionLogAdmin, EstimatedCountPaginator
+from oauth_manager.crypto import decrypt_token, get_token_cipher
+from oauth_manager.dashboard import get_platforms
+from oauth_manager.events import Subscription, broker, iter_status_events
+from oauth_manager.log_sinks import BufferedDatabaseSink, JSONLFileSink
+from oauth_manager.management.commands.refresh_tokens import backoff_key, backoff_seconds
+from oauth_manager.models import PlatformConnection, OAuthSession, ConnectionLog, DataDeletionRequest
+from oauth_manager.providers import ProviderDescriptor, code_challenge, get_provider, get_registry
+from oauth_manager.rate_limit import RateLimited
+from oauth_manager.request_metrics import QueryBudgetExceeded
+from oauth_manager.resilience import BulkheadFull, CircuitOpen, ProviderGuard, ResiliencePolicy, get_guard
+from oauth_manager.urls import build_urlpatterns
+from oauth_manager.views import RefreshRejected, generate_state, exchange_code_for_token, refresh_access_token
 
 
 class OAuthHubTestCase(TestCase):
     """Base test case with common setup."""
     
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(
             username='testuser',
@@ -26,6 +58,36 @@ class OAuthHubTestCase(TestCase):
             password='testpass123'
         )
         self.client.login(username='testuser', password='testpass123')
+    
+    def create_connection(self, platform='facebook', user=None, access_token=None, refresh_token=None,
+                          user_info=None, expires_in_minutes=None, **fields):
+        """
+        Create a connection for ``user`` (the logged-in user by default).
+        
+        Given an ``access_token`` it is connected with ``set_connected``.
+        ``expires_in_minutes`` is then written straight to the row, so the
+        expiry can lie in the past.
+        """
+        connection = PlatformConnection.objects.create(user=user or self.user, platform=platform, **fields)
+        if access_token:
+            connection.set_connected(access_token=access_token, refresh_token=refresh_token, user_info=user_info)
+        if expires_in_minutes is not None:
+            connection.token_expires_at = timezone.now() + timezone.timedelta(minutes=expires_in_minutes)
+            PlatformConnection.objects.filter(pk=connection.pk).update(token_expires_at=connection.token_expires_at)
+        return connection
+    
+    def create_session(self, state, platform='facebook', user=None, age=None, completed=False, **fields):
+        """Create an OAuth session, backdated by ``age`` (and completed then, with ``completed``)."""
+        session = OAuthSession.objects.create(
+            user=user or self.user, platform=platform, state=state, redirect_uri='http://testserver/cb/', **fields,
+        )
+        if age is not None:
+            created_at = timezone.now() - age
+            OAuthSession.objects.filter(pk=session.pk).update(
+                created_at=created_at,
+                completed_at=created_at if completed else None,
+            )
+        return session
 
 
 class ModelsTestCase(OAuthHubTestCase):
@@ -124,6 +186,745 @@ class ModelsTestCase(OAuthHubTestCase):
         self.assertEqual(log.action, 'initiated')
         self.assertEqual(log.details, 'Test OAuth initiation')
         self.assertEqual(log.ip_address, '127.0.0.1')
+    
+    
+    def test_for_dashboard_creates_missing_connections(self):
+        """Test the dashboard loader creates a row for every platform."""
+        PlatformConnection.objects.create(user=self.user, platform='facebook', status='connected')
+        
+        connections = PlatformConnection.objects.for_dashboard(self.user)
+        
+        self.assertEqual(list(connections), [key for key, _ in PlatformConnection.PLATFORM_CHOICES])
+        self.assertEqual(connections['facebook'].status, 'connected')
+        self.assertTrue(all(connection.pk for connection in connections.values()))
+        self.assertEqual(PlatformConnection.objects.filter(user=self.user).count(), len(PlatformConnection.PLATFORM_CHOICES))
+    
+    def test_for_dashboard_shows_expired_connections_without_writing(self):
+        """Test the dashboard loader reports expired tokens but leaves the row to the sweeper."""
+        PlatformConnection.objects.create(
+            user=self.user,
+            platform='facebook',
+            status='connected',
+            token_expires_at=timezone.now() - timezone.timedelta(minutes=5),
+        )
+        
+        connections = PlatformConnection.objects.for_dashboard(self.user)
+        
+        self.assertEqual(connections['facebook'].status, 'expired')
+        self.assertEqual(PlatformConnection.objects.get(user=self.user, platform='facebook').status, 'connected')
+    
+    def test_for_dashboard_single_query_when_rows_exist(self):
+        """Test the dashboard loader is a single SELECT once rows exist."""
+        PlatformConnection.objects.for_dashboard(self.user)
+        
+        with self.assertNumQueries(1):
+            PlatformConnection.objects.for_dashboard(self.user)
+
+
+class TokenCipherTestCase(OAuthHubTestCase):
+    """Test cases for the shared token cipher and decrypted-token memoization."""
+    
+    def test_cipher_built_once_per_process(self):
+        """Test the cipher is reused across calls."""
+        self.assertIs(get_token_cipher(), get_token_cipher())
+    
+    def test_access_token_decrypted_once_per_instance(self):
+        """Test repeated access token reads decrypt only once."""
+        connection = PlatformConnection.objects.get(pk=self.create_connection(access_token='token-123').pk)
+        
+        with patch('oauth_manager.models.decrypt_token', wraps=decrypt_token) as mock_decrypt:
+            for _ in range(5):
+                self.assertTrue(connection.is_connected)
+                self.assertEqual(connection.access_token, 'token-123')
+        
+        self.assertEqual(mock_decrypt.call_count, 1)
+    
+    def test_setting_token_invalidates_cache(self):
+        """Test assigning a token replaces the memoized plaintext."""
+        connection = self.create_connection(access_token='token-123')
+        connection.access_token = 'token-456'
+        self.assertEqual(connection.access_token, 'token-456')
+        
+        connection.encrypted_access_token = None
+        self.assertIsNone(connection.access_token)
+    
+    def test_dashboard_decrypts_each_token_at_most_once(self):
+        """Test rendering the dashboard decrypts each token at most once."""
+        self.create_connection('facebook', access_token='token-123')
+        self.create_connection('twitter', access_token='token-123')
+        
+        with patch('oauth_manager.models.decrypt_token', wraps=decrypt_token) as mock_decrypt:
+            response = self.client.get(reverse('dashboard'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(mock_decrypt.call_count, 2)
+    
+    def test_connection_status_decrypts_at_most_once(self):
+        """Test the status API decrypts the access token at most once."""
+        self.create_connection('facebook', access_token='token-123')
+        
+        with patch('oauth_manager.models.decrypt_token', wraps=decrypt_token) as mock_decrypt:
+            response = self.client.get(reverse('connection_status', kwargs={'platform': 'facebook'}))
+        
+        self.assertTrue(json.loads(response.content)['is_connected'])
+        self.assertLessEqual(mock_decrypt.call_count, 1)
+
+
+class SessionCleanupTestCase(OAuthHubTestCase):
+    """Test cases for the batched OAuth session sweeper."""
+    
+    def test_cleanup_command_deletes_in_batches(self):
+        """Test expired and old completed sessions are removed, fresh ones kept."""
+        for i in range(5):
+            self.create_session(f'expired_{i}', age=timezone.timedelta(hours=2))
+        self.create_session('fresh', age=timezone.timedelta(minutes=5))
+        self.create_session('old_completed', age=timezone.timedelta(days=3), is_active=False, completed=True)
+        self.create_session('recent_completed', age=timezone.timedelta(hours=2), is_active=False, completed=True)
+        
+        call_command('cleanup_oauth_sessions', batch_size=2, sleep=0, retention_hours=24, stdout=StringIO())
+        
+        remaining = set(OAuthSession.objects.values_list('state', flat=True))
+        self.assertEqual(remaining, {'fresh', 'recent_completed'})
+    
+    def test_dashboard_does_not_clean_sessions(self):
+        """Test the dashboard no longer deletes sessions on the request path."""
+        self.create_session('expired', age=timezone.timedelta(hours=2))
+        
+        self.client.get(reverse('dashboard'))
+        
+        self.assertTrue(OAuthSession.objects.filter(state='expired').exists())
+
+
+class TokenExpiryTestCase(OAuthHubTestCase):
+    """Test cases for the token expiry sweeper."""
+    
+    def test_sweeper_expires_lapsed_tokens_in_batches(self):
+        """Test lapsed connected rows are expired with a log event each, and nothing else changes."""
+        other = User.objects.create_user(username='other')
+        lapsed = [
+            self.create_connection('facebook', status='connected', expires_in_minutes=-5),
+            self.create_connection('twitter', status='connected', expires_in_minutes=-60),
+            self.create_connection('facebook', user=other, status='connected', expires_in_minutes=-1),
+        ]
+        self.create_connection('linkedin', status='connected', expires_in_minutes=30)
+        self.create_connection('youtube', status='error', expires_in_minutes=-5)
+        
+        call_command('expire_tokens', batch_size=2, sleep=0, stdout=StringIO())
+        
+        self.assertEqual(
+            set(PlatformConnection.objects.filter(status='expired').values_list('pk', flat=True)),
+            {connection.pk for connection in lapsed},
+        )
+        self.assertEqual(
+            set(ConnectionLog.objects.filter(action='token_expired').values_list('connection_id', flat=True)),
+            {connection.pk for connection in lapsed},
+        )
+    
+    def test_sweeper_invalidates_cached_status(self):
+        """Test the sweeper drops cached statuses, since its UPDATE sends no post_save."""
+        self.create_connection('facebook', status='connected', expires_in_minutes=-1)
+        
+        with patch('oauth_manager.models.status_cache.invalidate') as invalidate:
+            PlatformConnection.objects.expire_lapsed()
+        
+        invalidate.assert_called_once_with(self.user.pk, ['facebook'])
+    
+    def test_status_reads_do_not_write(self):
+        """Test the status endpoint reports an expired token without saving it."""
+        self.create_connection('facebook', status='connected', expires_in_minutes=-5)
+        
+        with CaptureQueriesContext(db_connection) as queries:
+            response = self.client.get(reverse('connection_status', args=['facebook']))
+        
+        self.assertEqual(response.json()['status'], 'expired')
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "oauth_manager')])
+        self.assertEqual(PlatformConnection.objects.get(user=self.user, platform='facebook').status, 'connected')
+
+
+class DataDeletionTestCase(OAuthHubTestCase):
+    """Test cases for queued data deletion."""
+    
+    def _user_data(self, user):
+        connection = self.create_connection(user=user, access_token='token', refresh_token='refresh')
+        for action in ('initiated', 'connected', 'token_refreshed'):
+            ConnectionLog.objects.create(connection=connection, action=action)
+        self.create_session(f'state-{user.pk}', user=user)
+    
+    def _request(self, **fields):
+        return DataDeletionRequest.objects.create(user=self.user, process_after=timezone.now(), **fields)
+    
+    def test_request_is_queued_once(self):
+        """Test the deletion page queues a request after the grace period without deleting anything."""
+        self._user_data(self.user)
+        
+        for _ in range(2):
+            response = self.client.post(reverse('data_deletion'), {'reason': 'leaving', 'confirm_deletion': 'on'})
+            self.assertEqual(response.status_code, 302)
+        
+        deletion = DataDeletionRequest.objects.get(user=self.user)
+        self.assertEqual(deletion.status, 'pending')
+        self.assertEqual(deletion.reason, 'leaving')
+        self.assertGreater(deletion.process_after, timezone.now() + timezone.timedelta(days=settings.OAUTH_DATA_DELETION_GRACE_DAYS - 1))
+        self.assertEqual(PlatformConnection.objects.get(user=self.user).status, 'connected')
+    
+    def test_worker_deletes_due_requests(self):
+        """Test due requests delete the user's data in batches, leaving other users alone."""
+        other = User.objects.create_user(username='other')
+        self._user_data(self.user)
+        self._user_data(other)
+        DataDeletionRequest.objects.create(user=other, process_after=timezone.now() + timezone.timedelta(days=1))
+        deletion = self._request()
+        
+        call_command('process_data_deletions', batch_size=2, sleep=0, stdout=StringIO())
+        
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.status, 'completed')
+        self.assertEqual((deletion.logs_deleted, deletion.sessions_deleted, deletion.connections_deleted), (3, 1, 1))
+        self.assertFalse(PlatformConnection.objects.filter(user=self.user).exists())
+        self.assertFalse(OAuthSession.objects.filter(user=self.user).exists())
+        self.assertEqual(ConnectionLog.objects.filter(connection__user=other).count(), 3)
+        self.assertEqual(DataDeletionRequest.objects.get(user=other).status, 'pending')
+    
+    def test_interrupted_request_resumes(self):
+        """Test a failed run keeps its checkpoint, with tokens already scrubbed, and the next run finishes."""
+        self._user_data(self.user)
+        deletion = self._request()
+        
+        with patch.object(DataDeletionRequest, '_delete_sessions', side_effect=RuntimeError('boom')):
+            call_command('process_data_deletions', sleep=0, stdout=StringIO())
+        
+        deletion.refresh_from_db()
+        self.assertEqual((deletion.status, deletion.stage, deletion.logs_deleted), ('processing', 'logs', 3))
+        self.assertIsNone(PlatformConnection.objects.get(user=self.user).encrypted_access_token)
+        
+        call_command('process_data_deletions', sleep=0, stdout=StringIO())
+        
+        deletion.refresh_from_db()
+        self.assertEqual((deletion.status, deletion.logs_deleted, deletion.sessions_deleted), ('completed', 3, 1))
+
+
+class LogSinkTestCase(OAuthHubTestCase):
+    """Test cases for the connection event sinks."""
+    
+    def setUp(self):
+        super().setUp()
+        self.connection = PlatformConnection.objects.create(user=self.user, platform='facebook')
+    
+    def _event(self, action='initiated', created_at=None):
+        return {
+            'connection': self.connection, 'action': action, 'details': None, 'ip_address': None, 'user_agent': None,
+            'created_at': created_at or timezone.now(),
+        }
+    
+    def test_buffered_sink_bulk_inserts_on_flush(self):
+        """Test buffered events are written with a single INSERT."""
+        sink = BufferedDatabaseSink(batch_size=100, flush_interval=60)
+        for action in ['initiated', 'callback_received', 'connected']:
+            sink.emit(self._event(action))
+        self.assertFalse(ConnectionLog.objects.exists())
+        
+        with self.assertNumQueries(1):
+            sink.flush()
+        
+        self.assertEqual(ConnectionLog.objects.filter(connection=self.connection).count(), 3)
+    
+    def test_buffered_sink_flushes_when_full(self):
+        """Test the buffer flushes itself once batch_size is reached."""
+        sink = BufferedDatabaseSink(batch_size=2, flush_interval=60)
+        sink.emit(self._event())
+        sink.emit(self._event())
+        
+        self.assertEqual(ConnectionLog.objects.count(), 2)
+    
+    def test_buffered_sink_keeps_event_time(self):
+        """Test rows carry the time the event was emitted, not the time the batch was written."""
+        emitted_at = timezone.now() - timezone.timedelta(minutes=5)
+        sink = BufferedDatabaseSink(batch_size=100, flush_interval=60)
+        sink.emit(self._event(created_at=emitted_at))
+        sink.flush()
+        
+        self.assertEqual(ConnectionLog.objects.get().created_at, emitted_at)
+    
+    def test_buffered_sink_flushed_at_request_end(self):
+        """Test events logged during a request are written by the time it returns."""
+        self.connection.status = 'connected'
+        self.connection.save()
+        
+        self.client.post(reverse('disconnect_platform', kwargs={'platform': 'facebook'}), HTTP_ACCEPT='application/json')
+        
+        self.assertTrue(ConnectionLog.objects.filter(connection=self.connection, action='disconnected').exists())
+    
+    def test_jsonl_file_sink(self):
+        """Test the JSONL sink appends one JSON object per event."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'logs' / 'connections.jsonl'
+            sink = JSONLFileSink(path)
+            sink.emit(self._event('initiated'))
+            sink.emit(self._event('connected'))
+            sink.close()
+            
+            records = [json.loads(line) for line in path.read_text().splitlines()]
+        
+        self.assertEqual([record['action'] for record in records], ['initiated', 'connected'])
+        self.assertEqual(records[0]['connection_id'], self.connection.pk)
+        self.assertEqual(records[0]['platform'], 'facebook')
+
+
+class BufferedSinkFailureTestCase(TransactionTestCase):
+    """Test cases for buffered events that fail to write; foreign keys are only checked on commit."""
+    
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        self.kept = PlatformConnection.objects.create(user=user, platform='facebook')
+        self.deleted = PlatformConnection.objects.create(user=user, platform='twitter')
+    
+    def test_deleted_connection_drops_only_its_events(self):
+        """Test an event for a connection deleted before the flush doesn't take the batch down with it."""
+        sink = BufferedDatabaseSink(batch_size=100, flush_interval=60)
+        for connection in [self.kept, self.deleted, self.kept]:
+            sink.emit({
+                'connection': connection, 'action': 'initiated', 'details': None, 'ip_address': None,
+                'user_agent': None, 'created_at': timezone.now(),
+            })
+        self.deleted.delete()
+        
+        with self.assertLogs('oauth_manager.log_sinks', 'ERROR'):
+            sink.flush()
+        
+        self.assertEqual(ConnectionLog.objects.filter(connection=self.kept).count(), 2)
+        self.assertEqual(ConnectionLog.objects.count(), 2)
+
+
+class ConnectionLogArchiveTestCase(OAuthHubTestCase):
+    """Test cases for archiving and restoring connection logs."""
+    
+    def setUp(self):
+        super().setUp()
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        self.connection = PlatformConnection.objects.create(user=self.user, platform='facebook')
+        self.old = [
+            ConnectionLog.objects.create(connection=self.connection, action='initiated', details=f'old {i}')
+            for i in range(3)
+        ]
+        self.recent = ConnectionLog.objects.create(connection=self.connection, action='connected')
+        self.old_created_at = timezone.now() - timezone.timedelta(days=120)
+        ConnectionLog.objects.filter(pk__in=[log.pk for log in self.old]).update(created_at=self.old_created_at)
+    
+    def _archive(self, **options):
+        out = StringIO()
+        call_command(
+            'archive_connection_logs', older_than_days=90, output_dir=self.archive_dir.name,
+            compression='gzip', sleep=0, stdout=out, **options,
+        )
+        return out.getvalue()
+    
+    def test_archive_moves_old_rows_to_dated_files(self):
+        """Test rows past retention are written to a date-partitioned file and deleted."""
+        output = self._archive(chunk_size=2)
+        
+        self.assertIn('Archived 3 connection logs to 1 files', output)
+        self.assertEqual(list(ConnectionLog.objects.values_list('pk', flat=True)), [self.recent.pk])
+        files = list(Path(self.archive_dir.name).rglob('*.jsonl.gz'))
+        self.assertEqual(len(files), 1)
+        self.assertIn(f'connection_logs-{self.old_created_at.date().isoformat()}-', files[0].name)
+    
+    def test_keep_leaves_rows_in_place(self):
+        """Test --keep writes and verifies archives without deleting."""
+        self._archive(keep=True)
+        self.assertEqual(ConnectionLog.objects.count(), 4)
+    
+    def test_restore_round_trip(self):
+        """Test restoring a date range brings back the original rows, once."""
+        self._archive()
+        day = self.old_created_at.date().isoformat()
+        
+        for _ in range(2):
+            call_command('restore_connection_logs', day, input_dir=self.archive_dir.name, stdout=StringIO())
+        
+        restored = ConnectionLog.objects.filter(pk__in=[log.pk for log in self.old])
+        self.assertEqual(restored.count(), 3)
+        self.assertEqual(set(restored.values_list('created_at', flat=True)), {self.old_created_at})
+        self.assertEqual(sorted(restored.values_list('details', flat=True)), ['old 0', 'old 1', 'old 2'])
+
+
+class AdminTestCase(OAuthHubTestCase):
+    """Test cases for the admin list views."""
+    
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+    
+    def _logs(self, count):
+        connection, _ = PlatformConnection.objects.get_or_create(user=self.user, platform='facebook')
+        return [ConnectionLog.objects.create(connection=connection, action='initiated') for _ in range(count)]
+    
+    def _changelist_queries(self, url):
+        with CaptureQueriesContext(db_connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+    
+    def test_changelists_have_no_per_row_queries(self):
+        """Test list pages issue the same number of queries however many rows they show."""
+        for model in ('connectionlog', 'platformconnection', 'oauthsession'):
+            url = reverse(f'admin:oauth_manager_{model}_changelist')
+            self._logs(2)
+            self.create_session(f'{model}-1')
+            few = self._changelist_queries(url)
+            
+            self._logs(20)
+            for i in range(5):
+                user = User.objects.create_user(username=f'{model}-user-{i}')
+                self.create_connection('twitter', user=user)
+                self.create_session(f'{model}-{user.pk}', platform='twitter', user=user)
+            self.assertEqual(self._changelist_queries(url), few, model)
+    
+    def test_connection_log_show_more(self):
+        """Test the log list pages by primary key with a "show more" link."""
+        logs = self._logs(3)
+        url = reverse('admin:oauth_manager_connectionlog_changelist')
+        
+        with patch.object(ConnectionLogAdmin, 'list_per_page', 2):
+            response = self.client.get(url)
+            self.assertEqual([log.pk for log in response.context['cl'].result_list], [logs[2].pk, logs[1].pk])
+            show_more = response.context['cl'].show_more_url
+            self.assertEqual(show_more, f'?before={logs[1].pk}')
+            
+            response = self.client.get(url + show_more)
+        
+        self.assertEqual([log.pk for log in response.context['cl'].result_list], [logs[0].pk])
+        self.assertIsNone(response.context['cl'].show_more_url)
+    
+    def test_count_is_bounded(self):
+        """Test the paginator stops counting at max_count."""
+        self._logs(5)
+        with patch.object(EstimatedCountPaginator, 'max_count', 3):
+            self.assertEqual(EstimatedCountPaginator(ConnectionLog.objects.all(), 2).count, 3)
+        self.assertEqual(EstimatedCountPaginator(ConnectionLog.objects.all(), 2).count, 5)
+
+
+class ExportTestCase(OAuthHubTestCase):
+    """Test cases for the staff CSV/JSONL exports."""
+    
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.connection = PlatformConnection.objects.create(user=self.user, platform='facebook')
+        self.connection.set_connected(access_token='secret-access-token', refresh_token='secret-refresh-token')
+        PlatformConnection.objects.create(user=self.user, platform='twitter', status='error')
+        ConnectionLog.objects.create(connection=self.connection, action='initiated')
+        ConnectionLog.objects.create(connection=self.connection, action='connected', details='Connected as Test')
+    
+    def _body(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+    
+    def test_connections_csv_excludes_tokens(self):
+        """Test the connection export streams CSV without any token column."""
+        body = self._body(self.client.get(reverse('export_connections')))
+        
+        rows = list(csv.reader(StringIO(body)))
+        self.assertEqual(rows[0][:4], ['id', 'user_id', 'user__username', 'platform'])
+        self.assertEqual(len(rows), 3)
+        self.assertNotIn('encrypted', body)
+        self.assertNotIn(self.connection.encrypted_access_token, body)
+    
+    def test_csv_neutralises_formulas(self):
+        """Test user-controlled cells that look like formulas are quoted in CSV but not in JSONL."""
+        ConnectionLog.objects.create(
+            connection=self.connection, action='error', details='=HYPERLINK("http://evil")', user_agent='@SUM(1+1)',
+        )
+        
+        rows = list(csv.DictReader(StringIO(self._body(self.client.get(reverse('export_logs'), {'action': 'error'})))))
+        records = self._body(self.client.get(reverse('export_logs'), {'action': 'error', 'format': 'jsonl'}))
+        
+        self.assertEqual(rows[0]['details'], '\'=HYPERLINK("http://evil")')
+        self.assertEqual(rows[0]['user_agent'], "'@SUM(1+1)")
+        self.assertEqual(json.loads(records)['details'], '=HYPERLINK("http://evil")')
+    
+    def test_connections_filters(self):
+        """Test platform and status filters."""
+        body = self._body(self.client.get(reverse('export_connections'), {'status': 'error', 'format': 'jsonl'}))
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([record['platform'] for record in records], ['twitter'])
+    
+    def test_logs_jsonl_with_action_and_dates(self):
+        """Test log exports filter by action and date range."""
+        today = timezone.now().date().isoformat()
+        body = self._body(self.client.get(
+            reverse('export_logs'),
+            {'format': 'jsonl', 'action': 'connected', 'platform': 'facebook', 'since': today, 'until': today},
+        ))
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['details'], 'Connected as Test')
+        
+        body = self._body(self.client.get(reverse('export_logs'), {'until': '2000-01-01'}))
+        self.assertEqual(len(body.splitlines()), 1)  # header only
+    
+    def test_invalid_filters_rejected(self):
+        """Test unknown filter values are a 400 rather than an empty export."""
+        self.assertEqual(self.client.get(reverse('export_logs'), {'action': 'bogus'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_connections'), {'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_connections'), {'format': 'xml'}).status_code, 400)
+    
+    def test_exports_are_staff_only(self):
+        """Test non-staff users are redirected to the admin login."""
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('export_connections')).status_code, 302)
+    
+    def test_admin_action_streams_selection(self):
+        """Test the admin export action streams the selected rows."""
+        response = self.client.post(reverse('admin:oauth_manager_platformconnection_changelist'), {
+            'action': 'export_csv',
+            '_selected_action': [self.connection.pk],
+        })
+        
+        self.assertIsInstance(response, StreamingHttpResponse)
+        rows = list(csv.reader(StringIO(self._body(response))))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][0], str(self.connection.pk))
+
+
+class MetricsTestCase(OAuthHubTestCase):
+    """Test cases for the Prometheus metrics."""
+    
+    def sample(self, name, **labels):
+        return metrics.REGISTRY.get_sample_value(name, labels) or 0
+    
+    def test_scrape_exposes_state(self):
+        """Test /metrics serves connection, session and circuit gauges."""
+        PlatformConnection.objects.create(user=self.user, platform='facebook', status='connected')
+        self.create_session('s1', platform='twitter')
+        
+        response = self.client.get(reverse('metrics'))
+        
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('oauth_hub_connections{platform="facebook",status="connected"} 1.0', body)
+        self.assertIn('oauth_hub_oauth_sessions_active 1.0', body)
+        self.assertIn('oauth_hub_provider_circuit_state{platform="twitter",state="closed"} 1.0', body)
+        self.assertIn('oauth_hub_request_seconds_bucket', body)
+    
+    def test_scrape_restricted_to_allowed_addresses_and_staff(self):
+        """Test other addresses need a staff login."""
+        with self.settings(OAUTH_METRICS_ALLOWED_IPS=['10.0.0.0/8']):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            self.assertEqual(Client(REMOTE_ADDR='10.1.2.3').get(reverse('metrics')).status_code, 200)
+            
+            self.user.is_staff = True
+            self.user.save()
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+    
+    def test_flow_outcomes_and_errors_counted(self):
+        """Test callbacks count their outcome and set_error is counted."""
+        before = self.sample('oauth_hub_oauth_flows_completed_total', platform='facebook', outcome='denied')
+        errors = self.sample('oauth_hub_connection_errors_total', platform='facebook')
+        
+        self.client.get(reverse('oauth_callback', kwargs={'platform': 'facebook'}), {'error': 'access_denied'})
+        PlatformConnection.objects.create(user=self.user, platform='facebook').set_error('boom')
+        
+        self.assertEqual(self.sample('oauth_hub_oauth_flows_completed_total', platform='facebook', outcome='denied'), before + 1)
+        self.assertEqual(self.sample('oauth_hub_connection_errors_total', platform='facebook'), errors + 1)
+    
+    def test_provider_calls_observed(self):
+        """Test provider latency and status classes are recorded per endpoint."""
+        labels = {'platform': 'facebook', 'endpoint': 'token'}
+        count = self.sample('oauth_hub_provider_request_seconds_count', **labels)
+        server_errors = self.sample('oauth_hub_provider_responses_total', status='5xx', **labels)
+        session = Mock()
+        session.post.return_value = Mock(status_code=503)
+        
+        with patch('oauth_manager.http_client.get_session', return_value=session):
+            http_client.post('facebook', 'https://graph.facebook.com/token', endpoint='token')
+        
+        self.assertEqual(self.sample('oauth_hub_provider_request_seconds_count', **labels), count + 1)
+        self.assertEqual(self.sample('oauth_hub_provider_responses_total', status='5xx', **labels), server_errors + 1)
+
+
+class ProfilingTestCase(OAuthHubTestCase):
+    """Test cases for sampled request profiling."""
+    
+    def setUp(self):
+        super().setUp()
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+    
+    def profiling(self, **overrides):
+        return self.settings(**{
+            'OAUTH_PROFILING_ENABLED': True,
+            'OAUTH_PROFILING_SAMPLE_RATE': 0,
+            'OAUTH_PROFILING_DIR': self.profile_dir.name,
+            **overrides,
+        })
+    
+    def profiles(self):
+        return sorted(Path(self.profile_dir.name).glob('*.prof'))
+    
+    def test_disabled_by_default(self):
+        """Test nothing is profiled unless profiling is turned on."""
+        with self.settings(OAUTH_PROFILING_DIR=self.profile_dir.name, OAUTH_PROFILING_SAMPLE_RATE=1):
+            self.client.get(reverse('dashboard'))
+        
+        self.assertEqual(self.profiles(), [])
+    
+    def test_sampled_request_dumped_and_ring_bounded(self):
+        """Test sampled requests are dumped and only the newest profiles are kept."""
+        with self.profiling(OAUTH_PROFILING_SAMPLE_RATE=1, OAUTH_PROFILING_MAX_FILES=2):
+            for _ in range(3):
+                self.client.get(reverse('dashboard'))
+        
+        profiles = self.profiles()
+        self.assertEqual(len(profiles), 2)
+        self.assertIn('-dashboard-', profiles[0].name)
+    
+    def test_path_and_header_triggers(self):
+        """Test matching paths and the header token force a profile."""
+        with self.profiling(OAUTH_PROFILING_PATHS=[reverse('connection_status', args=['facebook'])], OAUTH_PROFILING_HEADER_TOKEN='secret'):
+            self.client.get(reverse('dashboard'))
+            self.client.get(reverse('dashboard'), HTTP_X_PROFILE_REQUEST='wrong')
+            self.assertEqual(self.profiles(), [])
+            
+            self.client.get(reverse('connection_status', args=['facebook']))
+            self.client.get(reverse('dashboard'), HTTP_X_PROFILE_REQUEST='secret')
+        
+        self.assertEqual(len(self.profiles()), 2)
+    
+    def test_profile_report(self):
+        """Test the report aggregates the dumped profiles."""
+        with self.profiling(OAUTH_PROFILING_SAMPLE_RATE=1):
+            self.client.get(reverse('dashboard'))
+            self.client.get(reverse('connection_status', args=['facebook']))
+        out = StringIO()
+        
+        call_command('profile_report', dir=self.profile_dir.name, top=5, stdout=out)
+        call_command('profile_report', dir=self.profile_dir.name, match='connection_status', stdout=out)
+        
+        report = out.getvalue()
+        self.assertIn('Aggregated 2 profiles', report)
+        self.assertIn('Aggregated 1 profiles', report)
+        self.assertIn('connection_status (views.py:', report)
+
+
+class TokenRefreshTestCase(OAuthHubTestCase):
+    """Test cases for the background token refresh worker."""
+    
+    @patch('oauth_manager.management.commands.refresh_tokens.refresh_access_token')
+    def test_refreshes_tokens_within_horizon(self, mock_refresh):
+        """Test only soon-to-expire tokens with a refresh token are refreshed."""
+        mock_refresh.return_value = {'access_token': 'new-token', 'expires_in': 7200}
+        due = self.create_connection('twitter', access_token='old-token', refresh_token='refresh-token', expires_in_minutes=10)
+        later = self.create_connection('youtube', access_token='old-token', refresh_token='refresh-token', expires_in_minutes=600)
+        no_refresh = self.create_connection('tiktok', access_token='old-token', expires_in_minutes=10)
+        
+        call_command('refresh_tokens', horizon_minutes=30, stdout=StringIO())
+        
+        mock_refresh.assert_called_once()
+        due = PlatformConnection.objects.get(pk=due.pk)
+        self.assertEqual(due.access_token, 'new-token')
+        self.assertEqual(due.refresh_token, 'refresh-token')
+        self.assertGreater(due.token_expires_at, timezone.now() + timezone.timedelta(minutes=60))
+        self.assertTrue(ConnectionLog.objects.filter(connection=due, action='token_refreshed').exists())
+        self.assertEqual(PlatformConnection.objects.get(pk=later.pk).access_token, 'old-token')
+        self.assertEqual(PlatformConnection.objects.get(pk=no_refresh.pk).access_token, 'old-token')
+    
+    @patch('oauth_manager.management.commands.refresh_tokens.refresh_access_token')
+    def test_skips_providers_without_refresh(self, mock_refresh):
+        """Test platforms whose provider can't refresh are never sent a refresh request."""
+        connection = self.create_connection('facebook', access_token='old-token', refresh_token='refresh-token', expires_in_minutes=-5)
+        
+        call_command('refresh_tokens', stdout=StringIO(), stderr=StringIO())
+        
+        mock_refresh.assert_not_called()
+        self.assertEqual(PlatformConnection.objects.get(pk=connection.pk).status, 'connected')
+    
+    @patch('oauth_manager.management.commands.refresh_tokens.refresh_access_token')
+    def test_rejected_refresh_sets_error(self, mock_refresh):
+        """Test a refresh token rejected by the provider marks the connection as errored and logs it."""
+        mock_refresh.side_effect = RefreshRejected('invalid_grant')
+        connection = self.create_connection('twitter', access_token='old-token', refresh_token='refresh-token', expires_in_minutes=-5)
+        failures = metrics.REGISTRY.get_sample_value(
+            'oauth_hub_token_refreshes_total', {'platform': 'twitter', 'result': 'failed'},
+        ) or 0
+        
+        call_command('refresh_tokens', stdout=StringIO())
+        
+        connection.refresh_from_db()
+        self.assertEqual(connection.status, 'error')
+        self.assertEqual(metrics.REGISTRY.get_sample_value(
+            'oauth_hub_token_refreshes_total', {'platform': 'twitter', 'result': 'failed'},
+        ), failures + 1)
+        self.assertTrue(ConnectionLog.objects.filter(connection=connection, action='error').exists())
+    
+    @override_settings(OAUTH_TOKEN_REFRESH_BACKOFF_SECONDS=60, OAUTH_TOKEN_REFRESH_MAX_BACKOFF_SECONDS=100)
+    @patch('oauth_manager.management.commands.refresh_tokens.refresh_access_token')
+    def test_transient_failure_keeps_status_and_backs_off(self, mock_refresh):
+        """Test a transient refresh failure leaves the status alone and is retried after a bounded backoff."""
+        mock_refresh.return_value = None
+        connection = self.create_connection('twitter', access_token='old-token', refresh_token='refresh-token', expires_in_minutes=10)
+        updated_at = PlatformConnection.objects.get(pk=connection.pk).updated_at
+        
+        call_command('refresh_tokens', stdout=StringIO(), stderr=StringIO())
+        call_command('refresh_tokens', stdout=StringIO(), stderr=StringIO())
+        
+        self.assertEqual(mock_refresh.call_count, 1)  # second sweep skipped while backing off
+        connection = PlatformConnection.objects.get(pk=connection.pk)
+        self.assertEqual(connection.status, 'connected')
+        self.assertEqual(connection.updated_at, updated_at)
+        self.assertEqual(connection.error_count, 1)
+        self.assertEqual([backoff_seconds(n) for n in (1, 2, 3)], [60, 100, 100])
+        
+        cache.delete(backoff_key(connection.pk))
+        mock_refresh.return_value = {'access_token': 'new-token', 'expires_in': 7200}
+        call_command('refresh_tokens', stdout=StringIO())
+        
+        connection = PlatformConnection.objects.get(pk=connection.pk)
+        self.assertEqual(connection.access_token, 'new-token')
+        self.assertEqual(connection.error_count, 0)
+    
+    @patch('oauth_manager.management.commands.refresh_tokens.refresh_access_token')
+    def test_refresh_without_expires_in_clears_expiry(self, mock_refresh):
+        """Test a refresh response without expires_in doesn't keep the old token's past expiry."""
+        mock_refresh.return_value = {'access_token': 'new-token'}
+        connection = self.create_connection('twitter', access_token='old-token', refresh_token='refresh-token', expires_in_minutes=-5)
+        
+        call_command('refresh_tokens', stdout=StringIO())
+        call_command('refresh_tokens', stdout=StringIO())
+        
+        mock_refresh.assert_called_once()
+        connection = PlatformConnection.objects.get(pk=connection.pk)
+        self.assertEqual(connection.access_token, 'new-token')
+        self.assertIsNone(connection.token_expires_at)
+        self.assertFalse(connection.is_token_expired)
+    
+    @patch('oauth_manager.management.commands.refresh_tokens.refresh_access_token')
+    def test_executors_shut_down_on_unexpected_error(self, mock_refresh):
+        """Test the refresh pools are shut down even when a refresh raises unexpectedly."""
+        mock_refresh.side_effect = RuntimeError('boom')
+        self.create_connection('twitter', access_token='old-token', refresh_token='refresh-token', expires_in_minutes=10)
+        
+        with patch.object(ThreadPoolExecutor, 'shutdown', autospec=True,
+                          side_effect=ThreadPoolExecutor.shutdown) as shutdown:
+            with self.assertRaises(RuntimeError):
+                call_command('refresh_tokens', stdout=StringIO())
+        
+        shutdown.assert_called_once()
+    
+    def test_refresh_classifies_provider_errors(self):
+        """Test only an invalid_grant/invalid_client answer counts as a rejected refresh token."""
+        provider = get_provider('twitter')
+        rejected = Mock(status_code=400, text='', json=Mock(return_value={'error': 'invalid_grant'}))
+        unavailable = Mock(status_code=503, text='', json=Mock(side_effect=ValueError))
+        
+        with patch('oauth_manager.views.http_client.post', return_value=rejected):
+            with self.assertRaises(RefreshRejected):
+                refresh_access_token(provider, 'refresh-token')
+        with patch('oauth_manager.views.http_client.post', return_value=unavailable):
+            self.assertIsNone(refresh_access_token(provider, 'refresh-token'))
 
 
 class ViewsTestCase(OAuthHubTestCase):
@@ -153,13 +954,13 @@ class ViewsTestCase(OAuthHubTestCase):
         response = self.client.post(reverse('oauth_initiate', kwargs={'platform': 'invalid'}))
         self.assertRedirects(response, reverse('dashboard'))
     
-    @patch('oauth_manager.views.settings.OAUTH_PLATFORMS')
-    def test_initiate_oauth_unconfigured_platform(self, mock_platforms):
+    def test_initiate_oauth_unconfigured_platform(self):
         """Test OAuth initiation with unconfigured platform."""
-        mock_platforms.get.return_value = None
-        
-        response = self.client.post(reverse('oauth_initiate', kwargs={'platform': 'facebook'}))
+        platforms = {**settings.OAUTH_PLATFORMS, 'facebook': {**settings.OAUTH_PLATFORMS['facebook'], 'client_id': None}}
+        with self.settings(OAUTH_PLATFORMS=platforms):
+            response = self.client.post(reverse('oauth_initiate', kwargs={'platform': 'facebook'}))
         self.assertRedirects(response, reverse('dashboard'))
+        self.assertFalse(OAuthSession.objects.filter(user=self.user).exists())
     
     def test_oauth_callback_missing_parameters(self):
         """Test OAuth callback with missing parameters."""
@@ -215,6 +1016,40 @@ class ViewsTestCase(OAuthHubTestCase):
         self.assertEqual(data['status'], 'connected')
         self.assertEqual(data['platform_username'], 'Test User')
     
+    def test_connection_status_missing_connection(self):
+        """Test the status API answers 404 for a platform the user never connected."""
+        response = self.client.get(reverse('connection_status', kwargs={'platform': 'facebook'}))
+        
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.content), {'error': 'Connection not found'})
+    
+    def test_connection_statuses_api(self):
+        """Test the bulk status endpoint returns every platform."""
+        PlatformConnection.objects.create(user=self.user, platform='facebook', status='connected')
+        
+        response = self.client.get(reverse('connection_statuses'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('ETag'))
+        platforms = json.loads(response.content)['platforms']
+        self.assertEqual(set(platforms), {key for key, _ in PlatformConnection.PLATFORM_CHOICES})
+        self.assertEqual(platforms['facebook']['status'], 'connected')
+        self.assertEqual(platforms['twitter']['status'], 'disconnected')
+    
+    def test_connection_statuses_not_modified(self):
+        """Test the bulk status endpoint honours If-None-Match until something changes."""
+        connection = PlatformConnection.objects.create(user=self.user, platform='facebook', status='connected')
+        etag = self.client.get(reverse('connection_statuses'))['ETag']
+        
+        response = self.client.get(reverse('connection_statuses'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        connection.status = 'error'
+        connection.save()
+        response = self.client.get(reverse('connection_statuses'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
     def test_create_demo_user(self):
         """Test demo user creation (only in DEBUG mode)."""
         with self.settings(DEBUG=True):
@@ -246,7 +1081,7 @@ class UtilityTestCase(TestCase):
         self.assertTrue(state1.isalnum())
         self.assertTrue(state2.isalnum())
     
-    @patch('oauth_manager.views.requests.post')
+    @patch('oauth_manager.views.http_client.post')
     def test_exchange_code_for_token_success(self, mock_post):
         """Test successful token exchange."""
         mock_response = Mock()
@@ -258,19 +1093,17 @@ class UtilityTestCase(TestCase):
         }
         mock_post.return_value = mock_response
         
-        platform_config = settings.OAUTH_PLATFORMS['facebook']
         result = exchange_code_for_token(
-            'facebook',
+            get_provider('facebook'),
             'test_auth_code',
-            'http://localhost:8000/callback/',
-            platform_config
+            'http://localhost:8000/callback/'
         )
         
         self.assertIsNotNone(result)
         self.assertEqual(result['access_token'], 'test_access_token')
         self.assertEqual(result['expires_in'], 3600)
     
-    @patch('oauth_manager.views.requests.post')
+    @patch('oauth_manager.views.http_client.post')
     def test_exchange_code_for_token_failure(self, mock_post):
         """Test failed token exchange."""
         mock_response = Mock()
@@ -278,17 +1111,993 @@ class UtilityTestCase(TestCase):
         mock_response.text = 'Invalid authorization code'
         mock_post.return_value = mock_response
         
-        platform_config = settings.OAUTH_PLATFORMS['facebook']
         result = exchange_code_for_token(
-            'facebook',
+            get_provider('facebook'),
             'invalid_auth_code',
-            'http://localhost:8000/callback/',
-            platform_config
+            'http://localhost:8000/callback/'
         )
         
         self.assertIsNone(result)
 
 
+class ProviderRegistryTestCase(TestCase):
+    """Test cases for the precompiled provider descriptors."""
+    
+    def test_registry_covers_supported_platforms(self):
+        """Test there is one descriptor per platform choice, in display order."""
+        self.assertEqual(list(get_registry()), [key for key, _ in PlatformConnection.PLATFORM_CHOICES])
+        self.assertIsNone(get_provider('invalid'))
+        self.assertIs(get_provider('facebook'), get_provider('facebook'))
+    
+    def test_descriptors_are_immutable(self):
+        """Test descriptors and their templates can't be mutated by a request."""
+        provider = get_provider('facebook')
+        with self.assertRaises(AttributeError):
+            provider.token_url = 'https://example.com/'
+        with self.assertRaises(TypeError):
+            provider.token_template['client_id'] = 'other'
+    
+    def test_authorization_url(self):
+        """Test the static prefix plus per-request parameters, including platform extras."""
+        platforms = {**settings.OAUTH_PLATFORMS, 'facebook': {**settings.OAUTH_PLATFORMS['facebook'], 'client_id': 'fb-id'}}
+        with self.settings(OAUTH_PLATFORMS=platforms):
+            url = get_provider('facebook').authorization_url('http://testserver/cb/', 'abc123')
+        
+        self.assertTrue(url.startswith(settings.OAUTH_PLATFORMS['facebook']['auth_url'] + '?'))
+        for param in ('client_id=fb-id', 'display=popup', 'state=abc123', 'response_type=code'):
+            self.assertIn(param, url)
+        self.assertNotIn('code_challenge', url)
+        twitter = get_provider('twitter')
+        verifier = twitter.new_code_verifier()
+        query = parse_qs(urlsplit(twitter.authorization_url('http://testserver/cb/', 'abc123', verifier)).query)
+        self.assertEqual(query['code_challenge'], [code_challenge(verifier)])
+        self.assertEqual(query['code_challenge_method'], ['S256'])
+        self.assertIsNone(get_provider('facebook').new_code_verifier())
+    
+    def test_pkce_challenge(self):
+        """Test verifiers are RFC 7636 sized and challenges match the RFC's S256 example."""
+        self.assertTrue(43 <= len(get_provider('twitter').new_code_verifier()) <= 128)
+        self.assertEqual(
+            code_challenge('dBjftJeZ4CVP-mB92K27uhbUJU1p1r_wW1gFWFOEjXk'),
+            'E9Melhoa2OwvFrEMTJguCHaoeK1t8URWbuGJSstw-cM',
+        )
+    
+    def test_token_request(self):
+        """Test token exchanges start from the template and PKCE adds the flow's verifier."""
+        data, headers = get_provider('twitter').token_request('the-code', 'http://testserver/cb/', 'the-verifier')
+        
+        self.assertEqual(data['grant_type'], 'authorization_code')
+        self.assertEqual(data['code'], 'the-code')
+        self.assertEqual(data['code_verifier'], 'the-verifier')
+        self.assertEqual(headers['Content-Type'], 'application/x-www-form-urlencoded')
+        self.assertNotIn('code_verifier', get_provider('facebook').token_request('the-code', 'uri')[0])
+        self.assertEqual(get_provider('youtube').refresh_request('rt')[0]['grant_type'], 'refresh_token')
+    
+    def test_capabilities_overridable_from_settings(self):
+        """Test OAUTH_PLATFORMS entries override profile flags and rebuild the registry."""
+        self.assertFalse(get_provider('linkedin').supports_pkce)
+        platforms = {**settings.OAUTH_PLATFORMS, 'linkedin': {**settings.OAUTH_PLATFORMS['linkedin'], 'pkce': True}}
+        with self.settings(OAUTH_PLATFORMS=platforms):
+            self.assertTrue(get_provider('linkedin').supports_pkce)
+            self.assertIsInstance(get_provider('linkedin'), ProviderDescriptor)
+        self.assertFalse(get_provider('linkedin').supports_pkce)
+
+
+class AtomicCacheTestCase(OAuthHubTestCase):
+    """Test cases for the counters and locks shared between workers through the file cache."""
+    
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        override = self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': self.cache_dir.name,
+        }})
+        override.enable()
+        self.addCleanup(override.disable)
+    
+    def run_concurrently(self, target, workers=8):
+        threads = [threading.Thread(target=target) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    
+    def test_incr_exact_under_contention(self):
+        """Test concurrent increments on the file cache are never lost."""
+        def work():
+            for _ in range(25):
+                atomic_cache.incr('oauth_hub:test:counter', timeout=60)
+        
+        self.run_concurrently(work)
+        
+        self.assertEqual(cache.get('oauth_hub:test:counter'), 200)
+    
+    def test_rate_limit_not_exceeded_under_contention(self):
+        """Test concurrent callers never draw more than the bucket holds."""
+        platforms = {
+            **settings.OAUTH_PLATFORMS,
+            'facebook': {**settings.OAUTH_PLATFORMS['facebook'], 'rate_limits': {'token': {'rate': 0.001, 'burst': 20, 'max_wait': 0}}},
+        }
+        admitted = []
+        with self.settings(OAUTH_PLATFORMS=platforms):
+            limit = get_provider('facebook').rate_limits['token']
+            
+            def work():
+                for _ in range(10):
+                    try:
+                        limit.reserve()
+                    except RateLimited:
+                        continue
+                    admitted.append(1)
+            
+            self.run_concurrently(work)
+        
+        self.assertEqual(len(admitted), 20)
+    
+    def test_bulkhead_count_exact_under_contention(self):
+        """Test concurrent enter()/exit() calls keep the shared in-flight count exact."""
+        guard = ProviderGuard('tiktok', ResiliencePolicy.from_config(
+            {**settings.OAUTH_PROVIDER_RESILIENCE, 'max_concurrency': 1000},
+        ))
+        
+        def work():
+            for call in range(25):
+                admission = guard.enter()
+                if call % 5:
+                    guard.exit(admission, True, 0)  # every fifth call stays in flight
+        
+        self.run_concurrently(work)
+        
+        self.assertEqual(guard.in_flight(), 40)
+        self.assertEqual(guard.window()['calls'], 160)
+    
+    def test_lock_released_only_by_owner(self):
+        """Test a holder whose lock expired doesn't release the worker that retook it."""
+        first = atomic_cache.Lock('oauth_hub:test:lock', 1)
+        self.assertTrue(first.acquire(1, 0))
+        self.assertFalse(atomic_cache.Lock('oauth_hub:test:lock', 1).acquire(1, 0))
+        
+        cache.set('oauth_hub:test:lock', 'another-worker', 1)  # expired and retaken
+        first.release()
+        
+        self.assertEqual(cache.get('oauth_hub:test:lock'), 'another-worker')
+    
+    def test_contended_lock_decision_is_counted(self):
+        """Test a bucket whose lock can't be taken refuses the call unless failing open, and counts it."""
+        def timeouts(decision):
+            return metrics.REGISTRY.get_sample_value(
+                'oauth_hub_rate_limit_lock_timeouts_total',
+                {'platform': 'facebook', 'endpoint': 'token', 'decision': decision},
+            ) or 0
+        
+        platforms = {**settings.OAUTH_PLATFORMS, 'facebook': {**settings.OAUTH_PLATFORMS['facebook'], 'rate_limits': {'token': {'rate': 5}}}}
+        closed, opened = timeouts('closed'), timeouts('open')
+        with self.settings(OAUTH_PLATFORMS=platforms):
+            limit = get_provider('facebook').rate_limits['token']
+            cache.set(f'{limit.key}:lock', 'held', 60)
+            with patch('oauth_manager.rate_limit.LOCK_ATTEMPTS', 2):
+                with self.assertRaises(RateLimited):
+                    limit.reserve()
+                with self.settings(OAUTH_RATE_LIMIT_FAIL_OPEN=True):
+                    self.assertEqual(limit.reserve(), 0)
+        
+        self.assertEqual(timeouts('closed'), closed + 1)
+        self.assertEqual(timeouts('open'), opened + 1)
+    
+    def test_non_atomic_backend_warns(self):
+        """Test a cache without atomic counters is reported by the system check."""
+        self.assertEqual(atomic_cache.check_atomic_cache(None), [])
+        
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}):
+            warnings = atomic_cache.check_atomic_cache(None)
+        
+        self.assertEqual([warning.id for warning in warnings], ['oauth_manager.W001'])
+
+
+class RateLimitTestCase(OAuthHubTestCase):
+    """Test cases for the shared outbound rate limiter."""
+    
+    def _platforms(self, **limits):
+        return {**settings.OAUTH_PLATFORMS, 'facebook': {**settings.OAUTH_PLATFORMS['facebook'], 'rate_limits': limits}}
+    
+    def test_burst_then_fail_fast(self):
+        """Test a bucket admits its burst and then refuses calls it can't serve within max_wait."""
+        with self.settings(OAUTH_PLATFORMS=self._platforms(token={'rate': 1, 'burst': 2, 'max_wait': 0})):
+            limit = get_provider('facebook').rate_limits['token']
+            self.assertEqual(limit.reserve(), 0)
+            self.assertEqual(limit.reserve(), 0)
+            with self.assertRaises(RateLimited) as raised:
+                limit.reserve()
+        self.assertGreater(raised.exception.retry_after, 0)
+    
+    def test_short_waits_are_reserved(self):
+        """Test a caller within max_wait is given its slot and told how long to wait."""
+        with self.settings(OAUTH_PLATFORMS=self._platforms(userinfo={'rate': 10, 'burst': 1, 'max_wait': 1})):
+            limit = get_provider('facebook').rate_limits['userinfo']
+            self.assertEqual(limit.reserve(), 0)
+            self.assertAlmostEqual(limit.reserve(), 0.1, delta=0.05)
+            self.assertAlmostEqual(limit.reserve(), 0.2, delta=0.05)
+    
+    def test_provider_429_raises_and_holds_bucket(self):
+        """Test a provider 429 raises RateLimited and empties the bucket for Retry-After."""
+        throttled = Mock(status_code=429, headers={'Retry-After': '30'})
+        with self.settings(OAUTH_PLATFORMS=self._platforms(token={'rate': 5, 'burst': 5})):
+            with patch.object(requests.Session, 'post', return_value=throttled):
+                with self.assertRaises(RateLimited):
+                    http_client.post('facebook', 'https://graph.facebook.com/oauth/access_token', endpoint='token')
+            with self.assertRaises(RateLimited):
+                get_provider('facebook').rate_limits['token'].reserve()
+        http_client.close_sessions()
+    
+    @patch('oauth_manager.views.exchange_code_for_token', side_effect=RateLimited('facebook', 'token', 5))
+    def test_rate_limited_callback_does_not_set_error(self, mock_exchange):
+        """Test a throttled token exchange leaves the connection without an error."""
+        connection = PlatformConnection.objects.create(user=self.user, platform='facebook', status='connecting')
+        session = self.create_session('ratelimitedstate')
+        
+        response = self.client.get(
+            reverse('oauth_callback', kwargs={'platform': 'facebook'}),
+            {'code': 'test_auth_code', 'state': session.state},
+        )
+        
+        self.assertRedirects(response, reverse('dashboard'))
+        connection.refresh_from_db()
+        self.assertNotEqual(connection.status, 'error')
+    
+    @patch('oauth_manager.management.commands.refresh_tokens.refresh_access_token', side_effect=RateLimited('youtube', 'refresh', 5))
+    def test_refresh_worker_defers_rate_limited(self, mock_refresh):
+        """Test throttled refreshes are left for the next sweep."""
+        connection = self.create_connection('youtube', access_token='old-token', refresh_token='refresh-token', expires_in_minutes=1)
+        out = StringIO()
+        
+        call_command('refresh_tokens', stdout=out, stderr=StringIO())
+        
+        connection.refresh_from_db()
+        self.assertEqual(connection.status, 'connected')
+        self.assertIn('Refreshed 0 tokens, 0 failed', out.getvalue())
+
+
+class ResilienceTestCase(OAuthHubTestCase):
+    """Test cases for provider circuit breakers and bulkheads."""
+    
+    def setUp(self):
+        super().setUp()
+        policy = {**settings.OAUTH_PROVIDER_RESILIENCE, 'min_calls': 2, 'failure_rate': 0.5, 'max_concurrency': 1}
+        override = self.settings(OAUTH_PROVIDER_RESILIENCE=policy)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(http_client.close_sessions)
+    
+    def test_breaker_opens_and_fails_fast(self):
+        """Test repeated provider failures open the circuit so later calls aren't sent."""
+        with patch.object(requests.Session, 'post', return_value=Mock(status_code=503)) as mock_post:
+            http_client.post('tiktok', 'https://open.tiktokapis.com/v2/oauth/token/')
+            http_client.post('tiktok', 'https://open.tiktokapis.com/v2/oauth/token/')
+            with self.assertRaises(CircuitOpen):
+                http_client.post('tiktok', 'https://open.tiktokapis.com/v2/oauth/token/')
+        
+        self.assertEqual(mock_post.call_count, 2)
+        status = get_guard('tiktok').status()
+        self.assertEqual(status['state'], 'open')
+        self.assertEqual(status['rejected']['circuit'], 1)
+        self.assertEqual(get_guard('facebook').state(), 'closed')
+    
+    def test_half_open_probe_closes_circuit(self):
+        """Test a successful probe after open_seconds closes the circuit."""
+        guard = get_guard('tiktok')
+        guard.trip()
+        cache.set(guard._key('open_until'), 0)  # open period elapsed
+        
+        with patch.object(requests.Session, 'get', return_value=Mock(status_code=200)):
+            http_client.get('tiktok', 'https://open.tiktokapis.com/v2/user/info/')
+        
+        self.assertEqual(guard.state(), 'closed')
+    
+    def test_bulkhead_caps_concurrent_calls(self):
+        """Test calls over a provider's concurrency cap are rejected immediately."""
+        guard = get_guard('tiktok')
+        probe = guard.enter()
+        try:
+            with self.assertRaises(BulkheadFull):
+                guard.enter()
+            # Other providers have their own slots
+            get_guard('facebook').exit(get_guard('facebook').enter(), True, 0)
+        finally:
+            guard.exit(probe, True, 0)
+        
+        self.assertEqual(guard.status()['rejected']['bulkhead'], 1)
+        self.assertEqual(guard.status()['in_flight'], 0)
+    
+    def test_bulkhead_shared_between_processes(self):
+        """Test the concurrency cap counts calls made by other workers through the cache."""
+        guard = get_guard('tiktok')
+        other_worker = ProviderGuard('tiktok', guard.policy)
+        admission = guard.enter()
+        try:
+            with self.assertRaises(BulkheadFull):
+                other_worker.enter()
+            self.assertEqual(other_worker.status()['in_flight'], 1)
+        finally:
+            guard.exit(admission, True, 0)
+        
+        other_worker.exit(other_worker.enter(), True, 0)
+    
+    def test_leaked_bulkhead_slot_expires(self):
+        """Test a call never released by a killed worker stops counting after two windows."""
+        guard = get_guard('tiktok')
+        now = time.time()
+        with patch('oauth_manager.resilience.time.time', return_value=now):
+            guard.enter()  # never exited
+        
+        with patch('oauth_manager.resilience.time.time', return_value=now + guard.policy.window_seconds * 2):
+            self.assertEqual(guard.in_flight(), 0)
+            guard.exit(guard.enter(), True, 0)
+    
+    @patch('oauth_manager.views.exchange_code_for_token', side_effect=CircuitOpen('facebook', 30))
+    def test_open_circuit_callback_does_not_set_error(self, mock_exchange):
+        """Test an open circuit during the callback leaves the connection without an error."""
+        connection = PlatformConnection.objects.create(user=self.user, platform='facebook', status='connecting')
+        session = self.create_session('circuitopenstate')
+        
+        response = self.client.get(
+            reverse('oauth_callback', kwargs={'platform': 'facebook'}),
+            {'code': 'test_auth_code', 'state': session.state},
+        )
+        
+        self.assertRedirects(response, reverse('dashboard'))
+        connection.refresh_from_db()
+        self.assertNotEqual(connection.status, 'error')
+    
+    def test_initiate_refused_while_circuit_open(self):
+        """Test users aren't sent to a provider whose circuit is open."""
+        platforms = {**settings.OAUTH_PLATFORMS, 'facebook': {**settings.OAUTH_PLATFORMS['facebook'], 'client_id': 'fb-id'}}
+        get_guard('facebook').trip()
+        
+        with self.settings(OAUTH_PLATFORMS=platforms):
+            response = self.client.post(reverse('oauth_initiate', kwargs={'platform': 'facebook'}))
+        
+        self.assertRedirects(response, reverse('dashboard'))
+        self.assertFalse(OAuthSession.objects.filter(user=self.user).exists())
+    
+    def test_provider_health_is_staff_only(self):
+        """Test breaker status is served to staff and hidden from other users."""
+        response = self.client.get(reverse('provider_health'))
+        self.assertEqual(response.status_code, 302)
+        
+        self.user.is_staff = True
+        self.user.save()
+        get_guard('tiktok').trip()
+        response = self.client.get(reverse('provider_health'))
+        
+        self.assertEqual(response.status_code, 200)
+        states = {provider['platform']: provider['state'] for provider in response.json()['providers']}
+        self.assertEqual(states['tiktok'], 'open')
+        self.assertEqual(states['facebook'], 'closed')
+
+
+class HttpClientTestCase(TestCase):
+    """Test cases for the pooled provider HTTP client."""
+    
+    def tearDown(self):
+        http_client.close_sessions()
+    
+    def test_session_reused_per_platform(self):
+        """Test each platform gets one pooled session per process."""
+        self.assertIs(http_client.get_session('facebook'), http_client.get_session('facebook'))
+        self.assertIsNot(http_client.get_session('facebook'), http_client.get_session('twitter'))
+    
+    def test_timeouts_split_connect_and_read(self):
+        """Test per-platform overrides are merged over the defaults."""
+        platforms = {**settings.OAUTH_PLATFORMS, 'tiktok': {**settings.OAUTH_PLATFORMS['tiktok'], 'http': {'read_timeout': 42}}}
+        with self.settings(OAUTH_PLATFORMS=platforms):
+            self.assertEqual(http_client.get_timeout('tiktok'), (settings.OAUTH_HTTP_DEFAULTS['connect_timeout'], 42))
+    
+    @patch('oauth_manager.http_client.time.sleep')
+    def test_get_retries_connection_errors(self, mock_sleep):
+        """Test idempotent GETs are retried with backoff."""
+        ok = Mock(status_code=200)
+        with patch.object(requests.Session, 'get', side_effect=[requests.exceptions.ConnectionError(), ok]) as mock_get:
+            response = http_client.get('facebook', 'https://graph.facebook.com/me')
+        
+        self.assertIs(response, ok)
+        self.assertEqual(mock_get.call_count, 2)
+        mock_sleep.assert_called_once()
+    
+    def test_post_is_not_retried(self):
+        """Test token exchange POSTs are never retried."""
+        with patch.object(requests.Session, 'post', side_effect=requests.exceptions.ConnectionError()) as mock_post:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                http_client.post('facebook', 'https://graph.facebook.com/oauth/access_token', data={})
+        
+        self.assertEqual(mock_post.call_count, 1)
+
+
+class AsyncURLConf:
+    """URLconf serving the async OAuth flow views."""
+    urlpatterns = [
+        path('admin/', admin.site.urls),
+        path('', include(build_urlpatterns(views_async))),
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf)
+class AsyncViewsTestCase(OAuthHubTestCase):
+    """Test cases for the async OAuth flow views."""
+    
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.user)
+    
+    async def test_dashboard(self):
+        """Test the async dashboard renders every platform."""
+        response = await self.async_client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Social Media Connections')
+    
+    async def test_dashboard_requires_login(self):
+        """Test the async dashboard redirects anonymous users."""
+        response = await AsyncClient().get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 302)
+    
+    async def test_initiate_requires_post(self):
+        """Test the async initiate view only accepts POST."""
+        response = await self.async_client.get(reverse('oauth_initiate', kwargs={'platform': 'facebook'}))
+        self.assertEqual(response.status_code, 405)
+    
+    async def test_connection_status(self):
+        """Test the async status API."""
+        await PlatformConnection.objects.acreate(user=self.user, platform='facebook', status='connected')
+        
+        response = await self.async_client.get(reverse('connection_status', kwargs={'platform': 'facebook'}))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['status'], 'connected')
+    
+    async def test_connection_status_missing_connection(self):
+        """Test the async status API answers 404 like the sync view."""
+        response = await self.async_client.get(reverse('connection_status', kwargs={'platform': 'facebook'}))
+        
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.content), {'error': 'Connection not found'})
+    
+    @override_settings(OAUTH_STATUS_STREAM_ENABLED=True, OAUTH_STATUS_STREAM_MAX_SECONDS=0)
+    async def test_status_stream(self):
+        """Test the async SSE endpoint streams the current statuses."""
+        await PlatformConnection.objects.acreate(user=self.user, platform='facebook', status='connected')
+        
+        response = await self.async_client.get(reverse('connection_status_stream'))
+        
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn('"status": "connected"', body)
+    
+    async def test_complete_oauth_flow(self):
+        """Test a full initiate and callback round trip through the async views."""
+        platform_config = {
+            **settings.OAUTH_PLATFORMS['facebook'],
+            'client_id': 'test_client_id',
+            'client_secret': 'test_client_secret',
+        }
+        token_response = Mock(status_code=200)
+        token_response.json.return_value = {'access_token': 'async_token', 'expires_in': 3600}
+        user_response = Mock(status_code=200)
+        user_response.json.return_value = {'id': '42', 'name': 'Async User'}
+        
+        with self.settings(OAUTH_PLATFORMS={**settings.OAUTH_PLATFORMS, 'facebook': platform_config}):
+            response = await self.async_client.post(reverse('oauth_initiate', kwargs={'platform': 'facebook'}))
+            self.assertEqual(response.status_code, 302)
+            
+            session = await OAuthSession.objects.aget(user=self.user, platform='facebook')
+            with patch('oauth_manager.views_async.http_client.apost', AsyncMock(return_value=token_response)), \
+                    patch('oauth_manager.views_async.http_client.aget', AsyncMock(return_value=user_response)):
+                response = await self.async_client.get(
+                    reverse('oauth_callback', kwargs={'platform': 'facebook'}),
+                    {'code': 'test_auth_code', 'state': session.state},
+                )
+        
+        self.assertEqual(response.status_code, 302)
+        connection = await PlatformConnection.objects.aget(user=self.user, platform='facebook')
+        self.assertEqual(connection.status, 'connected')
+        self.assertEqual(connection.platform_username, 'Async User')
+        self.assertEqual(connection.access_token, 'async_token')
+    
+    async def test_stateless_oauth_flow(self):
+        """Test the async views complete a flow from a signed state."""
+        platform_config = {
+            **settings.OAUTH_PLATFORMS['facebook'],
+            'client_id': 'test_client_id',
+            'client_secret': 'test_client_secret',
+        }
+        token_response = Mock(status_code=200)
+        token_response.json.return_value = {'access_token': 'async_token'}
+        user_response = Mock(status_code=200)
+        user_response.json.return_value = {'id': '42', 'name': 'Async User'}
+        
+        with self.settings(OAUTH_PLATFORMS={**settings.OAUTH_PLATFORMS, 'facebook': platform_config}, OAUTH_STATELESS_STATE=True):
+            response = await self.async_client.post(reverse('oauth_initiate', kwargs={'platform': 'facebook'}))
+            state = parse_qs(urlsplit(response.url).query)['state'][0]
+            
+            with patch('oauth_manager.views_async.http_client.apost', AsyncMock(return_value=token_response)), \
+                    patch('oauth_manager.views_async.http_client.aget', AsyncMock(return_value=user_response)):
+                await self.async_client.get(
+                    reverse('oauth_callback', kwargs={'platform': 'facebook'}),
+                    {'code': 'test_auth_code', 'state': state},
+                )
+        
+        self.assertFalse(await OAuthSession.objects.aexists())
+        connection = await PlatformConnection.objects.aget(user=self.user, platform='facebook')
+        self.assertEqual(connection.status, 'connected')
+
+
+@override_settings(OAUTH_QUERY_BUDGET_STRICT=True)
+class QueryBudgetTestCase(OAuthHubTestCase):
+    """
+    Query budgets for every view.
+    
+    Strict mode is on, so a view over its @query_budget raises
+    QueryBudgetExceeded, and assertWithinBudget checks the count reported
+    in the Server-Timing header as well.
+    """
+    
+    def setUp(self):
+        super().setUp()
+        self.connection = self.create_connection(access_token='budget_token', expires_in_minutes=60)
+    
+    def assertWithinBudget(self, response):
+        match = re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', response['Server-Timing'])
+        self.assertIsNotNone(match, response['Server-Timing'])
+        budget = response.resolver_match.func.query_budget
+        self.assertLessEqual(int(match.group(1)), budget)
+        return int(match.group(1))
+    
+    def _configured(self):
+        return self.settings(OAUTH_PLATFORMS={
+            **settings.OAUTH_PLATFORMS,
+            'facebook': {**settings.OAUTH_PLATFORMS['facebook'], 'client_id': 'id', 'client_secret': 'secret'},
+        })
+    
+    def _callback(self, client):
+        token_response = Mock(status_code=200)
+        token_response.json.return_value = {'access_token': 'new_token', 'expires_in': 3600}
+        user_response = Mock(status_code=200)
+        user_response.json.return_value = {'id': '1', 'name': 'Budget User'}
+        
+        with self._configured():
+            client.post(reverse('oauth_initiate', kwargs={'platform': 'facebook'}))
+            session = OAuthSession.objects.get(user=self.user, platform='facebook', is_active=True)
+            with patch('oauth_manager.views.http_client.post', return_value=token_response), \
+                    patch('oauth_manager.views.http_client.get', return_value=user_response):
+                return client.get(
+                    reverse('oauth_callback', kwargs={'platform': 'facebook'}),
+                    {'code': 'code', 'state': session.state},
+                )
+    
+    def test_every_view_declares_a_budget(self):
+        """Test every URL served by the app has a query budget."""
+        for flow_views in (views, views_async):
+            for pattern in build_urlpatterns(flow_views):
+                with self.subTest(pattern=pattern.name, views=flow_views.__name__):
+                    self.assertIsInstance(getattr(pattern.callback, 'query_budget', None), int)
+    
+    def test_dashboard(self):
+        """Test the dashboard stays within its budget."""
+        self.assertWithinBudget(self.client.get(reverse('dashboard')))
+    
+    def test_home_and_legal_pages(self):
+        """Test the home and legal pages stay within their budgets."""
+        self.assertWithinBudget(self.client.get(reverse('home')))
+        # Only the views' own queries are checked; their templates are stubbed out
+        with patch('oauth_manager.views_legal.render', lambda request, template, context=None: HttpResponse()):
+            for name in ('privacy_policy', 'data_deletion', 'terms_of_service'):
+                with self.subTest(name=name):
+                    self.assertWithinBudget(self.client.get(reverse(name)))
+    
+    def test_initiate_oauth(self):
+        """Test starting a flow stays within its budget."""
+        with self._configured():
+            response = self.client.post(reverse('oauth_initiate', kwargs={'platform': 'facebook'}))
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinBudget(response)
+    
+    def test_oauth_callback(self):
+        """Test a successful callback stays within its budget."""
+        response = self._callback(self.client)
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinBudget(response)
+    
+    def test_disconnect_platform(self):
+        """Test disconnecting stays within its budget."""
+        response = self.client.post(reverse('disconnect_platform', kwargs={'platform': 'facebook'}))
+        self.assertWithinBudget(response)
+    
+    def test_status_views(self):
+        """Test the status APIs stay within their budgets on a cold cache."""
+        for url in (
+            reverse('connection_status', kwargs={'platform': 'facebook'}),
+            reverse('connection_statuses'),
+        ):
+            with self.subTest(url=url):
+                self.assertWithinBudget(self.client.get(url))
+    
+    @override_settings(OAUTH_STATUS_STREAM_ENABLED=True, OAUTH_STATUS_STREAM_MAX_SECONDS=0)
+    def test_status_stream(self):
+        """Test opening the status stream stays within its budget."""
+        self.assertWithinBudget(self.client.get(reverse('connection_status_stream')))
+    
+    def test_staff_views(self):
+        """Test the health, metrics and export views stay within their budgets."""
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        for name in ('provider_health', 'metrics', 'export_connections', 'export_logs'):
+            with self.subTest(name=name):
+                self.assertWithinBudget(self.client.get(reverse(name)))
+    
+    def test_create_demo_user(self):
+        """Test demo user creation stays within its budget."""
+        with self.settings(DEBUG=True):
+            self.assertWithinBudget(Client().get(reverse('create_demo_user')))
+    
+    def test_over_budget_raises_in_strict_mode(self):
+        """Test strict mode turns an over-budget request into an error."""
+        with patch.object(views.dashboard, 'query_budget', 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('dashboard'))
+        
+        with self.settings(OAUTH_QUERY_BUDGET_STRICT=False), patch.object(views.dashboard, 'query_budget', 1):
+            with self.assertLogs('oauth_manager.request_metrics', 'WARNING'):
+                self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+    
+    def test_metrics_record_cache_and_provider_calls(self):
+        """Test Server-Timing reports status cache hits and provider time."""
+        url = reverse('connection_status', kwargs={'platform': 'facebook'})
+        self.client.get(url)
+        self.assertIn('cache;desc="1 hits, 0 misses"', self.client.get(url)['Server-Timing'])
+        
+        response = self._callback(self.client)
+        self.assertIn('provider;dur=', response['Server-Timing'])
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf, OAUTH_QUERY_BUDGET_STRICT=True)
+class AsyncQueryBudgetTestCase(OAuthHubTestCase):
+    """Query budgets for the async flow views."""
+    
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.user)
+        self.connection = self.create_connection(access_token='budget_token', expires_in_minutes=60)
+    
+    assertWithinBudget = QueryBudgetTestCase.assertWithinBudget
+    
+    async def test_dashboard_and_status(self):
+        """Test the async dashboard and status API stay within their budgets."""
+        for url in (reverse('dashboard'), reverse('connection_status', kwargs={'platform': 'facebook'})):
+            self.assertWithinBudget(await self.async_client.get(url))
+    
+    async def test_flow(self):
+        """Test the async initiate and callback views stay within their budgets."""
+        token_response = Mock(status_code=200)
+        token_response.json.return_value = {'access_token': 'async_token', 'expires_in': 3600}
+        user_response = Mock(status_code=200)
+        user_response.json.return_value = {'id': '42', 'name': 'Async User'}
+        platforms = {
+            **settings.OAUTH_PLATFORMS,
+            'facebook': {**settings.OAUTH_PLATFORMS['facebook'], 'client_id': 'id', 'client_secret': 'secret'},
+        }
+        with self.settings(OAUTH_PLATFORMS=platforms):
+            response = await self.async_client.post(reverse('oauth_initiate', kwargs={'platform': 'facebook'}))
+            self.assertWithinBudget(response)
+            session = await OAuthSession.objects.aget(user=self.user, platform='facebook', is_active=True)
+            with patch('oauth_manager.views_async.http_client.apost', AsyncMock(return_value=token_response)), \
+                    patch('oauth_manager.views_async.http_client.aget', AsyncMock(return_value=user_response)):
+                response = await self.async_client.get(
+                    reverse('oauth_callback', kwargs={'platform': 'facebook'}),
+                    {'code': 'code', 'state': session.state},
+                )
+        self.assertWithinBudget(response)
+    
+    @override_settings(OAUTH_STATUS_STREAM_ENABLED=True, OAUTH_STATUS_STREAM_MAX_SECONDS=0)
+    async def test_status_stream(self):
+        """Test opening the async status stream stays within its budget."""
+        self.assertWithinBudget(await self.async_client.get(reverse('connection_status_stream')))
+
+
+@override_settings(OAUTH_STATUS_STREAM_ENABLED=True)
+class StatusStreamTestCase(OAuthHubTestCase):
+    """Test cases for the live status broker and SSE endpoint."""
+    
+    def test_status_change_published_on_commit(self):
+        """Test set_error pushes the new status to the user's subscribers."""
+        connection = PlatformConnection.objects.create(user=self.user, platform='facebook', status='connected')
+        subscription = broker.subscribe(self.user.pk, Subscription())
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                connection.set_error('Provider rejected the token')
+            payload = subscription.get(timeout=0)
+        finally:
+            broker.unsubscribe(self.user.pk, subscription)
+        
+        self.assertEqual(payload['platform'], 'facebook')
+        self.assertEqual(payload['status'], 'error')
+    
+    def test_other_users_not_notified(self):
+        """Test subscribers only receive their own user's changes."""
+        other = User.objects.create_user(username='other', password='testpass123')
+        connection = PlatformConnection.objects.create(user=other, platform='facebook')
+        subscription = broker.subscribe(self.user.pk, Subscription())
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                connection.disconnect()
+            self.assertIsNone(subscription.get(timeout=0))
+        finally:
+            broker.unsubscribe(self.user.pk, subscription)
+    
+    @override_settings(OAUTH_STATUS_STREAM_MAX_SECONDS=0)
+    def test_stream_sends_snapshot(self):
+        """Test the stream opens with the user's current statuses."""
+        PlatformConnection.objects.create(user=self.user, platform='facebook', status='connected')
+        
+        response = self.client.get(reverse('connection_status_stream'))
+        
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('retry:', body)
+        self.assertIn('event: status', body)
+        self.assertIn('"status": "connected"', body)
+    
+    @override_settings(OAUTH_STATUS_STREAM_BACKEND='poll', OAUTH_STATUS_STREAM_POLL_SECONDS=0)
+    def test_poll_backend_reports_db_changes(self):
+        """Test the polling fallback picks up rows updated by other workers."""
+        connection = PlatformConnection.objects.create(user=self.user, platform='facebook', status='connected')
+        stream = iter_status_events(self.user)
+        self.assertIn('retry:', next(stream))
+        self.assertIn('"connected"', next(stream))
+        
+        PlatformConnection.objects.filter(pk=connection.pk).update(status='error', updated_at=timezone.now())
+        
+        self.assertIn('"error"', next(stream))
+    
+    @override_settings(OAUTH_STATUS_STREAM_ENABLED=False)
+    def test_stream_disabled_on_sync_workers(self):
+        """Test the dashboard polls and the stream refuses to open when streams are disabled."""
+        dashboard = self.client.get(reverse('dashboard'))
+        response = self.client.get(reverse('connection_status_stream'))
+        
+        self.assertContains(dashboard, 'const statusStreamEnabled = false;')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIsInstance(response, StreamingHttpResponse)
+    
+    def test_dashboard_subscribes_when_enabled(self):
+        """Test the dashboard opens the stream when it is enabled."""
+        self.assertContains(self.client.get(reverse('dashboard')), 'const statusStreamEnabled = true;')
+
+
+class TokenFreeReadsTestCase(OAuthHubTestCase):
+    """Test cases for status reads that never load or decrypt tokens."""
+    
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.create_connection(access_token='access', refresh_token='refresh', expires_in_minutes=60)
+        PlatformConnection.objects.create(user=self.user, platform='twitter', status='connected')  # no token stored
+        cache.clear()
+    
+    def test_status_views_do_not_decrypt(self):
+        """Test the dashboard, status endpoints and admin list render without decrypting a token."""
+        with patch('oauth_manager.models.decrypt_token') as decrypt:
+            self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+            facebook = self.client.get(reverse('connection_status', args=['facebook'])).json()
+            twitter = self.client.get(reverse('connection_status', args=['twitter'])).json()
+            self.assertEqual(self.client.get(reverse('connection_statuses')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('admin:oauth_manager_platformconnection_changelist')).status_code, 200)
+        
+        decrypt.assert_not_called()
+        self.assertTrue(facebook['is_connected'])
+        self.assertFalse(twitter['is_connected'])
+    
+    def test_without_tokens_defers_ciphertext(self):
+        """Test the status queryset leaves the token columns unloaded."""
+        connection = PlatformConnection.objects.without_tokens().get(user=self.user, platform='facebook')
+        
+        self.assertEqual(connection.get_deferred_fields(), {'encrypted_access_token', 'encrypted_refresh_token'})
+        with self.assertNumQueries(0):
+            self.assertTrue(connection.is_connected)
+        self.assertEqual(connection.access_token, 'access')  # still loadable on demand
+
+
+class DashboardCardsTestCase(OAuthHubTestCase):
+    """Test cases for the cached dashboard platform cards."""
+    
+    def setUp(self):
+        super().setUp()
+        self.connection = self.create_connection(access_token='access', user_info={'username': 'fb_user'})
+    
+    def _card_key(self):
+        self.connection.refresh_from_db()
+        configured = get_platforms()['facebook'].is_configured
+        return make_template_fragment_key('dashboard_card', [
+            self.user.pk, 'facebook', self.connection.updated_at, self.connection.status, configured,
+        ])
+    
+    def test_card_fragment_cached_without_csrf_token(self):
+        """Test a card body is cached and the per-request CSRF form stays outside it."""
+        response = self.client.get(reverse('dashboard'))
+        
+        fragment = cache.get(self._card_key())
+        self.assertIn('fb_user', fragment)
+        self.assertNotIn('csrfmiddlewaretoken', fragment)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+    
+    def test_card_reused_until_connection_changes(self):
+        """Test a cached card is served until the connection is saved."""
+        self.client.get(reverse('dashboard'))
+        cache.set(self._card_key(), 'cached-card-body')
+        self.assertContains(self.client.get(reverse('dashboard')), 'cached-card-body')
+        
+        self.connection.platform_username = 'renamed_user'
+        self.connection.save()
+        
+        response = self.client.get(reverse('dashboard'))
+        self.assertNotContains(response, 'cached-card-body')
+        self.assertContains(response, 'renamed_user')
+    
+    def test_platforms_built_once_per_process(self):
+        """Test the platform view-models are reused and rebuilt with the settings."""
+        self.assertIs(get_platforms(), get_platforms())
+        
+        platforms = {'facebook': {**settings.OAUTH_PLATFORMS['facebook'], 'client_id': None}}
+        with self.settings(OAUTH_PLATFORMS=platforms):
+            self.assertEqual(list(get_platforms()), ['facebook'])
+            self.assertFalse(get_platforms()['facebook'].is_configured)
+            response = self.client.get(reverse('dashboard'))
+        
+        self.assertContains(response, 'Platform not configured')
+        self.assertNotContains(response, 'data-platform="twitter"')
+
+
+class StatusCacheTestCase(OAuthHubTestCase):
+    """Test cases for the cached connection status."""
+    
+    def setUp(self):
+        super().setUp()
+        self.connection = PlatformConnection.objects.create(user=self.user, platform='facebook', status='connected')
+    
+    def _get_status(self):
+        response = self.client.get(reverse('connection_status', kwargs={'platform': 'facebook'}))
+        return json.loads(response.content)['status']
+    
+    def test_repeat_reads_hit_cache(self):
+        """Test a second status read is served from the cache."""
+        before = status_cache.stats()
+        self._get_status()
+        
+        with patch('oauth_manager.views.get_object_or_404', side_effect=AssertionError('cache miss')):
+            self.assertEqual(self._get_status(), 'connected')
+        
+        after = status_cache.stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+    
+    def test_save_invalidates_cache(self):
+        """Test saving a connection drops its cached status."""
+        self.assertEqual(self._get_status(), 'connected')
+        
+        self.connection.set_error('Token revoked')
+        
+        self.assertEqual(self._get_status(), 'error')
+    
+    def test_delete_invalidates_cache(self):
+        """Test deleting a connection drops its cached status."""
+        self._get_status()
+        self.connection.delete()
+        
+        response = self.client.get(reverse('connection_statuses'))
+        
+        self.assertEqual(json.loads(response.content)['platforms']['facebook']['status'], 'disconnected')
+    
+    def test_dashboard_connections_cached(self):
+        """Test the dashboard reuses cached connections until something changes."""
+        self.client.get(reverse('dashboard'))
+        
+        with patch.object(PlatformConnection.objects, 'for_dashboard', side_effect=AssertionError('cache miss')):
+            self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        
+        self.connection.disconnect()
+        self.assertIsNone(cache.get(status_cache.connections_key(self.user.pk)))
+    
+    def test_cached_connections_exclude_plaintext_tokens(self):
+        """Test pickled connections never carry decrypted tokens."""
+        self.connection.access_token = 'secret-token'
+        self.assertEqual(self.connection.access_token, 'secret-token')
+        
+        self.assertNotIn(b'secret-token', pickle.dumps(self.connection))
+
+
+class StatelessStateTestCase(OAuthHubTestCase):
+    """Test cases for signed, stateless OAuth state."""
+    
+    def setUp(self):
+        super().setUp()
+        platforms = {
+            **settings.OAUTH_PLATFORMS,
+            'facebook': {**settings.OAUTH_PLATFORMS['facebook'], 'client_id': 'test_client_id', 'client_secret': 'secret'},
+        }
+        self.settings_override = self.settings(OAUTH_PLATFORMS=platforms, OAUTH_STATELESS_STATE=True)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+    
+    def callback(self, state):
+        with patch('oauth_manager.views.exchange_code_for_token', return_value={'access_token': 'token'}) as exchange, \
+                patch('oauth_manager.views.get_platform_user_info', return_value={'id': '1', 'name': 'Test User'}):
+            self.client.get(reverse('oauth_callback', kwargs={'platform': 'facebook'}), {'code': 'code', 'state': state})
+        return exchange
+    
+    def test_flow_without_oauth_session(self):
+        """Test a flow completes from the signed state alone, and only once."""
+        response = self.client.post(reverse('oauth_initiate', kwargs={'platform': 'facebook'}))
+        state = parse_qs(urlsplit(response.url).query)['state'][0]
+        
+        self.assertTrue(oauth_state.is_signed_state(state))
+        self.assertFalse(OAuthSession.objects.exists())
+        
+        exchange = self.callback(state)
+        exchange.assert_called_once_with(get_provider('facebook'), 'code', 'http://testserver/oauth/callback/facebook/', None)
+        self.assertEqual(PlatformConnection.objects.get(user=self.user, platform='facebook').status, 'connected')
+        
+        self.assertFalse(self.callback(state).called)  # replayed
+    
+    def test_pkce_round_trip(self):
+        """Test a stateless Twitter flow sends an S256 challenge and exchanges the matching verifier."""
+        platforms = {
+            **settings.OAUTH_PLATFORMS,
+            'twitter': {**settings.OAUTH_PLATFORMS['twitter'], 'client_id': 'tw-id', 'client_secret': 'secret'},
+        }
+        with self.settings(OAUTH_PLATFORMS=platforms):
+            response = self.client.post(reverse('oauth_initiate', kwargs={'platform': 'twitter'}))
+            query = parse_qs(urlsplit(response.url).query)
+            
+            token_response = Mock(status_code=200, json=Mock(return_value={'access_token': 'token'}))
+            with patch('oauth_manager.views.http_client.post', return_value=token_response) as post, \
+                    patch('oauth_manager.views.get_platform_user_info', return_value={'id': '1', 'name': 'Test User'}):
+                self.client.get(
+                    reverse('oauth_callback', kwargs={'platform': 'twitter'}),
+                    {'code': 'code', 'state': query['state'][0]},
+                )
+        
+        challenge = query['code_challenge'][0]
+        verifier = post.call_args.kwargs['data']['code_verifier']
+        self.assertEqual(query['code_challenge_method'], ['S256'])
+        self.assertEqual(len(challenge), 43)
+        self.assertTrue(43 <= len(verifier) <= 128)
+        self.assertEqual(code_challenge(verifier), challenge)
+        self.assertEqual(PlatformConnection.objects.get(user=self.user, platform='twitter').status, 'connected')
+    
+    def test_session_states_still_accepted(self):
+        """Test states issued before switching to stateless mode still complete."""
+        PlatformConnection.objects.create(user=self.user, platform='facebook', status='connecting')
+        session = self.create_session(views.generate_state())
+        
+        self.assertTrue(self.callback(session.state).called)
+        
+        session.refresh_from_db()
+        self.assertFalse(session.is_active)
+    
+    def test_rejected_states(self):
+        """Test states that are tampered with, for another platform or too old are rejected."""
+        state = oauth_state.sign_state(self.user.pk, 'facebook', 'http://testserver/cb/')
+        with patch('cryptography.fernet.time.time', return_value=time.time() - 2 * 3600):
+            old_state = oauth_state.sign_state(self.user.pk, 'facebook', 'http://testserver/cb/')
+        
+        with self.assertRaises(oauth_state.InvalidState):
+            oauth_state.verify_state(state[:-4] + 'AAAA', 'facebook')
+        with self.assertRaises(oauth_state.InvalidState):
+            oauth_state.verify_state(state, 'twitter')
+        with self.assertRaises(oauth_state.StateExpired):
+            oauth_state.verify_state(old_state, 'facebook')
+        self.assertEqual(oauth_state.verify_state(state, 'facebook').user_id, self.user.pk)
+
+
 class SecurityTestCase(OAuthHubTestCase):
     """Test cases for security features."""
     
@@ -343,13 +2152,16 @@ class IntegrationTestCase(OAuthHubTestCase):
     def test_complete_oauth_flow(self):
         """Test a complete OAuth flow simulation."""
         # 1. Initiate OAuth
-        with patch('oauth_manager.views.settings.OAUTH_PLATFORMS') as mock_platforms:
-            mock_platforms.get.return_value = {
+        platforms = {
+            **settings.OAUTH_PLATFORMS,
+            'facebook': {
                 'client_id': 'test_client_id',
                 'client_secret': 'test_client_secret',
                 'auth_url': 'https://facebook.com/oauth/authorize',
                 'scope': 'email,profile'
-            }
+            },
+        }
+        with self.settings(OAUTH_PLATFORMS=platforms):
             
             response = self.client.post(reverse('oauth_initiate', kwargs={'platform': 'facebook'}))
             
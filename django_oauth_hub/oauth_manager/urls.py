@@ -1,25 +1,41 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, views_async, views_export
 from .views_legal import privacy_policy, data_deletion, terms_of_service
 
-urlpatterns = [
-    # Main dashboard
-    path('', views.home, name='home'),
-    path('dashboard/', views.dashboard, name='dashboard'),
-    
-    # Demo user creation (for testing)
-    path('create-demo-user/', views.create_demo_user, name='create_demo_user'),
-    
-    # OAuth flow
-    path('oauth/initiate/<str:platform>/', views.initiate_oauth, name='oauth_initiate'),
-    path('oauth/callback/<str:platform>/', views.oauth_callback, name='oauth_callback'),
-    
-    # Platform management
-    path('platform/disconnect/<str:platform>/', views.disconnect_platform, name='disconnect_platform'),
-    path('platform/status/<str:platform>/', views.connection_status, name='connection_status'),
-    
-    # Legal pages
-    path('privacy-policy/', privacy_policy, name='privacy_policy'),
-    path('data-deletion/', data_deletion, name='data_deletion'),
-    path('terms-of-service/', terms_of_service, name='terms_of_service'),
-]
+
+def build_urlpatterns(flow_views):
+    """Build the app URLs, taking the OAuth flow views from ``flow_views``."""
+    return [
+        # Main dashboard
+        path('', views.home, name='home'),
+        path('dashboard/', flow_views.dashboard, name='dashboard'),
+        
+        # Demo user creation (for testing)
+        path('create-demo-user/', views.create_demo_user, name='create_demo_user'),
+        
+        # OAuth flow
+        path('oauth/initiate/<str:platform>/', flow_views.initiate_oauth, name='oauth_initiate'),
+        path('oauth/callback/<str:platform>/', flow_views.oauth_callback, name='oauth_callback'),
+        
+        # Platform management
+        path('platform/disconnect/<str:platform>/', views.disconnect_platform, name='disconnect_platform'),
+        path('platform/status/', views.connection_statuses, name='connection_statuses'),
+        path('platform/status/stream/', flow_views.connection_status_stream, name='connection_status_stream'),
+        path('platform/status/<str:platform>/', flow_views.connection_status, name='connection_status'),
+        path('platform/health/', views.provider_health, name='provider_health'),
+        path('metrics', views.prometheus_metrics, name='metrics'),
+        
+        # Staff exports
+        path('export/connections/', views_export.export_connections, name='export_connections'),
+        path('export/logs/', views_export.export_logs, name='export_logs'),
+        
+        # Legal pages
+        path('privacy-policy/', privacy_policy, name='privacy_policy'),
+        path('data-deletion/', data_deletion, name='data_deletion'),
+        path('terms-of-service/', terms_of_service, name='terms_of_service'),
+    ]
+
+
+# Async flow views only pay off when served over ASGI (see DEPLOYMENT.md)
+urlpatterns = build_urlpatterns(views_async if settings.OAUTH_ASYNC_VIEWS else views)
@@ -1,3 +1,5 @@
+import time
+
 from django.http import HttpRequest
 
 
@@ -14,3 +16,29 @@ def get_client_ip(request: HttpRequest) -> str:
 def get_user_agent(request: HttpRequest) -> str:
     """Get the user agent from the request."""
     return request.META.get('HTTP_USER_AGENT', 'unknown')[:500]  # Limit length
+
+
+def delete_in_batches(queryset, batch_size=1000, sleep=0, on_batch=None):
+    """
+    Delete the rows matched by a queryset in bounded primary-key chunks.
+    
+    Each chunk is a short DELETE ... WHERE id IN (...) so a large backlog never
+    holds long locks; ``sleep`` seconds are waited between chunks and
+    ``on_batch`` (if given) is called with each chunk's deleted row count.
+    Returns the number of deleted rows.
+    """
+    total = 0
+    model = queryset.model
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        deleted, _ = model.objects.filter(pk__in=pks).delete()
+        total += deleted
+        if on_batch:
+            on_batch(deleted)
+        if len(pks) < batch_size:
+            break
+        if sleep:
+            time.sleep(sleep)
+    return total
@@ -1,22 +1,36 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.urls import reverse
-from django.utils import timezone
+import hashlib
 import requests
 import secrets
 import string
 import json
 import logging
-from urllib.parse import urlencode, parse_qs, urlparse
-from .models import PlatformConnection, OAuthSession, ConnectionLog
+from urllib.parse import parse_qs, urlparse
+from prometheus_client import CONTENT_TYPE_LATEST
+from .models import PlatformConnection, OAuthSession
 from .utils import get_client_ip, get_user_agent
+from .dashboard import build_cards
+from .events import iter_status_events
+from .log_sinks import get_log_sink
+from .providers import get_provider, get_registry
+from .rate_limit import RateLimited
+from .request_metrics import query_budget
+from .resilience import ProviderUnavailable, get_guard
+from . import http_client, metrics, oauth_state, status_cache
 
 logger = logging.getLogger(__name__)
 
@@ -28,15 +42,17 @@ def generate_state():
 
 def log_connection_event(connection, action, details=None, request=None):
     """Log connection events for debugging and monitoring."""
-    ConnectionLog.objects.create(
-        connection=connection,
-        action=action,
-        details=details,
-        ip_address=get_client_ip(request) if request else None,
-        user_agent=get_user_agent(request) if request else None,
-    )
+    get_log_sink().emit({
+        'connection': connection,
+        'action': action,
+        'details': details,
+        'ip_address': get_client_ip(request) if request else None,
+        'user_agent': get_user_agent(request) if request else None,
+        'created_at': timezone.now(),
+    })
 
 
+@query_budget(13)
 def create_demo_user(request):
     """Create a demo user for testing purposes."""
     if settings.DEBUG:
@@ -60,30 +76,19 @@ def create_demo_user(request):
         return redirect('dashboard')
 
 
+@query_budget(5)
 @login_required
 def dashboard(request):
     """Main dashboard showing all platform connections."""
-    # Get or create connections for all supported platforms
-    connections = {}
-    
-    for platform_key, platform_name in PlatformConnection.PLATFORM_CHOICES:
-        connection, created = PlatformConnection.objects.get_or_create(
-            user=request.user,
-            platform=platform_key,
-            defaults={'status': 'disconnected'}
-        )
-        
-        # Check if token has expired
-        if connection.is_connected and connection.is_token_expired:
-            connection.status = 'expired'
-            connection.save()
-        
-        connections[platform_key] = connection
-    
-    # Clean up expired OAuth sessions
-    OAuthSession.cleanup_expired_sessions()
+    connections = status_cache.get_connections(
+        request.user.pk,
+        lambda: PlatformConnection.objects.for_dashboard(request.user),
+    )
     
     context = {
+        'cards': build_cards(connections),
+        'card_cache_ttl': settings.OAUTH_DASHBOARD_CARD_CACHE_TTL,
+        'status_stream': settings.OAUTH_STATUS_STREAM_ENABLED,
         'connections': connections,
         'platforms': settings.OAUTH_PLATFORMS,
     }
@@ -91,19 +96,25 @@ def dashboard(request):
     return render(request, 'oauth_manager/dashboard.html', context)
 
 
+@query_budget(5)
 @login_required
 @require_http_methods(["POST"])
 def initiate_oauth(request, platform):
     """Initiate OAuth flow for a specific platform."""
-    if platform not in dict(PlatformConnection.PLATFORM_CHOICES):
+    provider = get_provider(platform)
+    if provider is None:
         messages.error(request, f'Unsupported platform: {platform}')
         return redirect('dashboard')
     
-    platform_config = settings.OAUTH_PLATFORMS.get(platform)
-    if not platform_config or not platform_config.get('client_id'):
+    if not provider.is_configured:
         messages.error(request, f'Platform {platform} is not configured. Please check your environment variables.')
         return redirect('dashboard')
     
+    # Don't send the user off to a provider we can't complete the flow with
+    if get_guard(platform).state() == 'open':
+        messages.warning(request, f'{provider.name} is having problems right now. Please try connecting again in a few minutes.')
+        return redirect('dashboard')
+    
     try:
         # Get or create platform connection
         connection, _ = PlatformConnection.objects.get_or_create(
@@ -112,19 +123,25 @@ def initiate_oauth(request, platform):
             defaults={'status': 'disconnected'}
         )
         
-        # Generate secure state parameter
-        state = generate_state()
-        
         # Build redirect URI
         redirect_uri = request.build_absolute_uri(reverse('oauth_callback', kwargs={'platform': platform}))
         
-        # Create OAuth session for tracking
-        oauth_session = OAuthSession.objects.create(
-            user=request.user,
-            platform=platform,
-            state=state,
-            redirect_uri=redirect_uri,
-        )
+        # Kept with the flow and sent back in the token exchange
+        code_verifier = provider.new_code_verifier()
+        
+        if settings.OAUTH_STATELESS_STATE:
+            # The flow travels in the signed state parameter instead of a row
+            state = oauth_state.sign_state(request.user.pk, platform, redirect_uri, code_verifier)
+        else:
+            # Generate secure state parameter and an OAuth session for tracking
+            state = generate_state()
+            OAuthSession.objects.create(
+                user=request.user,
+                platform=platform,
+                state=state,
+                code_verifier=code_verifier,
+                redirect_uri=redirect_uri,
+            )
         
         # Update connection status
         connection.status = 'connecting'
@@ -133,27 +150,10 @@ def initiate_oauth(request, platform):
         # Log the initiation
         log_connection_event(connection, 'initiated', f'OAuth flow initiated for {platform}', request)
         
-        # Build authorization URL
-        auth_params = {
-            'client_id': platform_config['client_id'],
-            'redirect_uri': redirect_uri,
-            'scope': platform_config['scope'],
-            'state': state,
-            'response_type': 'code',
-        }
-        
-        # Platform-specific parameters
-        if platform == 'facebook':
-            auth_params['display'] = 'popup'
-        elif platform == 'linkedin':
-            auth_params['response_type'] = 'code'
-        elif platform == 'twitter':
-            auth_params['code_challenge_method'] = 'plain'
-            auth_params['code_challenge'] = state  # Simple PKCE for Twitter
-        
-        auth_url = f"{platform_config['auth_url']}?{urlencode(auth_params)}"
+        auth_url = provider.authorization_url(redirect_uri, state, code_verifier)
         
         logger.info(f"Redirecting user {request.user.username} to {platform} OAuth: {auth_url}")
+        metrics.flows_started.labels(platform).inc()
         
         return redirect(auth_url)
     
@@ -163,9 +163,11 @@ def initiate_oauth(request, platform):
         return redirect('dashboard')
 
 
+@query_budget(7)
 def oauth_callback(request, platform):
     """Handle OAuth callback from platforms."""
-    if platform not in dict(PlatformConnection.PLATFORM_CHOICES):
+    provider = get_provider(platform)
+    if provider is None:
         return HttpResponseBadRequest(f'Unsupported platform: {platform}')
     
     code = request.GET.get('code')
@@ -177,28 +179,34 @@ def oauth_callback(request, platform):
         error_msg = f"{platform} OAuth error: {error}. {error_description}"
         logger.warning(f"OAuth error for platform {platform}: {error_msg}")
         messages.error(request, f'Authentication failed: {error_description or error}')
+        metrics.record_flow(platform, 'denied')
         return redirect('dashboard')
     
     if not code or not state:
         logger.warning(f"Missing code or state in OAuth callback for {platform}")
         messages.error(request, 'Invalid OAuth callback. Missing authorization code or state.')
+        metrics.record_flow(platform, 'invalid')
         return redirect('dashboard')
     
+    flow = oauth_session = None
     try:
-        # Find and validate OAuth session
-        oauth_session = get_object_or_404(OAuthSession, state=state, platform=platform, is_active=True)
-        
-        # Check if session is expired (1 hour)
-        if timezone.now() - oauth_session.created_at > timezone.timedelta(hours=1):
-            oauth_session.is_active = False
-            oauth_session.save()
-            messages.error(request, 'OAuth session expired. Please try connecting again.')
-            return redirect('dashboard')
+        if oauth_state.is_signed_state(state):
+            flow = oauth_state.verify_state(state, platform)
+        else:
+            # Find and validate OAuth session
+            oauth_session = get_object_or_404(OAuthSession, state=state, platform=platform, is_active=True)
+            
+            # Check if session is expired (1 hour)
+            if oauth_session.is_expired:
+                oauth_session.is_active = False
+                oauth_session.save()
+                raise oauth_state.StateExpired
+            flow = oauth_session
         
         # Get platform connection
         connection = get_object_or_404(
             PlatformConnection,
-            user=oauth_session.user,
+            user_id=flow.user_id,
             platform=platform
         )
         
@@ -206,19 +214,19 @@ def oauth_callback(request, platform):
         log_connection_event(connection, 'callback_received', f'Code: {code[:10]}...', request)
         
         # Exchange authorization code for access token
-        platform_config = settings.OAUTH_PLATFORMS[platform]
-        token_data = exchange_code_for_token(platform, code, oauth_session.redirect_uri, platform_config)
+        token_data = exchange_code_for_token(provider, code, flow.redirect_uri, flow.code_verifier)
         
         if not token_data:
             connection.set_error('Failed to exchange authorization code for access token')
             messages.error(request, f'Failed to complete {platform} authentication. Please try again.')
+            metrics.record_flow(platform, 'token_failed')
             return redirect('dashboard')
         
         # Log successful token exchange
         log_connection_event(connection, 'token_exchanged', 'Successfully exchanged code for token', request)
         
         # Get user information from platform
-        user_info = get_platform_user_info(platform, token_data['access_token'], platform_config)
+        user_info = get_platform_user_info(provider, token_data['access_token'])
         
         # Update connection with token and user info
         connection.set_connected(
@@ -229,8 +237,9 @@ def oauth_callback(request, platform):
             scope=token_data.get('scope')
         )
         
-        # Complete OAuth session
-        oauth_session.complete_session()
+        # Complete OAuth session (a signed state's nonce was consumed when it was verified)
+        if oauth_session is not None:
+            oauth_session.complete_session()
         
         # Log successful connection
         log_connection_event(
@@ -241,59 +250,61 @@ def oauth_callback(request, platform):
         )
         
         messages.success(request, f'Successfully connected to {platform.title()}!')
+        metrics.record_flow(platform, 'connected')
         logger.info(f"User {request.user.username} successfully connected to {platform}")
         
         return redirect('dashboard')
     
-    except OAuthSession.DoesNotExist:
+    except oauth_state.StateExpired:
+        messages.error(request, 'OAuth session expired. Please try connecting again.')
+        metrics.record_flow(platform, 'expired')
+        return redirect('dashboard')
+    
+    except (OAuthSession.DoesNotExist, oauth_state.InvalidState):
         logger.warning(f"Invalid OAuth session state: {state}")
         messages.error(request, 'Invalid OAuth session. Please try connecting again.')
+        metrics.record_flow(platform, 'invalid')
+        return redirect('dashboard')
+    
+    except RateLimited as e:
+        # Our limit or the provider's, not a broken connection: don't set_error
+        logger.warning(f"Rate limited completing OAuth callback for {platform}: {e}")
+        messages.warning(request, f'{provider.name} is busy right now. Please try connecting again in a moment.')
+        metrics.record_flow(platform, 'rate_limited')
+        return redirect('dashboard')
+    
+    except ProviderUnavailable as e:
+        logger.warning(f"Provider unavailable completing OAuth callback for {platform}: {e}")
+        messages.warning(request, f'{provider.name} is having problems right now. Please try connecting again in a few minutes.')
+        metrics.record_flow(platform, 'unavailable')
         return redirect('dashboard')
     
     except Exception as e:
         logger.error(f"Error processing OAuth callback for {platform}: {e}")
         try:
-            connection = PlatformConnection.objects.get(user__oauth_sessions__state=state, platform=platform)
+            owner = {'user_id': flow.user_id} if flow else {'user__oauth_sessions__state': state}
+            connection = PlatformConnection.objects.get(platform=platform, **owner)
             connection.set_error(f'OAuth callback error: {str(e)}')
         except PlatformConnection.DoesNotExist:
             pass
         
         messages.error(request, f'Failed to complete {platform} authentication. Please try again.')
+        metrics.record_flow(platform, 'error')
         return redirect('dashboard')
 
 
-def exchange_code_for_token(platform, code, redirect_uri, platform_config):
+def exchange_code_for_token(provider, code, redirect_uri, code_verifier=None):
     """Exchange authorization code for access token."""
+    platform = provider.key
     try:
-        token_data = {
-            'client_id': platform_config['client_id'],
-            'client_secret': platform_config['client_secret'],
-            'code': code,
-            'redirect_uri': redirect_uri,
-        }
-        
-        # Platform-specific token exchange parameters
-        if platform == 'facebook':
-            token_data['grant_type'] = 'authorization_code'
-        elif platform == 'instagram':
-            token_data['grant_type'] = 'authorization_code'
-        elif platform == 'twitter':
-            token_data['grant_type'] = 'authorization_code'
-            token_data['code_verifier'] = code  # Simple PKCE
-        elif platform == 'linkedin':
-            token_data['grant_type'] = 'authorization_code'
-        elif platform == 'youtube':
-            token_data['grant_type'] = 'authorization_code'
-        elif platform in ['tiktok', 'pinterest']:
-            token_data['grant_type'] = 'authorization_code'
-        
-        headers = {'Accept': 'application/json', 'Content-Type': 'application/x-www-form-urlencoded'}
-        
-        response = requests.post(
-            platform_config['token_url'],
+        token_data, headers = provider.token_request(code, redirect_uri, code_verifier)
+        
+        response = http_client.post(
+            platform,
+            provider.token_url,
+            endpoint='token',
             data=token_data,
             headers=headers,
-            timeout=30
         )
         
         if response.status_code == 200:
@@ -304,6 +315,8 @@ def exchange_code_for_token(platform, code, redirect_uri, platform_config):
             logger.error(f"Token exchange failed for {platform}: {response.status_code} - {response.text}")
             return None
     
+    except (RateLimited, ProviderUnavailable):
+        raise
     except requests.exceptions.RequestException as e:
         logger.error(f"Network error during token exchange for {platform}: {e}")
         return None
@@ -312,21 +325,17 @@ def exchange_code_for_token(platform, code, redirect_uri, platform_config):
         return None
 
 
-def get_platform_user_info(platform, access_token, platform_config):
+def get_platform_user_info(provider, access_token):
     """Get user information from platform API."""
+    platform = provider.key
     try:
-        headers = {'Authorization': f'Bearer {access_token}'}
+        headers = provider.user_info_headers(access_token)
         
-        # Platform-specific headers
-        if platform == 'facebook':
-            headers = {'Authorization': f'Bearer {access_token}'}
-        elif platform == 'twitter':
-            headers = {'Authorization': f'Bearer {access_token}'}
-        
-        response = requests.get(
-            platform_config['user_info_url'],
+        response = http_client.get(
+            platform,
+            provider.user_info_url,
+            endpoint='userinfo',
             headers=headers,
-            timeout=30
         )
         
         if response.status_code == 200:
@@ -337,6 +346,9 @@ def get_platform_user_info(platform, access_token, platform_config):
             logger.warning(f"Failed to fetch user info for {platform}: {response.status_code}")
             return {}
     
+    except (RateLimited, ProviderUnavailable) as e:
+        logger.warning(f"Skipped fetching user info for {platform}: {e}")
+        return {}
     except requests.exceptions.RequestException as e:
         logger.error(f"Network error fetching user info for {platform}: {e}")
         return {}
@@ -345,11 +357,70 @@ def get_platform_user_info(platform, access_token, platform_config):
         return {}
 
 
+# OAuth error codes meaning the refresh token will never work again
+REJECTED_REFRESH_ERRORS = {'invalid_grant', 'invalid_client'}
+
+
+class RefreshRejected(Exception):
+    """The provider refused the refresh token itself (revoked grant or invalid client)."""
+
+
+def oauth_error_code(response):
+    """Return the ``error`` field of an OAuth error response, if it has one."""
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    return body.get('error') if isinstance(body, dict) else None
+
+
+def refresh_access_token(provider, refresh_token):
+    """
+    Use a refresh token to obtain a new access token.
+    
+    Returns None for transient failures (network errors, unexpected responses)
+    and raises ``RefreshRejected`` when the provider rejects the grant.
+    """
+    platform = provider.key
+    try:
+        token_data, headers = provider.refresh_request(refresh_token)
+        
+        # Not retried: providers that rotate refresh tokens invalidate the old one
+        response = http_client.post(
+            platform,
+            provider.token_url,
+            endpoint='refresh',
+            data=token_data,
+            headers=headers,
+        )
+        
+        if response.status_code == 200:
+            logger.info(f"Successfully refreshed {platform} token")
+            return response.json()
+        
+        error = oauth_error_code(response)
+        if response.status_code in (400, 401) and error in REJECTED_REFRESH_ERRORS:
+            logger.warning(f"Refresh token rejected by {platform}: {error}")
+            raise RefreshRejected(error)
+        logger.error(f"Token refresh failed for {platform}: {response.status_code} - {response.text}")
+        return None
+    
+    except (RateLimited, ProviderUnavailable, RefreshRejected):
+        raise
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Network error during token refresh for {platform}: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error during token refresh for {platform}: {e}")
+        return None
+
+
+@query_budget(4)
 @login_required
 @require_http_methods(["POST"])
 def disconnect_platform(request, platform):
     """Disconnect a platform connection."""
-    if platform not in dict(PlatformConnection.PLATFORM_CHOICES):
+    if get_provider(platform) is None:
         return JsonResponse({'error': 'Unsupported platform'}, status=400)
     
     try:
@@ -380,39 +451,116 @@ def disconnect_platform(request, platform):
             return redirect('dashboard')
 
 
+def connection_status_data(connection):
+    """Serialize a connection for the status API."""
+    status = connection.status
+    if status == 'connected' and connection.is_token_expired:
+        status = 'expired'
+    
+    return {
+        'platform': connection.platform,
+        'status': status,
+        'is_connected': connection.is_connected,
+        'platform_username': connection.platform_username,
+        'platform_email': connection.platform_email,
+        'connected_at': connection.updated_at.isoformat() if connection.updated_at else None,
+        'last_used_at': connection.last_used_at.isoformat() if connection.last_used_at else None,
+        'token_expires_at': connection.token_expires_at.isoformat() if connection.token_expires_at else None,
+        'error_message': connection.last_error_message,
+    }
+
+
+@query_budget(3)
 @login_required
 def connection_status(request, platform):
     """Get connection status for a platform (API endpoint)."""
-    if platform not in dict(PlatformConnection.PLATFORM_CHOICES):
+    if get_provider(platform) is None:
         return JsonResponse({'error': 'Unsupported platform'}, status=400)
     
+    def load(platforms):
+        # Expiry is computed by connection_status_data; expire_tokens persists it
+        connection = PlatformConnection.objects.without_tokens().get(user=request.user, platform=platform)
+        return {platform: connection_status_data(connection)}
+    
     try:
-        connection = get_object_or_404(PlatformConnection, user=request.user, platform=platform)
-        
-        # Check token expiration
-        if connection.is_connected and connection.is_token_expired:
-            connection.status = 'expired'
-            connection.save()
-        
-        data = {
-            'platform': platform,
-            'status': connection.status,
-            'is_connected': connection.is_connected,
-            'platform_username': connection.platform_username,
-            'platform_email': connection.platform_email,
-            'connected_at': connection.updated_at.isoformat() if connection.updated_at else None,
-            'last_used_at': connection.last_used_at.isoformat() if connection.last_used_at else None,
-            'token_expires_at': connection.token_expires_at.isoformat() if connection.token_expires_at else None,
-            'error_message': connection.last_error_message,
-        }
+        data = status_cache.get_statuses(request.user.pk, [platform], load)[platform]
         
         return JsonResponse(data)
     
+    except PlatformConnection.DoesNotExist:
+        return JsonResponse({'error': 'Connection not found'}, status=404)
+    
     except Exception as e:
         logger.error(f"Error fetching connection status for {platform}: {e}")
         return JsonResponse({'error': 'Failed to fetch connection status'}, status=500)
 
 
+def load_connection_statuses(user, platforms):
+    """Build status payloads for ``platforms`` with one query; missing rows read as disconnected."""
+    connections = {
+        connection.platform: connection
+        for connection in PlatformConnection.objects.without_tokens().filter(user=user, platform__in=platforms)
+    }
+    return {
+        platform: connection_status_data(connections.get(platform) or PlatformConnection(user=user, platform=platform))
+        for platform in platforms
+    }
+
+
+@query_budget(3)
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def connection_statuses(request):
+    """Get connection status for every platform in one document (API endpoint)."""
+    platforms = list(get_registry())
+    statuses = status_cache.get_statuses(
+        request.user.pk,
+        platforms,
+        lambda missing: load_connection_statuses(request.user, missing),
+    )
+    content = json.dumps({'platforms': {platform: statuses[platform] for platform in platforms}}, cls=DjangoJSONEncoder)
+    
+    # Strong ETag over the document itself, so an unchanged poll is a 304
+    etag = quote_etag(hashlib.sha1(content.encode()).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    # Let clients cache the document but always revalidate it with If-None-Match
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@query_budget(2)
+@login_required
+def connection_status_stream(request):
+    """Stream the user's connection status changes as Server-Sent Events."""
+    if not settings.OAUTH_STATUS_STREAM_ENABLED:
+        return JsonResponse({'error': 'Status stream disabled'}, status=404)
+    
+    response = StreamingHttpResponse(iter_status_events(request.user), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
+
+
+@query_budget(2)
+@staff_member_required
+def provider_health(request):
+    """Circuit breaker state, recent call counts and rejections per provider (staff only)."""
+    return JsonResponse({'providers': [get_guard(platform).status() for platform in get_registry()]})
+
+
+@query_budget(4)
+def prometheus_metrics(request):
+    """Prometheus scrape endpoint, for allowed addresses and staff."""
+    # REMOTE_ADDR rather than get_client_ip: X-Forwarded-For is set by the client
+    if not metrics.is_allowed_address(request.META.get('REMOTE_ADDR', '')) and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type=CONTENT_TYPE_LATEST)
+
+
+@query_budget(2)
 def home(request):
     """Home page - redirect to dashboard if authenticated, otherwise show login."""
     if request.user.is_authenticated:
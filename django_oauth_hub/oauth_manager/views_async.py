@@ -0,0 +1,346 @@
+"""
+Async variants of the OAuth flow views.
+
+Enabled with ``OAUTH_ASYNC_VIEWS=True`` when the project is served over ASGI
+(uvicorn / gunicorn with uvicorn workers). Provider calls use the pooled httpx
+clients from ``http_client`` and database access goes through Django's async
+ORM interface, so a slow provider only parks a coroutine instead of a worker.
+"""
+
+from functools import wraps
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.urls import reverse
+import logging
+
+from . import http_client, metrics, oauth_state, status_cache
+from .dashboard import build_cards
+from .events import aiter_status_events
+from .models import PlatformConnection, OAuthSession
+from .providers import get_provider
+from .rate_limit import RateLimited
+from .request_metrics import query_budget
+from .resilience import ProviderUnavailable, get_guard
+from .views import (
+    connection_status_data,
+    generate_state,
+    log_connection_event,
+)
+
+logger = logging.getLogger(__name__)
+
+alog_connection_event = sync_to_async(log_connection_event)
+
+
+def async_login_required(view_func):
+    """Async equivalent of ``login_required``."""
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        # Resolving the lazy user hits the session and auth tables
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return _wrapped_view
+
+
+async def aexchange_code_for_token(provider, code, redirect_uri, code_verifier=None):
+    """Exchange authorization code for access token."""
+    platform = provider.key
+    try:
+        token_data, headers = provider.token_request(code, redirect_uri, code_verifier)
+        
+        response = await http_client.apost(
+            platform,
+            provider.token_url,
+            endpoint='token',
+            data=token_data,
+            headers=headers,
+        )
+        
+        if response.status_code == 200:
+            logger.info(f"Successfully exchanged code for {platform} token")
+            return response.json()
+        else:
+            logger.error(f"Token exchange failed for {platform}: {response.status_code} - {response.text}")
+            return None
+    
+    except (RateLimited, ProviderUnavailable):
+        raise
+    except httpx.HTTPError as e:
+        logger.error(f"Network error during token exchange for {platform}: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error during token exchange for {platform}: {e}")
+        return None
+
+
+async def aget_platform_user_info(provider, access_token):
+    """Get user information from platform API."""
+    platform = provider.key
+    try:
+        response = await http_client.aget(
+            platform,
+            provider.user_info_url,
+            endpoint='userinfo',
+            headers=provider.user_info_headers(access_token),
+        )
+        
+        if response.status_code == 200:
+            logger.info(f"Successfully fetched user info for {platform}")
+            return response.json()
+        else:
+            logger.warning(f"Failed to fetch user info for {platform}: {response.status_code}")
+            return {}
+    
+    except (RateLimited, ProviderUnavailable) as e:
+        logger.warning(f"Skipped fetching user info for {platform}: {e}")
+        return {}
+    except httpx.HTTPError as e:
+        logger.error(f"Network error fetching user info for {platform}: {e}")
+        return {}
+    except Exception as e:
+        logger.error(f"Unexpected error fetching user info for {platform}: {e}")
+        return {}
+
+
+@query_budget(5)
+@async_login_required
+async def dashboard(request):
+    """Main dashboard showing all platform connections."""
+    connections = await sync_to_async(status_cache.get_connections)(
+        request.user.pk,
+        lambda: PlatformConnection.objects.for_dashboard(request.user),
+    )
+    
+    context = {
+        'cards': build_cards(connections),
+        'card_cache_ttl': settings.OAUTH_DASHBOARD_CARD_CACHE_TTL,
+        'status_stream': settings.OAUTH_STATUS_STREAM_ENABLED,
+        'connections': connections,
+        'platforms': settings.OAUTH_PLATFORMS,
+    }
+    
+    # Rendering reads the session (messages, CSRF) so it stays sync
+    return await sync_to_async(render)(request, 'oauth_manager/dashboard.html', context)
+
+
+@query_budget(5)
+@async_login_required
+async def initiate_oauth(request, platform):
+    """Initiate OAuth flow for a specific platform."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    
+    provider = get_provider(platform)
+    if provider is None:
+        messages.error(request, f'Unsupported platform: {platform}')
+        return redirect('dashboard')
+    
+    if not provider.is_configured:
+        messages.error(request, f'Platform {platform} is not configured. Please check your environment variables.')
+        return redirect('dashboard')
+    
+    # Don't send the user off to a provider we can't complete the flow with
+    if await sync_to_async(get_guard(platform).state, thread_sensitive=False)() == 'open':
+        messages.warning(request, f'{provider.name} is having problems right now. Please try connecting again in a few minutes.')
+        return redirect('dashboard')
+    
+    try:
+        connection, _ = await PlatformConnection.objects.aget_or_create(
+            user=request.user,
+            platform=platform,
+            defaults={'status': 'disconnected'}
+        )
+        
+        redirect_uri = request.build_absolute_uri(reverse('oauth_callback', kwargs={'platform': platform}))
+        
+        code_verifier = provider.new_code_verifier()
+        
+        if settings.OAUTH_STATELESS_STATE:
+            state = oauth_state.sign_state(request.user.pk, platform, redirect_uri, code_verifier)
+        else:
+            state = generate_state()
+            await OAuthSession.objects.acreate(
+                user=request.user,
+                platform=platform,
+                state=state,
+                code_verifier=code_verifier,
+                redirect_uri=redirect_uri,
+            )
+        
+        connection.status = 'connecting'
+        await connection.asave()
+        
+        await alog_connection_event(connection, 'initiated', f'OAuth flow initiated for {platform}', request)
+        
+        auth_url = provider.authorization_url(redirect_uri, state, code_verifier)
+        
+        logger.info(f"Redirecting user {request.user.username} to {platform} OAuth: {auth_url}")
+        metrics.flows_started.labels(platform).inc()
+        
+        return redirect(auth_url)
+    
+    except Exception as e:
+        logger.error(f"Error initiating OAuth for {platform}: {e}")
+        messages.error(request, f'Failed to initiate {platform} connection. Please try again.')
+        return redirect('dashboard')
+
+
+@query_budget(7)
+async def oauth_callback(request, platform):
+    """Handle OAuth callback from platforms."""
+    provider = get_provider(platform)
+    if provider is None:
+        return HttpResponseBadRequest(f'Unsupported platform: {platform}')
+    
+    code = request.GET.get('code')
+    state = request.GET.get('state')
+    error = request.GET.get('error')
+    error_description = request.GET.get('error_description', '')
+    
+    if error:
+        error_msg = f"{platform} OAuth error: {error}. {error_description}"
+        logger.warning(f"OAuth error for platform {platform}: {error_msg}")
+        messages.error(request, f'Authentication failed: {error_description or error}')
+        metrics.record_flow(platform, 'denied')
+        return redirect('dashboard')
+    
+    if not code or not state:
+        logger.warning(f"Missing code or state in OAuth callback for {platform}")
+        messages.error(request, 'Invalid OAuth callback. Missing authorization code or state.')
+        metrics.record_flow(platform, 'invalid')
+        return redirect('dashboard')
+    
+    flow = oauth_session = None
+    try:
+        if oauth_state.is_signed_state(state):
+            # The nonce check goes to the cache, which may be file or network backed
+            flow = await sync_to_async(oauth_state.verify_state)(state, platform)
+        else:
+            oauth_session = await OAuthSession.objects.aget(state=state, platform=platform, is_active=True)
+            
+            if oauth_session.is_expired:
+                oauth_session.is_active = False
+                await oauth_session.asave()
+                raise oauth_state.StateExpired
+            flow = oauth_session
+        
+        connection = await PlatformConnection.objects.aget(user_id=flow.user_id, platform=platform)
+        
+        await alog_connection_event(connection, 'callback_received', f'Code: {code[:10]}...', request)
+        
+        token_data = await aexchange_code_for_token(provider, code, flow.redirect_uri, flow.code_verifier)
+        
+        if not token_data:
+            await sync_to_async(connection.set_error)('Failed to exchange authorization code for access token')
+            messages.error(request, f'Failed to complete {platform} authentication. Please try again.')
+            metrics.record_flow(platform, 'token_failed')
+            return redirect('dashboard')
+        
+        await alog_connection_event(connection, 'token_exchanged', 'Successfully exchanged code for token', request)
+        
+        user_info = await aget_platform_user_info(provider, token_data['access_token'])
+        
+        await sync_to_async(connection.set_connected)(
+            access_token=token_data['access_token'],
+            refresh_token=token_data.get('refresh_token'),
+            expires_in=token_data.get('expires_in'),
+            user_info=user_info,
+            scope=token_data.get('scope')
+        )
+        
+        if oauth_session is not None:
+            await sync_to_async(oauth_session.complete_session)()
+        
+        await alog_connection_event(
+            connection,
+            'connected',
+            f"Connected as {user_info.get('name', user_info.get('username', 'Unknown'))}",
+            request
+        )
+        
+        messages.success(request, f'Successfully connected to {platform.title()}!')
+        metrics.record_flow(platform, 'connected')
+        logger.info(f"User {flow.user_id} successfully connected to {platform}")
+        
+        return redirect('dashboard')
+    
+    except oauth_state.StateExpired:
+        messages.error(request, 'OAuth session expired. Please try connecting again.')
+        metrics.record_flow(platform, 'expired')
+        return redirect('dashboard')
+    
+    except (OAuthSession.DoesNotExist, oauth_state.InvalidState):
+        logger.warning(f"Invalid OAuth session state: {state}")
+        messages.error(request, 'Invalid OAuth session. Please try connecting again.')
+        metrics.record_flow(platform, 'invalid')
+        return redirect('dashboard')
+    
+    except RateLimited as e:
+        logger.warning(f"Rate limited completing OAuth callback for {platform}: {e}")
+        messages.warning(request, f'{provider.name} is busy right now. Please try connecting again in a moment.')
+        metrics.record_flow(platform, 'rate_limited')
+        return redirect('dashboard')
+    
+    except ProviderUnavailable as e:
+        logger.warning(f"Provider unavailable completing OAuth callback for {platform}: {e}")
+        messages.warning(request, f'{provider.name} is having problems right now. Please try connecting again in a few minutes.')
+        metrics.record_flow(platform, 'unavailable')
+        return redirect('dashboard')
+    
+    except Exception as e:
+        logger.error(f"Error processing OAuth callback for {platform}: {e}")
+        try:
+            owner = {'user_id': flow.user_id} if flow else {'user__oauth_sessions__state': state}
+            connection = await PlatformConnection.objects.aget(platform=platform, **owner)
+            await sync_to_async(connection.set_error)(f'OAuth callback error: {str(e)}')
+        except PlatformConnection.DoesNotExist:
+            pass
+        
+        messages.error(request, f'Failed to complete {platform} authentication. Please try again.')
+        metrics.record_flow(platform, 'error')
+        return redirect('dashboard')
+
+
+@query_budget(3)
+@async_login_required
+async def connection_status(request, platform):
+    """Get connection status for a platform (API endpoint)."""
+    if get_provider(platform) is None:
+        return JsonResponse({'error': 'Unsupported platform'}, status=400)
+    
+    def load(platforms):
+        # Expiry is computed by connection_status_data; expire_tokens persists it
+        connection = PlatformConnection.objects.without_tokens().get(user=request.user, platform=platform)
+        return {platform: connection_status_data(connection)}
+    
+    try:
+        data = await sync_to_async(status_cache.get_statuses)(request.user.pk, [platform], load)
+        return JsonResponse(data[platform])
+    
+    except PlatformConnection.DoesNotExist:
+        return JsonResponse({'error': 'Connection not found'}, status=404)
+    
+    except Exception as e:
+        logger.error(f"Error fetching connection status for {platform}: {e}")
+        return JsonResponse({'error': 'Failed to fetch connection status'}, status=500)
+
+
+@query_budget(2)
+@async_login_required
+async def connection_status_stream(request):
+    """Stream the user's connection status changes as Server-Sent Events."""
+    if not settings.OAUTH_STATUS_STREAM_ENABLED:
+        return JsonResponse({'error': 'Status stream disabled'}, status=404)
+    
+    response = StreamingHttpResponse(aiter_status_events(request.user), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
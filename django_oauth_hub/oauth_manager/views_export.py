@@ -0,0 +1,184 @@
+"""
+Streaming CSV/JSONL exports of connections and connection logs for staff.
+
+Rows are read with ``.iterator()`` (server-side cursors where the database
+supports them) and encoded one at a time into a ``StreamingHttpResponse``,
+so memory use stays flat however many rows are exported. The encrypted token
+columns are never part of an export.
+"""
+
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.http import require_GET
+
+from .models import ConnectionLog, PlatformConnection
+from .request_metrics import query_budget
+
+CONNECTION_EXPORT_FIELDS = (
+    'id',
+    'user_id',
+    'user__username',
+    'platform',
+    'status',
+    'platform_user_id',
+    'platform_username',
+    'platform_email',
+    'token_expires_at',
+    'scope_granted',
+    'last_error_message',
+    'error_count',
+    'created_at',
+    'updated_at',
+    'last_used_at',
+)
+
+LOG_EXPORT_FIELDS = (
+    'id',
+    'connection_id',
+    'connection__user__username',
+    'connection__platform',
+    'action',
+    'details',
+    'ip_address',
+    'user_agent',
+    'created_at',
+)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+CHUNK_SIZE = 2000
+
+# Leading characters that make a spreadsheet read a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    """File-like object that hands back what is written, for csv.writer."""
+    
+    def write(self, value):
+        return value
+
+
+def csv_safe(value):
+    """Quote text that a spreadsheet would otherwise evaluate as a formula."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def csv_lines(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([csv_safe(value) for value in row])
+
+
+def jsonl_lines(fields, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def stream_export(queryset, fields, export_format, name):
+    """Return a StreamingHttpResponse that exports ``fields`` of every row in ``queryset``."""
+    rows = queryset.order_by('pk').values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+    lines = csv_lines(fields, rows) if export_format == 'csv' else jsonl_lines(fields, rows)
+    
+    response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[export_format])
+    filename = f"{name}-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def parse_bound(value, end=False):
+    """Parse a date or datetime query parameter into an aware datetime."""
+    try:
+        day = parse_date(value)
+        moment = None if day else parse_datetime(value)
+    except ValueError:
+        day = moment = None
+    if day:
+        # A bare end date includes that whole day
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    elif moment is None:
+        raise ValueError(f'Invalid date: {value}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_export(queryset, params, prefix=''):
+    """
+    Apply the export filters from query parameters.
+    
+    ``prefix`` is the path from the exported model to PlatformConnection
+    ('' for connections, 'connection__' for logs). Raises ValueError on
+    invalid values.
+    """
+    choices = {
+        'platform': dict(PlatformConnection.PLATFORM_CHOICES),
+        'status': dict(PlatformConnection.STATUS_CHOICES),
+    }
+    for param, valid in choices.items():
+        value = params.get(param)
+        if value:
+            if value not in valid:
+                raise ValueError(f'Invalid {param}: {value}')
+            queryset = queryset.filter(**{f'{prefix}{param}': value})
+    
+    if params.get('since'):
+        queryset = queryset.filter(created_at__gte=parse_bound(params['since']))
+    if params.get('until'):
+        queryset = queryset.filter(created_at__lt=parse_bound(params['until'], end=True))
+    return queryset
+
+
+def export_format(request):
+    value = request.GET.get('format', 'csv')
+    if value not in EXPORT_FORMATS:
+        raise ValueError(f'Invalid format: {value}')
+    return value
+
+
+@query_budget(2)
+@staff_member_required
+@require_GET
+def export_connections(request):
+    """Export platform connections (filters: platform, status, since, until)."""
+    if not request.user.has_perm('oauth_manager.view_platformconnection'):
+        return HttpResponseForbidden()
+    
+    try:
+        queryset = filter_export(PlatformConnection.objects.all(), request.GET)
+        return stream_export(queryset, CONNECTION_EXPORT_FIELDS, export_format(request), 'connections')
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+
+@query_budget(2)
+@staff_member_required
+@require_GET
+def export_logs(request):
+    """Export connection logs (filters: platform, status, action, since, until)."""
+    if not request.user.has_perm('oauth_manager.view_connectionlog'):
+        return HttpResponseForbidden()
+    
+    try:
+        queryset = filter_export(ConnectionLog.objects.all(), request.GET, prefix='connection__')
+        action = request.GET.get('action')
+        if action:
+            if action not in dict(ConnectionLog.ACTION_CHOICES):
+                raise ValueError(f'Invalid action: {action}')
+            queryset = queryset.filter(action=action)
+        return stream_export(queryset, LOG_EXPORT_FIELDS, export_format(request), 'connection-logs')
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
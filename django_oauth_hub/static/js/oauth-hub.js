@@ -28,25 +28,79 @@ function showToast(message, type = 'info') {
 }
 
 // Connection status checker
-function checkConnectionStatus(platform) {
-    fetch(`/platform/status/${platform}/`)
-        .then(response => response.json())
-        .then(data => {
-            // Update UI based on status
-            const card = document.querySelector(`[data-platform="${platform}"]`);
-            if (card) {
-                const statusBadge = card.querySelector('.status-badge');
-                if (statusBadge) {
-                    statusBadge.className = `status-badge status-${data.status}`;
-                    statusBadge.innerHTML = getStatusText(data.status);
-                }
+// All platforms come from one document at /platform/status/. The server sends
+// a strong ETag, so unchanged polls cost a 304 with no body.
+let statusEtag = null;
+let lastStatuses = {};
+
+function updateStatusBadge(platform, status) {
+    const card = document.querySelector(`[data-platform="${platform}"]`);
+    if (card) {
+        const statusBadge = card.querySelector('.status-badge');
+        if (statusBadge) {
+            statusBadge.className = `status-badge status-${status}`;
+            statusBadge.innerHTML = getStatusText(status);
+        }
+    }
+}
+
+// Resolves to true when any platform's status changed since the last poll
+function checkAllConnectionStatuses() {
+    const headers = { 'Accept': 'application/json' };
+    if (statusEtag) {
+        headers['If-None-Match'] = statusEtag;
+    }
+    
+    return fetch('/platform/status/', { headers, cache: 'no-store' })
+        .then(response => {
+            if (response.status === 304) {
+                return false;
             }
+            statusEtag = response.headers.get('ETag');
+            return response.json().then(data => {
+                let changed = false;
+                Object.entries(data.platforms).forEach(([platform, info]) => {
+                    if (platform in lastStatuses && lastStatuses[platform] !== info.status) {
+                        changed = true;
+                    }
+                    lastStatuses[platform] = info.status;
+                    updateStatusBadge(platform, info.status);
+                });
+                return changed;
+            });
         })
         .catch(error => {
             console.error('Error checking status:', error);
+            return false;
         });
 }
 
+// Kept for callers that only care about one card; served from the bulk endpoint
+function checkConnectionStatus(platform) {
+    return checkAllConnectionStatuses();
+}
+
+// Live status updates over Server-Sent Events. Calls onChange(platform, info)
+// whenever a platform's status differs from what was last seen. Returns the
+// EventSource, or null when the browser lacks support (callers should poll).
+function subscribeToConnectionStatus(onChange) {
+    if (!window.EventSource) {
+        return null;
+    }
+    
+    const source = new EventSource('/platform/status/stream/');
+    source.addEventListener('status', event => {
+        const info = JSON.parse(event.data);
+        const previous = lastStatuses[info.platform];
+        lastStatuses[info.platform] = info.status;
+        updateStatusBadge(info.platform, info.status);
+        if (previous !== undefined && previous !== info.status && onChange) {
+            onChange(info.platform, info);
+        }
+    });
+    return source;
+}
+
 function getStatusText(status) {
     const statusMap = {
         'connected': '<i class="fas fa-check-circle me-1"></i>Connected',
@@ -61,5 +115,7 @@ function getStatusText(status) {
 // Export functions for global use
 window.OAuthHub = {
     showToast,
-    checkConnectionStatus
+    checkConnectionStatus,
+    checkAllConnectionStatuses,
+    subscribeToConnectionStatus
 };